@@ -9,6 +9,7 @@ from typing import List, Dict, Any, Optional
 from enum import Enum
 
 import college_search
+from infrastructure.http_client import get_http_client
 
 
 from ui_with_image import ImageService
@@ -700,7 +701,7 @@ class InteractiveFashionAssistant:
             # data = json.loads(weather_data)
 
             
-            response  = requests.get(url)
+            response = get_http_client().get(url, timeout=10)
             data = response.json()
             # 提取实时报告时间
             report_time = data["forecasts"][0]["reporttime"]
@@ -820,7 +821,7 @@ class InteractiveFashionAssistant:
             
             
             
-            response = requests.get(base_url, params=params, headers=headers, timeout=10)
+            response = get_http_client().get(base_url, params=params, headers=headers, timeout=10)
             response.raise_for_status()
                 
                 # 处理响应数据
@@ -950,7 +951,7 @@ class InteractiveFashionAssistant:
                 'User-Agent': 'Python-Weather-Client/1.0'
             }
             
-            response = requests.get(base_url, params=params, headers=headers, timeout=10)
+            response = get_http_client().get(base_url, params=params, headers=headers, timeout=10)
             response.raise_for_status()
             data = response.json()
             
@@ -1009,7 +1010,7 @@ class InteractiveFashionAssistant:
                 'Accept-Encoding': 'gzip'
             }
             
-            response = requests.get(base_url, params=params, headers=headers, timeout=10)
+            response = get_http_client().get(base_url, params=params, headers=headers, timeout=10)
             response.raise_for_status()
             data = response.json()
             
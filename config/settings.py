@@ -8,6 +8,17 @@ from typing import Dict, Any, Optional
 
 load_dotenv()
 
+
+def _parse_bool(value: str) -> bool:
+    """环境变量中的布尔值：1/true/yes/on（不区分大小写）为真，其余为假"""
+    return value.strip().lower() in ("1", "true", "yes", "on")
+
+
+def _env_bool(name: str, default: bool) -> bool:
+    value = os.getenv(name)
+    return default if value is None else _parse_bool(value)
+
+
 class Env(str, Enum):
     PROD = "production"
     DEV = "development"
@@ -97,6 +108,10 @@ class Settings:
     FAISS_INDEX_PATH: str = os.getenv("FAISS_INDEX_PATH", "./knowledge_base/faiss_index")
     KNOWLEDGE_BASE_PATH: str = os.getenv("KNOWLEDGE_BASE_PATH", "./knowledge_base")
     MEDIA_STORAGE_PATH: str = os.getenv("MEDIA_STORAGE_PATH", "./media_assets")
+    RAG_STORAGE_PATH: str = os.getenv("RAG_STORAGE_PATH", "./rag_storage") # Qdrant 本地存储目录
+    RAG_COLLECTION_NAME: str = os.getenv("RAG_COLLECTION_NAME", "北京大学体育信息")
+    RAG_MANIFEST_PATH: str = os.getenv("RAG_MANIFEST_PATH", "./rag_storage/kb_manifest.json") # 已入库文件的内容哈希清单
+    RAG_BM25_INDEX_PATH: str = os.getenv("RAG_BM25_INDEX_PATH", "./rag_storage/bm25_index.json") # 关键词倒排索引
     CDN_BASE_URL: str = os.getenv("CDN_BASE_URL", "https://cdn.example.com/sports")
 
     DASHSCOPE_API_KEY: str = os.getenv("DASHSCOPE_API_KEY")
@@ -121,6 +136,42 @@ class Settings:
     }
 
     EXTERNAL_API_TIMEOUT: int = int(os.getenv("EXTERNAL_API_TIMEOUT", 5))
+    # 外部API熔断、对冲请求和响应缓存
+    EXTERNAL_API_RESILIENCE: Dict[str, Any] = {
+        "failure_threshold": int(os.getenv("EXTERNAL_API_FAILURE_THRESHOLD", 3)),  # 连续失败多少次后熔断
+        "recovery_timeout": float(os.getenv("EXTERNAL_API_RECOVERY_TIMEOUT", 30)), # 熔断后多久允许探测(秒)
+        "hedge_enabled": os.getenv("EXTERNAL_API_HEDGE", "true").lower() == "true",
+        "hedge_percentile": float(os.getenv("EXTERNAL_API_HEDGE_PERCENTILE", 95)),  # 超过该分位耗时发出对冲请求
+        "hedge_min_samples": int(os.getenv("EXTERNAL_API_HEDGE_MIN_SAMPLES", 20)),  # 样本不足时不对冲
+        "latency_window": int(os.getenv("EXTERNAL_API_LATENCY_WINDOW", 200)),
+        "cache_ttl": float(os.getenv("EXTERNAL_API_CACHE_TTL", 60)),    # 新鲜期(秒)
+        "stale_ttl": float(os.getenv("EXTERNAL_API_STALE_TTL", 600)),   # 陈旧期(秒)，期间先返回旧值再后台刷新
+        "cache_max_entries": int(os.getenv("EXTERNAL_API_CACHE_MAX_ENTRIES", 1024)),
+        "workers": int(os.getenv("EXTERNAL_API_WORKERS", 8)),
+    }
+    # 列表形式端点的合并方式：first_success 取最先成功的结果，merge 合并所有成功结果
+    EXTERNAL_API_FANOUT: Dict[str, str] = {
+        "course_api_url": os.getenv("COURSE_API_FANOUT", "merge"),
+        "physical_test_api_url": os.getenv("PHYSICAL_TEST_API_FANOUT", "first_success"),
+    }
+    EXTERNAL_API_MAX_CONTENT_CHARS: int = int(os.getenv("EXTERNAL_API_MAX_CONTENT_CHARS", 4000)) # 非JSON响应保留的最大字符数
+    # 共享 HTTP 客户端：连接池、keep-alive、带抖动的重试
+    HTTP_CLIENT: Dict[str, Any] = {
+        "pool_connections": int(os.getenv("HTTP_POOL_CONNECTIONS", 20)),  # 缓存连接池的主机数
+        "pool_maxsize": int(os.getenv("HTTP_POOL_MAXSIZE", 20)),          # 每个主机的最大连接数
+        "pool_block": _env_bool("HTTP_POOL_BLOCK", True),                 # 超出上限时在调用预算内排队等待，而不是新建连接
+        "max_retries": int(os.getenv("HTTP_MAX_RETRIES", 2)),
+        "backoff_factor": float(os.getenv("HTTP_BACKOFF_FACTOR", 0.3)),
+        "backoff_jitter": float(os.getenv("HTTP_BACKOFF_JITTER", 0.2)),
+        "connect_timeout": float(os.getenv("HTTP_CONNECT_TIMEOUT", 3.05)),
+        "default_timeout": float(os.getenv("HTTP_DEFAULT_TIMEOUT", 10)),
+    }
+    # 各检索分支的截止时间(秒)，从分支开始执行时计算；超时的分支被放弃，其余结果照常返回；整体仍受 RETRIEVAL_TIMEOUT 限制
+    RETRIEVAL_SOURCE_DEADLINES: Dict[str, float] = {
+        "kb": float(os.getenv("RETRIEVAL_KB_DEADLINE", 5)),
+        "api": float(os.getenv("RETRIEVAL_API_DEADLINE", 6)),
+        "web": float(os.getenv("RETRIEVAL_WEB_DEADLINE", 20)),  # 包含搜索词生成和网络检索两步
+    }
 
     MODEL_CONFIGS: Dict[str, Dict[str, Any]] = {
         "intent": {
@@ -146,7 +197,28 @@ class Settings:
         }
     }
 
-    RETRIEVAL_WORKERS: int = int(os.getenv("RETRIEVAL_WORKERS", 5))
+    RETRIEVAL_MAX_IN_FLIGHT: int = int(os.getenv("RETRIEVAL_MAX_IN_FLIGHT", 10)) # 单个检索进程同时处理的最大请求数
+    # 检索分支线程池大小：每个请求最多 kb/api/web 三个分支并行，默认按处理中请求数 × 3 配置，避免分支排队
+    RETRIEVAL_WORKERS: int = int(os.getenv("RETRIEVAL_WORKERS", RETRIEVAL_MAX_IN_FLIGHT * 3))
+    RETRIEVAL_REQUEST_DEADLINE: int = int(os.getenv("RETRIEVAL_REQUEST_DEADLINE", 15)) # 请求自发布起的总预算(秒)：超过后未开始的请求直接丢弃，处理中的检索提前结束
+
+    # 请求处理流水线（意图识别 -> 检索 -> 生成）的工作线程池配置
+    PIPELINE_WORKERS: int = int(os.getenv("PIPELINE_WORKERS", 8)) # 并发处理的工作线程数
+    PIPELINE_QUEUE_SIZE: int = int(os.getenv("PIPELINE_QUEUE_SIZE", 64)) # 等待队列上限，满时 /query 返回 429
+    # 各阶段的最大并发数，用于限制对上游 LLM 的并发压力
+    PIPELINE_STAGE_LIMITS: Dict[str, int] = {
+        "intent": int(os.getenv("PIPELINE_INTENT_CONCURRENCY", 8)),
+        "retrieval": int(os.getenv("PIPELINE_RETRIEVAL_CONCURRENCY", 8)),
+        "generation": int(os.getenv("PIPELINE_GENERATION_CONCURRENCY", 4)),
+    }
+    STREAM_MAX_CONCURRENT: int = int(os.getenv("STREAM_MAX_CONCURRENT", 32)) # /query/stream 同时保持的最大连接数，超出时返回 429
+    # Redis 连接池上限：流水线工作线程、流式连接、检索请求及其分支线程各自可能同时占用一个连接，
+    # 另加结果订阅、XREADGROUP 阻塞读取等常驻连接的余量；连接用尽时最多等待 REDIS_POOL_TIMEOUT 秒
+    REDIS_MAX_CONNECTIONS: int = int(os.getenv(
+        "REDIS_MAX_CONNECTIONS",
+        PIPELINE_WORKERS + STREAM_MAX_CONCURRENT + RETRIEVAL_MAX_IN_FLIGHT + RETRIEVAL_WORKERS + 8
+    ))
+    REDIS_POOL_TIMEOUT: float = float(os.getenv("REDIS_POOL_TIMEOUT", 5))
 
     WEB_SEARCH_ENABLED: bool = os.getenv("WEB_SEARCH_ENABLED", "false").lower() == "true"
     INTENT_API_URL: Optional[str] = os.getenv("INTENT_API_URL")
@@ -163,14 +235,25 @@ class Settings:
         "event_query",     # 活动查询
     ]
 
-    RETRIEVAL_REQUEST_CHANNEL: str = os.getenv("RETRIEVAL_REQUEST_CHANNEL", "retrieval_requests")
     RETRIEVAL_RESULT_PREFIX: str = os.getenv("RETRIEVAL_RESULT_PREFIX", "retrieval_result:")
+    RETRIEVAL_RESULT_EXPIRE: int = int(os.getenv("RETRIEVAL_RESULT_EXPIRE", 300)) # 检索结果键的保留时间，供晚订阅的等待方读取
+    # 检索请求使用 Redis Stream + 消费组分发，可同时运行多个 RetrievalBroker 进程分担负载
+    RETRIEVAL_REQUEST_STREAM: str = os.getenv("RETRIEVAL_REQUEST_STREAM", "retrieval_requests:stream")
+    RETRIEVAL_CONSUMER_GROUP: str = os.getenv("RETRIEVAL_CONSUMER_GROUP", "retrieval_brokers")
+    RETRIEVAL_STREAM_MAXLEN: int = int(os.getenv("RETRIEVAL_STREAM_MAXLEN", 10000)) # Stream 近似最大长度
+    # 超过该时长未确认（且未续期）的请求会被其他进程接管；须明显短于 RETRIEVAL_REQUEST_DEADLINE，否则接管到的请求都已过期
+    RETRIEVAL_CLAIM_IDLE_MS: int = int(os.getenv("RETRIEVAL_CLAIM_IDLE_MS", RETRIEVAL_REQUEST_DEADLINE * 1000 // 3))
+    RETRIEVAL_BROKER_STATS_PREFIX: str = os.getenv("RETRIEVAL_BROKER_STATS_PREFIX", "retrieval_broker_stats:") # 各检索进程定期上报外部API端点统计，供 /metrics 汇总
+    RETRIEVAL_EMBEDDED_BROKER: bool = os.getenv("RETRIEVAL_EMBEDDED_BROKER", "true").lower() == "true" # 是否在主服务进程内启动检索进程
 
     HYPER_PARAMS: Dict[str, Dict[str, Any]] = {
         "cache": {
             "intent_expiry": int(os.getenv("INTENT_CACHE_EXPIRY", 3600)), # 示例值：1小时，你可以调整
             "retrieval_expiry": int(os.getenv("RETRIEVAL_CACHE_EXPIRY", 7200)), # 如果有的话
             "retrieval_expiry": int(os.getenv("RETRIEVAL_CACHE_EXPIRY", 7200)),
+            "semantic_enabled": _env_bool("RETRIEVAL_SEMANTIC_CACHE", True), # 语义相近的查询复用检索结果
+            "semantic_threshold": float(os.getenv("RETRIEVAL_SEMANTIC_THRESHOLD", 0.92)), # 查询向量余弦相似度阈值
+            "semantic_max_entries": int(os.getenv("RETRIEVAL_SEMANTIC_MAX_ENTRIES", 512)), # 每个意图保留的语义索引条目数
         },
         "security": {
             "banned_keywords": [
@@ -182,6 +265,15 @@ class Settings:
             "local_match_threshold": 0.7,
             "api_confidence_threshold": 0.5,
             "llm_confidence_threshold": 0.6,
+            "json_mode": _env_bool("HP_INTENT_JSON_MODE", True), # 意图识别要求模型直接输出JSON对象
+            "tier_deadline": float(os.getenv("HP_INTENT_TIER_DEADLINE", 15)),      # LLM与外部API并发识别的总截止时间(秒)
+            "api_grace_period": float(os.getenv("HP_INTENT_API_GRACE_PERIOD", 0.3)), # LLM已给出可用结果后，继续等待外部API的时间(秒)
+            "tier_workers": int(os.getenv("HP_INTENT_TIER_WORKERS", 8)),
+            "embedding_enabled": _env_bool("HP_INTENT_EMBEDDING_ENABLED", True), # 向量最近质心分类，命中时跳过LLM
+            "embedding_min_similarity": float(os.getenv("HP_INTENT_EMBEDDING_MIN_SIMILARITY", 0.82)), # 与最近质心的最低余弦相似度
+            "embedding_min_margin": float(os.getenv("HP_INTENT_EMBEDDING_MIN_MARGIN", 0.03)),         # 最近与次近质心的最小差距
+            "embedding_history_size": int(os.getenv("HP_INTENT_EMBEDDING_HISTORY_SIZE", 200)),        # 每个意图保留的已标注查询向量数
+            "embedding_learn_threshold": float(os.getenv("HP_INTENT_EMBEDDING_LEARN_THRESHOLD", 0.85)), # LLM/API 结果达到该置信度才作为标注样本
             "cache_expiration_minutes": 60
         },
         "retrieval": {
@@ -203,7 +295,18 @@ class Settings:
             "nprobe": int(os.getenv("HP_RAG_NPROBE", 32)),
             "chunk_size": 512,  # 分块大小
             "overlap": 50,      # 块间重叠
-            "retrieval_strategy": "hybrid"  # vector/keyword/hybrid
+            "embed_batch_size": int(os.getenv("HP_RAG_EMBED_BATCH_SIZE", 64)),    # 入库时每批编码的文本块数
+            "embed_processes": int(os.getenv("HP_RAG_EMBED_PROCESSES", 1)),       # >1 时使用多进程编码池
+            "upsert_batch_size": int(os.getenv("HP_RAG_UPSERT_BATCH_SIZE", 256)), # 每次写入向量库的记录数
+            "ingest_flush_size": int(os.getenv("HP_RAG_INGEST_FLUSH_SIZE", 4096)), # 累积多少个块后统一编码入库
+            "query_cache_size": int(os.getenv("HP_RAG_QUERY_CACHE_SIZE", 2048)),  # 查询向量进程内LRU容量
+            "query_cache_redis": _env_bool("HP_RAG_QUERY_CACHE_REDIS", False), # 是否启用Redis二级缓存
+            "query_cache_ttl": int(os.getenv("HP_RAG_QUERY_CACHE_TTL", 86400)),   # Redis二级缓存过期时间(秒)
+            "retrieval_strategy": os.getenv("HP_RAG_RETRIEVAL_STRATEGY", "hybrid"),  # auto/vector/keyword/hybrid
+            "bm25_k1": float(os.getenv("HP_RAG_BM25_K1", 1.5)),
+            "bm25_b": float(os.getenv("HP_RAG_BM25_B", 0.75)),
+            "rrf_k": int(os.getenv("HP_RAG_RRF_K", 60)),                          # 倒数排名融合常数
+            "hybrid_candidates": int(os.getenv("HP_RAG_HYBRID_CANDIDATES", 4)),   # 融合前每路召回 top_k 的倍数
         },
         "media": {
             "max_size_mb": 5,  # 图片大小限制
@@ -231,7 +334,8 @@ class Settings:
                 "习近平", "东大", "毛泽东", "六四", "宗教", "政治", "煽动", "游行示威"
             ],
             "max_query_length": int(os.getenv("HP_SECURITY_MAX_QUERY_LENGTH", 200)),
-            "keyword_blocklist_path": os.getenv("HP_SECURITY_KEYWORD_BLOCKLIST_PATH", "./config/security_blocklist.json")
+            "keyword_blocklist_path": os.getenv("HP_SECURITY_KEYWORD_BLOCKLIST_PATH", "./config/security_blocklist.json"),
+            "blocklist_reload_interval": float(os.getenv("HP_SECURITY_BLOCKLIST_RELOAD_INTERVAL", 5)) # 检查屏蔽词文件是否变化的间隔(秒)
         }
     }
 
@@ -249,7 +353,7 @@ class Settings:
                 if env_val is not None:
                     try:
                         if isinstance(value, bool):
-                            setattr(cls, key, env_val.lower() == "true")
+                            setattr(cls, key, _parse_bool(env_val))
                         elif isinstance(value, int):
                             setattr(cls, key, int(env_val))
                         elif isinstance(value, float):
@@ -266,7 +370,7 @@ class Settings:
                 if env_val is not None:
                     try:
                         if isinstance(value, bool):
-                            cls.MODEL_CONFIGS[config_name][key] = env_val.lower() == "true"
+                            cls.MODEL_CONFIGS[config_name][key] = _parse_bool(env_val)
                         elif isinstance(value, (int, float)):
                             cls.MODEL_CONFIGS[config_name][key] = type(value)(env_val)
                         else:
@@ -280,7 +384,7 @@ class Settings:
             if env_val is not None:
                 try:
                     if isinstance(value, bool):
-                        cls.EMBEDDING_CONFIG[key] = env_val.lower() == "true"
+                        cls.EMBEDDING_CONFIG[key] = _parse_bool(env_val)
                     elif isinstance(value, (int, float)):
                         cls.EMBEDDING_CONFIG[key] = type(value)(env_val)
                     else:
@@ -294,7 +398,7 @@ class Settings:
             if env_val is not None:
                 try:
                     if isinstance(value, bool):
-                        cls.EXTERNAL_APIS[key] = env_val.lower() == "true"
+                        cls.EXTERNAL_APIS[key] = _parse_bool(env_val)
                     elif isinstance(value, (int, float)):
                         cls.EXTERNAL_APIS[key] = type(value)(env_val)
                     else:
@@ -308,7 +412,11 @@ class Settings:
                 env_val = os.getenv(env_key)
                 if env_val is not None:
                     try:
-                        cls.HYPER_PARAMS[category][param_key] = type(param_value)(env_val)
+                        # bool("false") 为 True，布尔参数需要单独解析
+                        if isinstance(param_value, bool):
+                            cls.HYPER_PARAMS[category][param_key] = _parse_bool(env_val)
+                        else:
+                            cls.HYPER_PARAMS[category][param_key] = type(param_value)(env_val)
                     except ValueError:
                         logging.warning(f"Failed to convert env var {env_key} to expected type for {param_key}. Keeping original type.")
 
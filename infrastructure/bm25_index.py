@@ -0,0 +1,130 @@
+# -*- coding: utf-8 -*-
+
+import os
+import re
+import json
+import math
+import logging
+import threading
+import unicodedata
+from collections import Counter, defaultdict
+from typing import Any, Dict, Iterable, List, Tuple
+
+logger = logging.getLogger('bm25_index')
+
+# 连续的汉字串切成二元组（单字串保留单字），英文单词和数字整体作为一个词项
+CJK_RUN = re.compile(r'[\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff]+')
+WORD = re.compile(r'[a-z0-9]+(?:[._-][a-z0-9]+)*')
+
+
+def tokenize(text: str) -> List[str]:
+    """中文按字二元组切分，无需分词词典即可精确匹配场馆名等专有名词"""
+    text = unicodedata.normalize('NFKC', text or "").lower()
+    tokens = WORD.findall(text)
+    for run in CJK_RUN.findall(text):
+        if len(run) == 1:
+            tokens.append(run)
+        else:
+            tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+    return tokens
+
+
+class BM25Index:
+    """
+    进程内倒排索引，按 BM25 打分。
+    文档以向量库中的 point_id 为键，与向量数据同步增删；持久化时只保存原文和元数据，加载时重建倒排表。
+    """
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self._docs: Dict[str, Dict[str, Any]] = {}
+        self._doc_len: Dict[str, int] = {}
+        self._postings: Dict[str, Dict[str, int]] = defaultdict(dict)
+        self._total_len = 0
+        self._lock = threading.RLock()
+        self.dirty = False
+
+    def __len__(self) -> int:
+        return len(self._docs)
+
+    def add(self, point_id: str, text: str, metadata: Dict[str, Any]):
+        with self._lock:
+            self._remove_one(point_id)
+            term_freqs = Counter(tokenize(text))
+            self._docs[point_id] = {"text": text, "metadata": metadata}
+            self._doc_len[point_id] = sum(term_freqs.values())
+            self._total_len += self._doc_len[point_id]
+            for term, freq in term_freqs.items():
+                self._postings[term][point_id] = freq
+            self.dirty = True
+
+    def remove(self, point_ids: Iterable[str]):
+        with self._lock:
+            for point_id in point_ids:
+                self._remove_one(point_id)
+
+    def _remove_one(self, point_id: str):
+        doc = self._docs.pop(point_id, None)
+        if doc is None:
+            return
+        self._total_len -= self._doc_len.pop(point_id, 0)
+        for term in set(tokenize(doc["text"])):
+            postings = self._postings.get(term)
+            if postings is not None:
+                postings.pop(point_id, None)
+                if not postings:
+                    del self._postings[term]
+        self.dirty = True
+
+    def search(self, query: str, top_k: int) -> List[Tuple[str, float]]:
+        """返回按 BM25 分数降序的 (point_id, score)"""
+        with self._lock:
+            n_docs = len(self._docs)
+            if not n_docs:
+                return []
+            avg_len = self._total_len / n_docs or 1.0
+            scores: Dict[str, float] = defaultdict(float)
+            for term in set(tokenize(query)):
+                postings = self._postings.get(term)
+                if not postings:
+                    continue
+                idf = math.log(1 + (n_docs - len(postings) + 0.5) / (len(postings) + 0.5))
+                for point_id, freq in postings.items():
+                    norm = self.k1 * (1 - self.b + self.b * self._doc_len[point_id] / avg_len)
+                    scores[point_id] += idf * freq * (self.k1 + 1) / (freq + norm)
+        return sorted(scores.items(), key=lambda item: item[1], reverse=True)[:top_k]
+
+    def get(self, point_id: str) -> Dict[str, Any]:
+        with self._lock:
+            return self._docs.get(point_id, {})
+
+    # ---------- 持久化 ----------
+    def save(self, path: str):
+        with self._lock:
+            if not self.dirty and os.path.exists(path):
+                return
+            try:
+                os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+                tmp_path = f"{path}.tmp"
+                with open(tmp_path, 'w', encoding='utf-8') as f:
+                    json.dump({"k1": self.k1, "b": self.b, "docs": self._docs}, f, ensure_ascii=False)
+                os.replace(tmp_path, path)
+                self.dirty = False
+            except Exception as e:
+                logger.error(f"保存BM25索引失败: {e}")
+
+    @classmethod
+    def load(cls, path: str, k1: float = 1.5, b: float = 0.75) -> "BM25Index":
+        index = cls(k1=k1, b=b)
+        try:
+            if os.path.exists(path):
+                with open(path, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+                for point_id, doc in data.get("docs", {}).items():
+                    index.add(point_id, doc.get("text", ""), doc.get("metadata", {}))
+                index.dirty = False
+        except Exception as e:
+            logger.warning(f"读取BM25索引失败，将重新构建: {e}")
+            index = cls(k1=k1, b=b)
+        return index
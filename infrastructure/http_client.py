@@ -0,0 +1,169 @@
+import time
+import random
+import logging
+import threading
+from typing import Any, Dict, Optional, Tuple, Union
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from config.settings import config
+
+logger = logging.getLogger('http_client')
+logger.setLevel(logging.INFO)
+if not logger.handlers:
+    handler = logging.StreamHandler()
+    handler.setFormatter(logging.Formatter(
+        '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    ))
+    logger.addHandler(handler)
+
+Timeout = Union[float, Tuple[float, float]]
+
+
+class HttpClient:
+    """
+    进程内共享的 HTTP 客户端：
+    - 单个 requests.Session，按主机复用 keep-alive 连接，省去每次调用的 DNS/TCP/TLS 建连开销
+    - 每个主机的连接池上限为 pool_maxsize，pool_block=True 时超出上限的请求排队等待连接，
+      等待时间计入总预算，预算用完即超时（urllib3 自身的阻塞等待没有超时，因此连接池不阻塞，由本类限流）
+    - 调用方给出的 timeout 是整次调用的总预算（含所有重试和退避），而不是每次尝试的超时
+    - 只重试请求未发出的连接错误，以及幂等方法的 429/5xx；读取超时不重试，避免死端点耗尽数倍预算
+    - 重试退避带随机抖动，剩余预算不足以再次尝试时直接放弃
+    """
+
+    RETRY_STATUS = (429, 500, 502, 503, 504)
+    IDEMPOTENT_METHODS = frozenset({"GET", "HEAD", "OPTIONS", "PUT", "DELETE"})
+
+    def __init__(self,
+                 pool_connections: int,
+                 pool_maxsize: int,
+                 pool_block: bool,
+                 max_retries: int,
+                 backoff_factor: float,
+                 backoff_jitter: float,
+                 connect_timeout: float,
+                 default_timeout: float):
+        self.connect_timeout = connect_timeout
+        self.default_timeout = default_timeout
+        self.max_retries = max(0, max_retries)
+        self.backoff_factor = backoff_factor
+        self.backoff_jitter = backoff_jitter
+        self.pool_maxsize = max(1, pool_maxsize)
+        self.pool_block = pool_block
+        self._host_slots: Dict[str, threading.BoundedSemaphore] = {}
+        self._host_slots_lock = threading.Lock()
+
+        # 重试由 request() 按总预算控制，连接池本身不做重试
+        adapter = HTTPAdapter(
+            pool_connections=pool_connections,
+            pool_maxsize=pool_maxsize,
+            pool_block=False,
+            max_retries=0
+        )
+        self.session = requests.Session()
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def _resolve_budget(self, timeout: Optional[Timeout]) -> float:
+        if isinstance(timeout, tuple):
+            return sum(timeout)
+        return self.default_timeout if timeout is None else timeout
+
+    def _host_slot(self, url: str) -> threading.BoundedSemaphore:
+        host = urlsplit(url).netloc
+        with self._host_slots_lock:
+            slot = self._host_slots.get(host)
+            if slot is None:
+                slot = self._host_slots[host] = threading.BoundedSemaphore(self.pool_maxsize)
+            return slot
+
+    def _send(self, method: str, url: str, remaining: float, **kwargs: Any) -> requests.Response:
+        """发送一次请求；pool_block=True 时先在剩余预算内等待该主机的连接名额"""
+        timeout = (min(self.connect_timeout, remaining), remaining)
+        if not self.pool_block:
+            return self.session.request(method, url, timeout=timeout, **kwargs)
+
+        slot = self._host_slot(url)
+        wait_start = time.monotonic()
+        if not slot.acquire(timeout=remaining):
+            raise requests.exceptions.ConnectTimeout(f"等待连接池空闲连接超时: {method} {url}")
+        try:
+            remaining -= time.monotonic() - wait_start
+            if remaining <= 0:
+                raise requests.exceptions.ConnectTimeout(f"等待连接池空闲连接超时: {method} {url}")
+            return self.session.request(
+                method, url,
+                timeout=(min(self.connect_timeout, remaining), remaining),
+                **kwargs
+            )
+        finally:
+            slot.release()
+
+    def _backoff(self, attempt: int, response: Optional[requests.Response]) -> float:
+        delay = self.backoff_factor * (2 ** attempt) + random.uniform(0, self.backoff_jitter)
+        retry_after = response.headers.get("Retry-After") if response is not None else None
+        if retry_after and retry_after.isdigit():
+            delay = max(delay, float(retry_after))
+        return delay
+
+    def request(self, method: str, url: str, timeout: Optional[Timeout] = None, **kwargs: Any) -> requests.Response:
+        method = method.upper()
+        idempotent = method in self.IDEMPOTENT_METHODS
+        deadline = time.monotonic() + self._resolve_budget(timeout)
+
+        attempt = 0
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise requests.exceptions.Timeout(f"请求超出总超时预算: {method} {url}")
+
+            response = None
+            try:
+                response = self._send(method, url, remaining, **kwargs)
+                retryable = idempotent and response.status_code in self.RETRY_STATUS
+                if not retryable or attempt >= self.max_retries:
+                    return response
+            except requests.exceptions.ConnectTimeout:
+                # 建连超时：请求尚未发出，任何方法都可以重试
+                if attempt >= self.max_retries:
+                    raise
+            except requests.exceptions.ConnectionError:
+                # 其他连接错误可能发生在请求发出之后，只对幂等方法重试
+                if not idempotent or attempt >= self.max_retries:
+                    raise
+
+            delay = self._backoff(attempt, response)
+            if time.monotonic() + delay >= deadline:
+                if response is not None:
+                    return response
+                raise requests.exceptions.Timeout(f"剩余超时预算不足以重试: {method} {url}")
+            if response is not None:
+                response.close()
+            logger.info(f"{method} {url} 第 {attempt + 1} 次请求失败，{delay:.2f}s 后重试")
+            time.sleep(delay)
+            attempt += 1
+
+    def get(self, url: str, timeout: Optional[Timeout] = None, **kwargs: Any) -> requests.Response:
+        return self.request("GET", url, timeout=timeout, **kwargs)
+
+    def post(self, url: str, timeout: Optional[Timeout] = None, **kwargs: Any) -> requests.Response:
+        return self.request("POST", url, timeout=timeout, **kwargs)
+
+    def close(self):
+        self.session.close()
+
+
+_client: Optional[HttpClient] = None
+_client_lock = threading.Lock()
+
+
+def get_http_client() -> HttpClient:
+    """返回进程内共享的 HttpClient，首次调用时按 config.HTTP_CLIENT 创建"""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = HttpClient(**config.HTTP_CLIENT)
+    return _client
@@ -0,0 +1,108 @@
+import unicodedata
+from collections import deque
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+
+def normalize_text(text: str) -> str:
+    """统一全半角和大小写，关键词与待匹配文本使用同一规则"""
+    return unicodedata.normalize('NFKC', text or "").casefold()
+
+
+class KeywordAutomaton:
+    """
+    Aho–Corasick 多模式匹配自动机：构建一次，之后每次匹配只需对文本做一次线性扫描，
+    耗时与关键词数量无关。匹配不区分大小写和全半角，返回的位置基于 normalize_text 之后的文本。
+    """
+
+    def __init__(self, keywords: Iterable[Tuple[str, Any]] = ()):
+        # 每个节点：子节点表、失败指针、在该节点结束的 (关键词, 附加数据) 列表
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._output: List[List[Tuple[str, Any]]] = [[]]
+        self._size = 0
+        for keyword, payload in keywords:
+            self._add(keyword, payload)
+        self._build()
+
+    def __len__(self) -> int:
+        return self._size
+
+    def _add(self, keyword: str, payload: Any):
+        normalized = normalize_text(keyword).strip()
+        if not normalized:
+            return
+        node = 0
+        for char in normalized:
+            next_node = self._goto[node].get(char)
+            if next_node is None:
+                next_node = len(self._goto)
+                self._goto[node][char] = next_node
+                self._goto.append({})
+                self._fail.append(0)
+                self._output.append([])
+            node = next_node
+        self._output[node].append((keyword, payload))
+        self._size += 1
+
+    def _build(self):
+        """按层次遍历计算失败指针，并把失败链上的输出合并到当前节点"""
+        queue = deque(self._goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for char, child in self._goto[node].items():
+                queue.append(child)
+                fail = self._fail[node]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[child] = self._goto[fail].get(char, 0)
+                self._output[child] = self._output[child] + self._output[self._fail[child]]
+
+    def _scan(self, text: str):
+        node = 0
+        for index, char in enumerate(normalize_text(text)):
+            while node and char not in self._goto[node]:
+                node = self._fail[node]
+            node = self._goto[node].get(char, 0)
+            for keyword, payload in self._output[node]:
+                yield index + 1, keyword, payload
+
+    def find_all(self, text: str) -> List[Dict[str, Any]]:
+        """返回全部命中（含重叠），每项包含关键词、附加数据和 [start, end) 位置"""
+        return [
+            {
+                "keyword": keyword,
+                "payload": payload,
+                "start": end - len(normalize_text(keyword).strip()),
+                "end": end
+            }
+            for end, keyword, payload in self._scan(text)
+        ]
+
+    def find_first(self, text: str) -> Optional[str]:
+        """返回最先结束的命中关键词，没有命中时返回 None；命中即停止扫描"""
+        for _, keyword, _ in self._scan(text):
+            return keyword
+        return None
+
+
+def score_matches(matches: List[Dict[str, Any]]) -> Optional[Tuple[Any, float, Dict[Any, int]]]:
+    """
+    按附加数据汇总 find_all 的命中结果：每个附加数据的得分为其命中的不同关键词长度之和（越长的关键词越具体）。
+    返回 (得分最高的附加数据, 其得分在总分中的占比, 全部得分)；没有命中或最高分并列时返回 None。
+    """
+    keywords_by_payload: Dict[Any, set] = {}
+    for match in matches:
+        # 同一关键词重复出现只计一次
+        keywords_by_payload.setdefault(match["payload"], set()).add(match["keyword"])
+    if not keywords_by_payload:
+        return None
+
+    scores = {
+        payload: sum(len(keyword) for keyword in keywords)
+        for payload, keywords in keywords_by_payload.items()
+    }
+    ranked = sorted(scores.values(), reverse=True)
+    if len(ranked) > 1 and ranked[0] == ranked[1]:
+        return None
+    best = max(scores, key=scores.get)
+    return best, scores[best] / sum(ranked), scores
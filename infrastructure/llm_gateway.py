@@ -0,0 +1,132 @@
+import json
+import hashlib
+import logging
+import threading
+from datetime import datetime
+from typing import Any, Dict, Generator, List, Optional, Tuple
+
+from camel.agents import ChatAgent
+from camel.configs import QwenConfig
+from camel.messages import BaseMessage
+from camel.models import ModelFactory
+from camel.types import ModelPlatformType, RoleType
+
+from config.settings import config
+from infrastructure.request_coalescer import RequestCoalescer
+
+logger = logging.getLogger('llm_gateway')
+logger.setLevel(logging.INFO)
+if not logger.handlers:
+    handler = logging.StreamHandler()
+    handler.setFormatter(logging.Formatter(
+        '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    ))
+    logger.addHandler(handler)
+
+
+class LLMGateway:
+    """
+    进程内共享的大模型访问入口：
+    - 模型后端按 (MODEL_CONFIGS 中的配置名, 是否流式, 额外参数) 缓存，各模块共用同一个客户端及其连接池
+    - complete() 是无状态调用：每次只发送传入的消息，不保留对话记忆，可在多线程中并发使用
+    - 相同模型、相同消息的并发请求只向上游发送一次，其余调用方等待同一个结果
+    """
+
+    def __init__(self):
+        self._models: Dict[Tuple[str, bool, str], Any] = {}
+        self._models_lock = threading.Lock()
+        self._coalescer = RequestCoalescer()
+        self._stream_calls = 0
+        self._stream_lock = threading.Lock()
+
+    def get_model(self, model_key: str, stream: bool = False, **overrides: Any):
+        """返回共享的模型后端；overrides 会合并进模型参数（如 response_format）"""
+        overrides_key = json.dumps(overrides, sort_keys=True, default=str)
+        cache_key = (model_key, stream, overrides_key)
+        with self._models_lock:
+            model = self._models.get(cache_key)
+            if model is None:
+                model_config = config.MODEL_CONFIGS[model_key]
+                model = ModelFactory.create(
+                    model_type=model_config["model_name"],
+                    model_platform=ModelPlatformType.OPENAI_COMPATIBLE_MODEL,
+                    api_key=config.DASHSCOPE_API_KEY,
+                    url=config.DASHSCOPE_BASE_URL,
+                    model_config_dict={
+                        **QwenConfig(
+                            temperature=model_config.get("temperature", 0.0),
+                            max_tokens=model_config.get("max_tokens", 512),
+                            top_p=model_config.get("top_p", 1.0),
+                            stream=stream
+                        ).as_dict(),
+                        **overrides
+                    }
+                )
+                self._models[cache_key] = model
+                logger.info(f"已创建共享模型后端: {model_key} ({model_config['model_name']}, stream={stream})")
+            return model
+
+    def create_agent(self, model_key: str, system_content: str, role_name: str,
+                     meta_dict: Optional[Dict[str, Any]] = None, stream: bool = False) -> ChatAgent:
+        """基于共享模型后端创建 ChatAgent，供仍需多轮对话记忆的场景使用"""
+        system_message = BaseMessage(
+            role_name=role_name,
+            role_type=RoleType.ASSISTANT,
+            content=system_content,
+            meta_dict={**(meta_dict or {}), "timestamp": datetime.now().isoformat()}
+        )
+        return ChatAgent(system_message=system_message, model=self.get_model(model_key, stream=stream))
+
+    def complete(self, model_key: str, messages: List[Dict[str, str]], **overrides: Any) -> str:
+        """无状态调用，返回回复文本；相同请求在途时直接复用其结果"""
+        request_key = hashlib.sha256(json.dumps(
+            {"model": model_key, "messages": messages, "overrides": overrides},
+            sort_keys=True, ensure_ascii=False, default=str
+        ).encode('utf-8')).hexdigest()
+
+        def call_upstream() -> str:
+            response = self.get_model(model_key, **overrides).run(messages)
+            return response.choices[0].message.content or ""
+
+        return self._coalescer.run(request_key, call_upstream)
+
+    def stream(self, model_key: str, messages: List[Dict[str, str]], **overrides: Any) -> Generator[str, None, None]:
+        """流式调用，逐个产出文本片段（流式输出无法合并，不做去重）"""
+        with self._stream_lock:
+            self._stream_calls += 1
+        response = self.get_model(model_key, stream=True, **overrides).run(messages)
+
+        # 模型未返回流时为完整的 ChatCompletion
+        if hasattr(response, "choices"):
+            yield response.choices[0].message.content or ""
+            return
+
+        for chunk in response:
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+
+    def metrics(self) -> Dict[str, Any]:
+        coalescer = self._coalescer.metrics()
+        with self._stream_lock:
+            stream_calls = self._stream_calls
+        return {
+            "calls": coalescer["calls"] + stream_calls,
+            "upstream_calls": coalescer["executed"] + stream_calls,
+            "coalesced": coalescer["coalesced"],
+            "in_flight": coalescer["in_flight"],
+            "models": len(self._models)
+        }
+
+
+_gateway: Optional[LLMGateway] = None
+_gateway_lock = threading.Lock()
+
+
+def get_llm_gateway() -> LLMGateway:
+    """返回进程内共享的 LLMGateway"""
+    global _gateway
+    if _gateway is None:
+        with _gateway_lock:
+            if _gateway is None:
+                _gateway = LLMGateway()
+    return _gateway
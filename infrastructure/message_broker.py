@@ -2,8 +2,10 @@ import redis
 import json
 import logging
 import time
+import threading
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
 from datetime import datetime
-from typing import Optional, Union
+from typing import Dict, Optional, Union
 from pydantic import BaseModel
 from infrastructure.shared_schemas import IntentExtractionResult, RetrievalRequest, RetrievalResult # 导入 RetrievalRequest, RetrievalResult
 from config.settings import config
@@ -18,6 +20,9 @@ if not logger.handlers:
     logger.addHandler(handler)
 
 class MessageBroker:
+    # 等待检索结果期间重新读取结果键的间隔(秒)，兜底订阅连接重连期间漏掉的通知
+    RESULT_POLL_INTERVAL = 1.0
+
     def __init__(self):
         self.redis = redis.Redis(
             connection_pool=config.redis_pool,
@@ -25,15 +30,22 @@ class MessageBroker:
             decode_responses=True
         )
         self.intent_channel = "intent_updates"
-        self.retrieval_request_channel = "retrieval_requests" # 新增：检索请求频道
-        self.retrieval_result_prefix = "retrieval_result:" # 新增：检索结果前缀
+        self.retrieval_request_stream = config.RETRIEVAL_REQUEST_STREAM # 检索请求 Stream
+        self.retrieval_result_prefix = config.RETRIEVAL_RESULT_PREFIX # 新增：检索结果前缀（频道与结果键共用）
         self.result_prefix = "final_result:" # 用于最终结果缓存
+        self.status_prefix = "session_status:" # 用于异步处理进度
         self.session_db = redis.Redis(
             connection_pool=config.redis_pool,
             db=config.REDIS_DB_MAPPING["session"], # 使用新的会话数据库
             decode_responses=True
         )
 
+        # 共享的检索结果订阅：一个 pubsub 连接按模式订阅所有结果频道，再分发给各会话的 Future
+        self._result_waiters: Dict[str, Future] = {}
+        self._waiters_lock = threading.Lock()
+        self._result_listener: Optional[threading.Thread] = None
+        self._result_subscribed = threading.Event() # 收到 PSUBSCRIBE 确认后置位，连接断开时清除
+
 
     def publish_intent(self, intent: IntentExtractionResult) -> bool:
         try:
@@ -66,11 +78,16 @@ class MessageBroker:
         return None
 
     def publish_retrieval_request(self, request: RetrievalRequest) -> bool:
-        """发布检索请求到指定频道"""
+        """
+        发布检索请求到 Stream。
+        与 PUBLISH 不同，没有检索进程在线时请求也会保留，由消费组中的某一个进程处理。
+        """
         try:
-            self.redis.publish(
-                self.retrieval_request_channel,
-                request.model_dump_json() # Pydantic V2 方法
+            self.redis.xadd(
+                self.retrieval_request_stream,
+                {"payload": request.model_dump_json()}, # Pydantic V2 方法
+                maxlen=config.RETRIEVAL_STREAM_MAXLEN,
+                approximate=True
             )
             logger.info(f"发布检索请求: Session {request.session_id}")
             return True
@@ -78,29 +95,122 @@ class MessageBroker:
             logger.error(f"发布检索请求失败: {str(e)}", exc_info=True)
             return False
 
+    def publish_retrieval_result(self, result: RetrievalResult) -> bool:
+        """
+        发布检索结果：先写入结果键（供晚到的等待方直接读取），再通过频道通知等待方。
+        """
+        try:
+            key = f"{self.retrieval_result_prefix}{result.session_id}"
+            payload = result.model_dump_json()
+            pipe = self.redis.pipeline()
+            pipe.setex(key, config.RETRIEVAL_RESULT_EXPIRE, payload)
+            pipe.publish(key, payload)
+            pipe.execute()
+            return True
+        except Exception as e:
+            logger.error(f"发布检索结果失败: {str(e)}", exc_info=True)
+            return False
+
     def listen_for_retrieval_result(self, session_id: str, timeout: int = 30) -> Optional[RetrievalResult]:
         """
-        监听并获取特定session_id的检索结果。
-        通过一个专属频道实现阻塞式等待。
+        等待并获取特定session_id的检索结果。
+        先登记等待的 Future，并等到共享订阅确认生效后再读取结果键，因此无论结果在订阅前还是订阅后发布都不会丢失；
+        结果到达时由共享订阅线程立即唤醒。订阅连接重连期间发布的通知会丢失，
+        因此等待期间每隔 RESULT_POLL_INTERVAL 秒重新读取一次结果键。
         """
-        channel_name = f"{self.retrieval_result_prefix}{session_id}"
-        pubsub = self.redis.pubsub()
-        pubsub.subscribe(channel_name)
-        
-        logger.info(f"监听检索结果频道: {channel_name} (超时: {timeout}秒)")
-        start_time = time.time()
-        while time.time() - start_time < timeout:
-            message = pubsub.get_message(timeout=1) # 短暂阻塞，避免CPU空转
-            if message and message['type'] == 'message':
-                try:
-                    data = json.loads(message['data'])
-                    return RetrievalResult.model_validate(data)
-                except Exception as e:
-                    logger.error(f"解析检索结果消息失败: {message['data']}, 错误: {e}")
+        deadline = time.monotonic() + timeout
+        key = f"{self.retrieval_result_prefix}{session_id}"
+        self._ensure_result_listener()
+        future: Future = Future()
+        with self._waiters_lock:
+            self._result_waiters[session_id] = future
+
+        try:
+            if not self._result_subscribed.wait(timeout=min(timeout, self.RESULT_POLL_INTERVAL)):
+                logger.warning(f"Session {session_id}: 共享订阅尚未就绪，改为轮询结果键")
+
+            logger.info(f"等待检索结果: Session {session_id} (超时: {timeout}秒)")
+            while True:
+                if cached := self.redis.get(key):
+                    return self._parse_retrieval_result(cached)
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    logger.warning(f"Session {session_id}: 等待检索结果超时。")
                     return None
-            time.sleep(0.1) # 小等待，防止忙循环
-        logger.warning(f"Session {session_id}: 等待检索结果超时。")
-        return None
+                try:
+                    return self._parse_retrieval_result(
+                        future.result(timeout=min(remaining, self.RESULT_POLL_INTERVAL))
+                    )
+                except FutureTimeoutError:
+                    continue
+        except Exception as e:
+            logger.error(f"Session {session_id}: 获取检索结果失败: {e}", exc_info=True)
+            return None
+        finally:
+            with self._waiters_lock:
+                self._result_waiters.pop(session_id, None)
+
+    def _parse_retrieval_result(self, data: Union[str, bytes]) -> Optional[RetrievalResult]:
+        try:
+            return RetrievalResult.model_validate(json.loads(data))
+        except Exception as e:
+            logger.error(f"解析检索结果消息失败: {data}, 错误: {e}")
+            return None
+
+    def _ensure_result_listener(self):
+        """懒启动共享的结果订阅线程（每个 MessageBroker 实例一个）"""
+        with self._waiters_lock:
+            if self._result_listener and self._result_listener.is_alive():
+                return
+            self._result_listener = threading.Thread(
+                target=self._listen_results_forever,
+                name="retrieval-result-listener",
+                daemon=True
+            )
+            self._result_listener.start()
+
+    def _listen_results_forever(self):
+        pattern = f"{self.retrieval_result_prefix}*"
+        while True:
+            pubsub = self.redis.pubsub()
+            try:
+                pubsub.psubscribe(pattern)
+                for message in pubsub.listen():
+                    if message.get("type") == "psubscribe":
+                        self._result_subscribed.set()
+                        logger.info(f"共享订阅已启动: {pattern}")
+                        continue
+                    if message.get("type") != "pmessage":
+                        continue
+                    channel = message["channel"]
+                    if isinstance(channel, bytes):
+                        channel = channel.decode()
+                    session_id = channel[len(self.retrieval_result_prefix):]
+                    with self._waiters_lock:
+                        future = self._result_waiters.get(session_id)
+                    if future and not future.done():
+                        future.set_result(message["data"])
+            except Exception as e:
+                logger.error(f"共享订阅连接异常，1秒后重连: {e}")
+                time.sleep(1)
+            finally:
+                self._result_subscribed.clear()
+                try:
+                    pubsub.close()
+                except Exception:
+                    pass
+
+    def get_retrieval_broker_stats(self) -> Dict[str, dict]:
+        """读取各检索进程上报的外部API端点统计，按实例名分组"""
+        stats = {}
+        try:
+            for key in self.redis.scan_iter(match=f"{config.RETRIEVAL_BROKER_STATS_PREFIX}*"):
+                if data := self.redis.get(key):
+                    key = key.decode() if isinstance(key, bytes) else key
+                    stats[key[len(config.RETRIEVAL_BROKER_STATS_PREFIX):]] = json.loads(data)
+        except Exception as e:
+            logger.error(f"读取检索进程统计失败: {str(e)}", exc_info=True)
+        return stats
 
     def cache_result(self, session_id: str, result: Union[dict, BaseModel]) -> bool:
         """统一缓存方法（兼容Pydantic V2）"""
@@ -126,4 +236,38 @@ class MessageBroker:
                 return json.loads(data)
         except Exception as e:
             logger.error(f"获取缓存结果失败: {str(e)}", exc_info=True)
-        return None
\ No newline at end of file
+        return None
+
+    def update_session_status(self, session_id: str, status: str, **fields) -> bool:
+        """
+        更新会话的异步处理进度（queued/processing/partial/done/error）。
+        以 Hash 保存，多次调用只合并变更的字段。
+        """
+        try:
+            key = f"{self.status_prefix}{session_id}"
+            mapping = {
+                "session_id": session_id,
+                "status": status,
+                "updated_at": datetime.now().isoformat(),
+                **fields
+            }
+            pipe = self.session_db.pipeline()
+            pipe.hset(key, mapping={k: json.dumps(v, ensure_ascii=False, default=str) for k, v in mapping.items()})
+            pipe.expire(key, config.RESULT_EXPIRE)
+            pipe.execute()
+            return True
+        except Exception as e:
+            logger.error(f"更新会话状态失败: {str(e)}", exc_info=True)
+            return False
+
+    def get_session_status(self, session_id: str) -> Optional[dict]:
+        """获取会话的异步处理进度"""
+        try:
+            if data := self.session_db.hgetall(f"{self.status_prefix}{session_id}"):
+                return {
+                    (k.decode() if isinstance(k, bytes) else k): json.loads(v)
+                    for k, v in data.items()
+                }
+        except Exception as e:
+            logger.error(f"获取会话状态失败: {str(e)}", exc_info=True)
+        return None
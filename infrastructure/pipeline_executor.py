@@ -0,0 +1,157 @@
+import logging
+import threading
+from concurrent.futures import Future
+from contextlib import contextmanager
+from queue import Queue, Full, Empty
+from typing import Any, Callable, Dict, Optional
+
+logger = logging.getLogger('pipeline_executor')
+logger.setLevel(logging.INFO)
+if not logger.handlers:
+    handler = logging.StreamHandler()
+    handler.setFormatter(logging.Formatter(
+        '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    ))
+    logger.addHandler(handler)
+
+
+class PipelineQueueFull(Exception):
+    """等待队列已满，调用方应当拒绝请求（例如返回 HTTP 429）"""
+
+
+class PipelineExecutor:
+    """
+    多工作线程的请求处理流水线。
+    - 有界等待队列：队列满时 submit 直接抛出 PipelineQueueFull，而不是无限堆积
+    - 分阶段并发限制：通过 stage() 上下文管理器限制 intent/retrieval/generation 的并发数
+    - 运行指标：队列深度、处理中任务数、各阶段处理中数量
+    整条链路以 LLM/Redis 等 I/O 等待为主，因此使用线程而非进程承载。
+    """
+
+    def __init__(self,
+                 handler: Callable[..., Any],
+                 workers: int,
+                 queue_size: int,
+                 stage_limits: Optional[Dict[str, int]] = None,
+                 name: str = "pipeline"):
+        self.handler = handler
+        self.name = name
+        self.workers = max(1, workers)
+        self._queue: Queue = Queue(maxsize=max(1, queue_size))
+        self._threads = []
+        self._lock = threading.Lock()
+        self._running = False
+
+        self._stage_semaphores = {
+            stage: threading.BoundedSemaphore(max(1, limit))
+            for stage, limit in (stage_limits or {}).items()
+        }
+        self._stage_limits = {stage: max(1, limit) for stage, limit in (stage_limits or {}).items()}
+        self._stage_in_flight = {stage: 0 for stage in self._stage_semaphores}
+
+        self._in_flight = 0
+        self._submitted = 0
+        self._completed = 0
+        self._failed = 0
+        self._rejected = 0
+
+    def start(self):
+        with self._lock:
+            if self._running:
+                return
+            self._running = True
+            for i in range(self.workers):
+                thread = threading.Thread(
+                    target=self._worker_loop,
+                    name=f"{self.name}-worker-{i}",
+                    daemon=True
+                )
+                thread.start()
+                self._threads.append(thread)
+        logger.info(f"{self.name}: 已启动 {self.workers} 个工作线程，队列上限 {self._queue.maxsize}")
+
+    def submit(self, *args, **kwargs) -> Future:
+        """提交任务，返回 Future；队列已满时抛出 PipelineQueueFull"""
+        future: Future = Future()
+        try:
+            self._queue.put_nowait((future, args, kwargs))
+        except Full:
+            with self._lock:
+                self._rejected += 1
+            raise PipelineQueueFull(f"{self.name} 队列已满 ({self._queue.maxsize})")
+        with self._lock:
+            self._submitted += 1
+        return future
+
+    @contextmanager
+    def stage(self, stage_name: str):
+        """限制某个处理阶段的并发数，未配置的阶段不做限制"""
+        semaphore = self._stage_semaphores.get(stage_name)
+        if semaphore is None:
+            yield
+            return
+
+        semaphore.acquire()
+        with self._lock:
+            self._stage_in_flight[stage_name] += 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._stage_in_flight[stage_name] -= 1
+            semaphore.release()
+
+    def metrics(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "queue_depth": self._queue.qsize(),
+                "queue_capacity": self._queue.maxsize,
+                "in_flight": self._in_flight,
+                "submitted": self._submitted,
+                "completed": self._completed,
+                "failed": self._failed,
+                "rejected": self._rejected,
+                "stages": {
+                    stage: {
+                        "in_flight": self._stage_in_flight[stage],
+                        "limit": self._stage_limits[stage]
+                    }
+                    for stage in self._stage_semaphores
+                }
+            }
+
+    def shutdown(self, wait: bool = True, timeout: Optional[float] = None):
+        with self._lock:
+            self._running = False
+        if wait:
+            for thread in self._threads:
+                thread.join(timeout=timeout)
+
+    def _worker_loop(self):
+        while self._running:
+            try:
+                future, args, kwargs = self._queue.get(timeout=1)
+            except Empty:
+                continue
+
+            if not future.set_running_or_notify_cancel():
+                self._queue.task_done()
+                continue
+
+            with self._lock:
+                self._in_flight += 1
+            try:
+                result = self.handler(*args, **kwargs)
+                future.set_result(result)
+                with self._lock:
+                    self._completed += 1
+            except BaseException as e:
+                logger.error(f"{self.name}: 任务执行失败: {e}", exc_info=True)
+                future.set_exception(e)
+                with self._lock:
+                    self._failed += 1
+            finally:
+                with self._lock:
+                    self._in_flight -= 1
+                self._queue.task_done()
@@ -0,0 +1,21 @@
+# -*- coding: utf-8 -*-
+
+from typing import Any, Dict, List
+
+
+def reciprocal_rank_fusion(ranked_lists: List[List[Dict[str, Any]]], top_k: int, rrf_k: int = 60) -> List[Dict[str, Any]]:
+    """
+    倒数排名融合：score = Σ 1 / (rrf_k + rank)，只依赖各路结果的名次，不需要统一不同检索方式的分数尺度。
+    各结果须带 "id"，同一文档块出现在多路结果中时合并元数据；融合分数写入 metadata["rrf_score"]。
+    """
+    fused: Dict[str, Dict[str, Any]] = {}
+    for results in ranked_lists:
+        for rank, doc in enumerate(results, start=1):
+            entry = fused.setdefault(doc["id"], {"id": doc["id"], "content": doc["content"], "metadata": {}, "rrf_score": 0.0})
+            entry["metadata"].update(doc["metadata"])
+            entry["rrf_score"] += 1.0 / (rrf_k + rank)
+
+    ranked = sorted(fused.values(), key=lambda d: d["rrf_score"], reverse=True)[:top_k]
+    for doc in ranked:
+        doc["metadata"]["rrf_score"] = doc.pop("rrf_score")
+    return ranked
@@ -0,0 +1,46 @@
+import threading
+from concurrent.futures import Future
+from typing import Any, Callable, Dict
+
+
+class RequestCoalescer:
+    """
+    合并相同键的并发调用：
+    - 同一个键同时只执行一次 func，其余调用方等待并拿到同一个结果
+    - func 抛出的异常会原样抛给所有等待者
+    - 调用结束后立即释放该键，之后的调用会重新执行（不做结果缓存）
+    """
+
+    def __init__(self):
+        self._inflight: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+        self._stats = {"calls": 0, "executed": 0, "coalesced": 0}
+
+    def run(self, key: str, func: Callable[[], Any]) -> Any:
+        with self._lock:
+            self._stats["calls"] += 1
+            future = self._inflight.get(key)
+            if future is not None:
+                self._stats["coalesced"] += 1
+                owner = False
+            else:
+                future = Future()
+                self._inflight[key] = future
+                self._stats["executed"] += 1
+                owner = True
+
+        if not owner:
+            return future.result()
+
+        try:
+            future.set_result(func())
+        except BaseException as e:
+            future.set_exception(e)
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+        return future.result()
+
+    def metrics(self) -> Dict[str, int]:
+        with self._lock:
+            return {**self._stats, "in_flight": len(self._inflight)}
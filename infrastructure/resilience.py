@@ -0,0 +1,113 @@
+import time
+import logging
+import threading
+from collections import deque
+from typing import Any, Deque, Dict, Optional
+
+logger = logging.getLogger('resilience')
+logger.setLevel(logging.INFO)
+if not logger.handlers:
+    handler = logging.StreamHandler()
+    handler.setFormatter(logging.Formatter(
+        '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    ))
+    logger.addHandler(handler)
+
+
+class CircuitOpenError(Exception):
+    """熔断器处于打开状态，请求未发出"""
+
+
+class CircuitBreaker:
+    """
+    单个上游端点的熔断器：
+    - closed：正常放行，连续失败 failure_threshold 次后转为 open
+    - open：直接拒绝请求，经过 recovery_timeout 秒后转为 half_open
+    - half_open：只放行一个探测请求，成功则恢复 closed，失败则重新 open
+    """
+
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+    def __init__(self, name: str, failure_threshold: int, recovery_timeout: float):
+        self.name = name
+        self.failure_threshold = max(1, failure_threshold)
+        self.recovery_timeout = recovery_timeout
+        self._state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._state == self.OPEN and time.monotonic() - self._opened_at >= self.recovery_timeout:
+                return self.HALF_OPEN
+            return self._state
+
+    def allow_request(self) -> bool:
+        with self._lock:
+            if self._state == self.CLOSED:
+                return True
+            if self._state == self.OPEN:
+                if time.monotonic() - self._opened_at < self.recovery_timeout:
+                    return False
+                self._state = self.HALF_OPEN
+                self._probe_in_flight = False
+            # half_open：同一时间只放行一个探测请求
+            if self._probe_in_flight:
+                return False
+            self._probe_in_flight = True
+            return True
+
+    def record_success(self):
+        with self._lock:
+            if self._state != self.CLOSED:
+                logger.info(f"熔断器 {self.name} 探测成功，恢复正常")
+            self._state = self.CLOSED
+            self._failures = 0
+            self._probe_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+                if self._state != self.OPEN:
+                    logger.warning(f"熔断器 {self.name} 打开，连续失败 {self._failures} 次")
+                self._state = self.OPEN
+                self._opened_at = time.monotonic()
+                self._probe_in_flight = False
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {"state": self.state, "failures": self._failures}
+
+
+class LatencyTracker:
+    """滑动窗口内的请求耗时统计，用于计算对冲请求的触发延迟"""
+
+    def __init__(self, window: int = 200):
+        self._samples: Deque[float] = deque(maxlen=max(1, window))
+        self._lock = threading.Lock()
+
+    def record(self, seconds: float):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._samples)
+
+    def percentile(self, pct: float) -> Optional[float]:
+        with self._lock:
+            if not self._samples:
+                return None
+            ordered = sorted(self._samples)
+        index = min(len(ordered) - 1, max(0, int(round(pct / 100 * len(ordered))) - 1))
+        return ordered[index]
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "samples": len(self),
+            "p50": self.percentile(50),
+            "p95": self.percentile(95)
+        }
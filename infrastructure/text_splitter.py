@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+
+import re
+from typing import Iterator, List, Tuple
+
+# 切分规则变化时递增，入库清单据此判断已入库的块需要重新切分
+SPLITTER_VERSION = 2
+
+# 中英文句末标点及换行作为句子边界，标点保留在句子末尾
+SENTENCE_BOUNDARY = re.compile(r'[^。！？!?；;\n]*(?:[。！？!?；;]+[”’」』）)]*|\n+|$)')
+
+
+def split_sentences(text: str) -> List[str]:
+    """按句子边界切分文本，去掉空白句子"""
+    return [s for s in SENTENCE_BOUNDARY.findall(text) if s.strip()]
+
+
+def _strip_span(text: str, start: int, end: int) -> Tuple[int, int, str]:
+    """去掉块首尾空白，并同步调整偏移，使 text[start:end] 与返回的块文本一致"""
+    piece = text[start:end]
+    stripped = piece.strip()
+    if not stripped:
+        return start, start, ""
+    leading = len(piece) - len(piece.lstrip())
+    return start + leading, start + leading + len(stripped), stripped
+
+
+def split_text(text: str, chunk_size: int = 512, overlap: int = 50) -> Iterator[Tuple[int, int, str]]:
+    """
+    按字符数切分文本，尽量在句子边界处断开。
+    逐块产出 (起始偏移, 结束偏移, 文本)，偏移对应去掉首尾空白后的块文本；相邻块之间保留约 overlap 个字符的重叠。
+    单个句子超过 chunk_size 时按字符硬切分，硬切分的片段之间同样保留重叠。
+    """
+    if not text or not text.strip():
+        return
+    chunk_size = max(1, chunk_size)
+    overlap = max(0, min(overlap, chunk_size // 2))
+
+    # 记录每个句子在原文中的偏移，保证块偏移可回溯到原文
+    spans: List[Tuple[int, int]] = []
+    cursor = 0
+    for sentence in split_sentences(text):
+        start = text.find(sentence, cursor)
+        end = start + len(sentence)
+        cursor = end
+        # 过长的句子先拆成不超过 chunk_size - overlap 的片段，为下一块留出重叠的空间
+        step = max(1, chunk_size - overlap)
+        for piece_start in range(start, end, step):
+            spans.append((piece_start, min(piece_start + step, end)))
+
+    chunk_start, chunk_end = None, None
+    for start, end in spans:
+        if chunk_start is None:
+            chunk_start, chunk_end = start, end
+            continue
+        if end - chunk_start <= chunk_size:
+            chunk_end = end
+            continue
+
+        chunk = _strip_span(text, chunk_start, chunk_end)
+        if chunk[2]:
+            yield chunk
+        # 下一块从上一块末尾回退 overlap 个字符开始；放不下完整的重叠时尽量多保留，但不晚于当前片段的起点
+        chunk_start = min(start, max(chunk_end - overlap, end - chunk_size))
+        chunk_end = end
+
+    if chunk_start is not None:
+        chunk = _strip_span(text, chunk_start, chunk_end)
+        if chunk[2]:
+            yield chunk
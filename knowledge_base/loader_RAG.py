@@ -1,9 +1,15 @@
 # -*- coding: utf-8 -*-
 
 import os
+import re
 import json
+import uuid
 import yaml
+import redis
+import hashlib
 import logging
+import threading
+import unicodedata
 import numpy as np
 
 import base64
@@ -16,13 +22,17 @@ from camel.models import ModelFactory
 from camel.types import ModelPlatformType, RoleType, EmbeddingModelType, StorageType 
 from camel.loaders import UnstructuredIO, create_file_from_raw_bytes
 from camel.retrievers import AutoRetriever, VectorRetriever
-from camel.storages.vectordb_storages import QdrantStorage
+from camel.storages.vectordb_storages import QdrantStorage, VectorRecord, VectorDBQuery
 from camel.embeddings import SentenceTransformerEncoder
 from dashscope import TextEmbedding
 from http import HTTPStatus # 用于检查dashscope返回的状态
+from collections import OrderedDict
 from typing import Dict, List, Any, Optional
 from PyPDF2 import PdfReader
 from pdfminer.high_level import extract_text
+from infrastructure.text_splitter import SPLITTER_VERSION, split_text
+from infrastructure.bm25_index import BM25Index
+from infrastructure.rank_fusion import reciprocal_rank_fusion
 
 logger = logging.getLogger('knowledge_loader')
 
@@ -49,6 +59,9 @@ model.save("./local_models/e5-large-v2")  # 保存到本地
 '''
 
 class KnowledgeLoader:
+    # 只入库这些扩展名的知识文件；知识库目录下的代码、缓存等其他文件一律跳过
+    DOCUMENT_EXTENSIONS = ('.pdf', '.txt', '.md', '.png', '.jpg', '.jpeg', '.webp')
+
     def __init__(self):
         self.documents = {} 
         self.logger = logging.getLogger('knowledge_loader')
@@ -64,21 +77,42 @@ class KnowledgeLoader:
             model_name=config.MODEL_CONFIGS["embedding"]
         )
         '''
-        self.embedding_model = SentenceTransformerEncoder(model_name='./Models/m3e-base')
+        self.embedding_model_name = './Models/m3e-base'
+        self.embedding_model = SentenceTransformerEncoder(model_name=self.embedding_model_name)
+
+        # 查询向量缓存：进程内LRU，可选Redis二级缓存（多进程共享）
+        rag_params = config.HYPER_PARAMS["rag"]
+        self._query_cache: "OrderedDict[str, List[float]]" = OrderedDict()
+        self._query_cache_lock = threading.Lock()
+        self._query_cache_size = rag_params["query_cache_size"]
+        self._query_cache_stats = {"hits": 0, "redis_hits": 0, "misses": 0}
+        self._query_cache_redis = redis.Redis(
+            connection_pool=config.redis_pool,
+            db=config.REDIS_DB_MAPPING["cache"]
+        ) if rag_params["query_cache_redis"] else None
 
         # 3. Storages 初始化
         self.vector_storage = QdrantStorage(
             vector_dim=self.embedding_model.get_output_dim(),
-            path="./rag_storage",
-            collection_name="北京大学体育信息"
+            path=config.RAG_STORAGE_PATH,
+            collection_name=config.RAG_COLLECTION_NAME
         )
 
-        # 4. Retrievers 初始化
-        self.retriever = AutoRetriever(
-            embedding_model=self.embedding_model,
-            vector_storage_local_path="./rag_storage",
-            storage_type=StorageType.QDRANT
+        # 已入库文件清单：只有新增或内容变化的文件才会重新解析和向量化
+        # 清单键为相对知识库根目录的路径，与启动时的工作目录无关
+        self.knowledge_root = os.path.abspath(config.KNOWLEDGE_BASE_PATH)
+        self.manifest_path = config.RAG_MANIFEST_PATH
+        self.manifest = self._load_manifest()
+
+        # 关键词倒排索引与向量库同步增删；索引文件缺失时从向量库中已入库的块重建
+        self.bm25_index_path = config.RAG_BM25_INDEX_PATH
+        self.bm25_index = BM25Index.load(
+            self.bm25_index_path,
+            k1=rag_params["bm25_k1"],
+            b=rag_params["bm25_b"]
         )
+        if self.manifest and not os.path.exists(self.bm25_index_path):
+            self._rebuild_bm25_index()
 
         self._load_all_knowledge_files()
 
@@ -119,15 +153,191 @@ class KnowledgeLoader:
     '''
 
     def _load_all_knowledge_files(self, base_path=None):
-        """加载指定目录下的所有知识文件"""
+        """
+        增量加载指定目录下的知识文件：
+        未变化的文件直接跳过；变化的文件先写入新版本，入库成功后再删除旧版本中不再使用的块，
+        入库失败时旧版本仍可检索；已删除的文件从向量库中移除。
+        """
         if base_path is None:
             base_path = config.KNOWLEDGE_BASE_PATH
     
         self.logger.info(f"开始加载知识库目录: {base_path}")
+        seen = set()
+        loaded, skipped = 0, 0
+        # 跨文件累积待入库的块，凑够一批再统一编码，清单条目在对应块入库成功后才写入
+        pending_chunks: List[Dict[str, Any]] = []
+        pending_entries: Dict[str, Dict[str, Any]] = {}
+        pending_stale: Dict[str, List[str]] = {}
+        flush_size = config.HYPER_PARAMS["rag"]["ingest_flush_size"]
         for root, _, files in os.walk(base_path):
             for file in files:
+                # 不在白名单中的文件不计入 seen，之前误入库的同名条目会按“已删除”清理
+                if file.startswith('.') or not file.lower().endswith(self.DOCUMENT_EXTENSIONS):
+                    continue
                 file_path = os.path.join(root, file)
-                self._load_single_file(file_path)
+                key = self._manifest_key(file_path)
+                seen.add(key)
+
+                file_hash = self._get_changed_hash(key, file_path)
+                if file_hash is None:
+                    skipped += 1
+                    continue
+
+                docs = self._load_single_file(file_path)
+                if docs is not None:
+                    # 图片文件返回单个字典，不写入向量库
+                    chunks = docs if isinstance(docs, list) else []
+                    point_ids = [doc["point_id"] for doc in chunks]
+                    stat = os.stat(file_path)
+                    pending_entries[key] = {
+                        "sha256": file_hash,
+                        "size": stat.st_size,
+                        "mtime": stat.st_mtime,
+                        "chunking": self._chunking_signature(),
+                        "point_ids": point_ids
+                    }
+                    # 块ID由文件和块序号确定，新版本会覆盖同ID的旧块，只需删除多出来的旧块
+                    stale_ids = set(self.manifest.get(key, {}).get("point_ids", [])) - set(point_ids)
+                    if stale_ids:
+                        pending_stale[key] = sorted(stale_ids)
+                    pending_chunks.extend(chunks)
+                    if len(pending_chunks) >= flush_size:
+                        loaded += self._flush_pending(pending_chunks, pending_entries, pending_stale)
+
+        loaded += self._flush_pending(pending_chunks, pending_entries, pending_stale)
+
+        # 清单中存在但磁盘上已删除的文件
+        base_key = self._manifest_key(base_path)
+        for key in list(self.manifest):
+            if key not in seen and self._key_under(key, base_key):
+                self.logger.info(f"知识文件已删除，移除对应向量: {key}")
+                self._remove_from_vector_db(key)
+                self.manifest.pop(key, None)
+
+        self._save_manifest()
+        self.bm25_index.save(self.bm25_index_path)
+        self.logger.info(f"知识库目录加载完成: {base_path}，新增/更新 {loaded} 个文件，跳过未变化文件 {skipped} 个")
+
+    def _rebuild_bm25_index(self):
+        """
+        从向量库逐批读取已入库块的原文和元数据重建关键词索引，无需重新解析和向量化。
+        读取失败时清空向量集合和清单，由后续加载全量重新入库，避免清单重置后留下孤立的向量。
+        """
+        self.logger.info("未找到关键词索引，从向量库重建")
+        try:
+            client = self.vector_storage.client
+            offset = None
+            while True:
+                points, offset = client.scroll(
+                    collection_name=self.vector_storage.collection_name,
+                    limit=config.HYPER_PARAMS["rag"]["upsert_batch_size"],
+                    offset=offset,
+                    with_payload=True,
+                    with_vectors=False
+                )
+                for point in points:
+                    payload = point.payload or {}
+                    self.bm25_index.add(str(point.id), payload.get("text", ""), payload.get("metadata", {}))
+                if offset is None:
+                    break
+            self.bm25_index.save(self.bm25_index_path)
+            self.logger.info(f"关键词索引重建完成，共 {len(self.bm25_index)} 个文档块")
+        except Exception as e:
+            self.logger.error(f"从向量库重建关键词索引失败，清空向量库后全量重新入库: {e}")
+            self.bm25_index = BM25Index(k1=self.bm25_index.k1, b=self.bm25_index.b)
+            self.vector_storage.clear()
+            self.manifest = {}
+
+    def _flush_pending(self,
+                       pending_chunks: List[Dict[str, Any]],
+                       pending_entries: Dict[str, Dict[str, Any]],
+                       pending_stale: Dict[str, List[str]]) -> int:
+        """批量入库累积的块，成功后写入清单条目并删除旧版本遗留的块；返回本批完成入库的文件数"""
+        if not pending_entries:
+            return 0
+        try:
+            self._store_to_vector_db(pending_chunks)
+            self.manifest.update(pending_entries)
+            for key, point_ids in pending_stale.items():
+                self._delete_points(key, point_ids)
+            return len(pending_entries)
+        except Exception as e:
+            # 清单不更新，下次启动时这些文件会被重新入库
+            self.logger.error(f"批量入库失败，涉及 {len(pending_entries)} 个文件: {e}")
+            return 0
+        finally:
+            pending_chunks.clear()
+            pending_entries.clear()
+            pending_stale.clear()
+
+    # ---------- 入库清单 ----------
+    def _load_manifest(self) -> Dict[str, Dict[str, Any]]:
+        try:
+            if os.path.exists(self.manifest_path):
+                with open(self.manifest_path, 'r', encoding='utf-8') as f:
+                    return json.load(f)
+        except Exception as e:
+            self.logger.warning(f"读取入库清单失败，将全量重建: {e}")
+        return {}
+
+    def _save_manifest(self):
+        try:
+            os.makedirs(os.path.dirname(self.manifest_path) or ".", exist_ok=True)
+            tmp_path = f"{self.manifest_path}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(self.manifest, f, ensure_ascii=False, indent=2)
+            os.replace(tmp_path, self.manifest_path)
+        except Exception as e:
+            self.logger.error(f"保存入库清单失败: {e}")
+
+    def _manifest_key(self, file_path: str) -> str:
+        return os.path.relpath(os.path.abspath(file_path), self.knowledge_root).replace(os.sep, "/")
+
+    @staticmethod
+    def _key_under(key: str, base_key: str) -> bool:
+        """清单键是否位于 base_key 目录下（知识库根目录的键为 "."）"""
+        if base_key == ".":
+            return not key.startswith("../")
+        return (key + "/").startswith(base_key.rstrip("/") + "/")
+
+    def _get_changed_hash(self, key: str, file_path: str) -> Optional[str]:
+        """文件未变化时返回 None，否则返回新的内容哈希。大小和修改时间一致时不读取文件内容。"""
+        entry = self.manifest.get(key)
+        # 分块参数变化时需要重新切分，视为文件已变化
+        if entry and entry.get("chunking") != self._chunking_signature():
+            entry = None
+        stat = os.stat(file_path)
+        if entry and entry.get("size") == stat.st_size and entry.get("mtime") == stat.st_mtime:
+            return None
+
+        sha256 = hashlib.sha256()
+        with open(file_path, 'rb') as f:
+            for block in iter(lambda: f.read(1024 * 1024), b""):
+                sha256.update(block)
+        file_hash = sha256.hexdigest()
+
+        if entry and entry.get("sha256") == file_hash:
+            # 仅修改时间变化（如重新拷贝），更新清单即可
+            entry["size"], entry["mtime"] = stat.st_size, stat.st_mtime
+            return None
+        return file_hash
+
+    def _chunking_signature(self) -> str:
+        rag_params = config.HYPER_PARAMS["rag"]
+        return f"{rag_params['chunk_size']}/{rag_params['overlap']}/v{SPLITTER_VERSION}"
+
+    def _remove_from_vector_db(self, key: str):
+        self._delete_points(key, self.manifest.get(key, {}).get("point_ids", []))
+
+    def _delete_points(self, key: str, point_ids: List[str]):
+        if not point_ids:
+            return
+        self.bm25_index.remove(point_ids)
+        try:
+            self.vector_storage.delete(point_ids)
+            self.logger.info(f"已从向量数据库移除 {len(point_ids)} 个文档块: {key}")
+        except Exception as e:
+            self.logger.error(f"从向量数据库移除文档块失败 {key}: {e}")
     
     def _init_logger(self):
         """初始化日志记录器"""
@@ -183,8 +393,8 @@ class KnowledgeLoader:
                 try:
                     with open(file_path, 'rb') as f:
                         reader = PdfReader(f)
-                        chunks = [{
-                            "text": page.extract_text(),
+                        pages = [{
+                            "text": page.extract_text() or "",
                             "metadata": {"source": file_path, "page": i}
                         } for i, page in enumerate(reader.pages)]
                 except Exception as e:
@@ -192,38 +402,45 @@ class KnowledgeLoader:
                                 
                     # 方案2：使用pdfminer
                     text = extract_text(file_path)
-                    chunks = [{"text": text, "metadata": {"source": file_path}}]
+                    pages = [{"text": text, "metadata": {"source": file_path}}]
             else:
                 with open(file_path, 'r', encoding='utf-8') as f:
                     content = f.read()
-                chunks = [{"text": content, "metadata": {"source": file_path}}]
+                pages = [{"text": content, "metadata": {"source": file_path}}]
 
+            # 逐页按 chunk_size/overlap 切分，块ID由文件、页码和块序号确定
+            manifest_key = self._manifest_key(file_path)
+            chunk_size = config.HYPER_PARAMS["rag"]["chunk_size"]
+            overlap = config.HYPER_PARAMS["rag"]["overlap"]
             processed_docs = []
-            for i, chunk in enumerate(chunks):
-                processed_docs.append({
-                    "doc_id": f"{doc_id}-{i}",
-                    "content": chunk["text"] if isinstance(chunk, dict) else str(chunk),
-                    "metadata": {
-                        "source": file_path,
-                        "chunk_id": f"{doc_id}-{i}",
-                        **chunk.get("metadata", {})
-                    }
-                })
+            for page in pages:
+                page_no = page["metadata"].get("page")
+                prefix = f"{doc_id}-p{page_no}" if page_no is not None else doc_id
+                for i, (start, end, text) in enumerate(split_text(page["text"], chunk_size, overlap)):
+                    chunk_id = f"{prefix}-c{i}"
+                    processed_docs.append({
+                        "doc_id": chunk_id,
+                        # 由文件路径和块ID确定，重复入库时覆盖而不是新增
+                        "point_id": str(uuid.uuid5(uuid.NAMESPACE_URL, f"{manifest_key}#{chunk_id}")),
+                        "content": text,
+                        "metadata": {
+                            **page["metadata"],
+                            "source": file_path,
+                            "chunk_id": chunk_id,
+                            "chunk_index": i,
+                            "char_start": start,
+                            "char_end": end
+                        }
+                    })
 
             if processed_docs:
                 self.documents[doc_id] = {
-                    "raw_content": processed_docs,
+                    "raw_content": pages,
                     "processed_chunks": processed_docs
                 }
-                self.logger.info(f"成功加载文件: {file_path}")
-                
-                # 存储到向量数据库
-                self._store_to_vector_db(processed_docs)
+                self.logger.info(f"成功加载文件: {file_path}，切分为 {len(processed_docs)} 个文档块")
 
-            print(f"正在加载文件: {file_path}")  # 确认文件路径正确
-            if file_path.endswith('.pdf'):
-                text = extract_text(file_path)
-                print(f"提取到{len(text)}字符")  # 检查内容是否正常 
+            return processed_docs
 
         except Exception as e:
             self.logger.error(f"文件加载失败 {file_path}: {str(e)}")
@@ -254,80 +471,211 @@ class KnowledgeLoader:
         self.logger.info("FAISS索引已成功构建并保存。")
     '''   
 
+    def _encode_texts(self, texts: List[str]) -> np.ndarray:
+        """
+        批量编码文本，返回 (n, dim) 的 float32 数组。
+        embed_processes > 1 时启动 sentence-transformers 多进程编码池，按CPU核数扩展。
+        """
+        rag_params = config.HYPER_PARAMS["rag"]
+        batch_size = rag_params["embed_batch_size"]
+        processes = rag_params["embed_processes"]
+        model = self.embedding_model.model
+
+        if processes > 1 and len(texts) > batch_size:
+            pool = model.start_multi_process_pool(target_devices=["cpu"] * processes)
+            try:
+                vectors = model.encode_multi_process(
+                    texts, pool,
+                    batch_size=batch_size,
+                    normalize_embeddings=True
+                )
+            finally:
+                model.stop_multi_process_pool(pool)
+        else:
+            vectors = model.encode(
+                texts,
+                batch_size=batch_size,
+                normalize_embeddings=True,
+                convert_to_numpy=True,
+                show_progress_bar=False
+            )
+        return np.asarray(vectors, dtype=np.float32)
+
     def _store_to_vector_db(self, chunks: List[Dict[str, Any]]):
-        """存储处理后的块到向量数据库"""
+        """批量编码并写入向量数据库（使用确定性的 point_id，便于增量更新和删除）"""
         try:
+            chunks = [chunk for chunk in chunks if chunk["content"] and chunk["content"].strip()]
+            if not chunks:
+                return
+
             documents = [chunk["content"] for chunk in chunks]
-            metadatas = [chunk["metadata"] for chunk in chunks]
-    
-            # 检查 retriever 是否初始化
-            if not hasattr(self, 'retriever'):
-                raise AttributeError("Retriever not initialized. Call _init_retriever() first.")
-    
-            # 调用检索器存储数据
-            results = self.retriever.run_vector_retriever(
-                query="dummy_query",
-                contents=documents,
-                top_k=len(documents),
-                similarity_threshold=0.0,
-                return_detailed_info=True
-            )
-    
-            # 修改日志记录方式，安全处理结果
+            vectors = self._encode_texts(documents)
+
+            upsert_batch_size = config.HYPER_PARAMS["rag"]["upsert_batch_size"]
+            for start in range(0, len(chunks), upsert_batch_size):
+                self.vector_storage.add([
+                    VectorRecord(
+                        id=chunk["point_id"],
+                        vector=vector.tolist(),
+                        payload={"text": chunk["content"], "metadata": chunk["metadata"]}
+                    )
+                    for chunk, vector in zip(
+                        chunks[start:start + upsert_batch_size],
+                        vectors[start:start + upsert_batch_size]
+                    )
+                ])
+            for chunk in chunks:
+                self.bm25_index.add(chunk["point_id"], chunk["content"], chunk["metadata"])
             self.logger.info(f"已存储 {len(documents)} 个文档块到向量数据库")
-            for i, res in enumerate(results):
-                log_content = f"存储内容索引: {i}"
-                if isinstance(res, dict):
-                    log_content += f", 文本长度: {len(res.get('text', ''))}, 元数据: {res.get('metadata', {})}"
-                elif isinstance(res, str):
-                    log_content += f", 文本: {res[:50]}..."  # 只显示前50字符
-                self.logger.debug(log_content)
             
         except Exception as e:
             self.logger.error(f"存储到向量数据库失败: {e}", exc_info=True)
             raise
 
+    @staticmethod
+    def _normalize_query(query: str) -> str:
+        """统一全半角、大小写和空白，去掉句末标点，使近似重复的查询命中同一缓存"""
+        text = unicodedata.normalize('NFKC', query).strip().lower()
+        text = re.sub(r'\s+', ' ', text)
+        return text.rstrip('?？!！。.~～ ')
+
+    def embed_query(self, query: str) -> List[float]:
+        """编码查询文本，命中缓存时跳过模型前向计算"""
+        normalized = self._normalize_query(query) or query
+        cache_key = hashlib.sha1(f"{self.embedding_model_name}\0{normalized}".encode('utf-8')).hexdigest()
+
+        with self._query_cache_lock:
+            if cache_key in self._query_cache:
+                self._query_cache.move_to_end(cache_key)
+                self._query_cache_stats["hits"] += 1
+                return self._query_cache[cache_key]
+
+        vector = self._get_redis_query_vector(cache_key)
+        if vector is not None:
+            with self._query_cache_lock:
+                self._query_cache_stats["redis_hits"] += 1
+        else:
+            vector = self.embedding_model.embed(normalized)
+            with self._query_cache_lock:
+                self._query_cache_stats["misses"] += 1
+            self._set_redis_query_vector(cache_key, vector)
+
+        with self._query_cache_lock:
+            self._query_cache[cache_key] = vector
+            self._query_cache.move_to_end(cache_key)
+            while len(self._query_cache) > self._query_cache_size:
+                self._query_cache.popitem(last=False)
+        return vector
+
+    def query_cache_info(self) -> Dict[str, int]:
+        with self._query_cache_lock:
+            return {**self._query_cache_stats, "size": len(self._query_cache), "capacity": self._query_cache_size}
+
+    def _get_redis_query_vector(self, cache_key: str) -> Optional[List[float]]:
+        if self._query_cache_redis is None:
+            return None
+        try:
+            if data := self._query_cache_redis.get(f"query_embedding:{cache_key}"):
+                return np.frombuffer(base64.b64decode(data), dtype=np.float32).tolist()
+        except Exception as e:
+            self.logger.warning(f"读取Redis查询向量缓存失败: {e}")
+        return None
+
+    def _set_redis_query_vector(self, cache_key: str, vector: List[float]):
+        if self._query_cache_redis is None:
+            return
+        try:
+            self._query_cache_redis.setex(
+                f"query_embedding:{cache_key}",
+                config.HYPER_PARAMS["rag"]["query_cache_ttl"],
+                base64.b64encode(np.asarray(vector, dtype=np.float32).tobytes()).decode('ascii')
+            )
+        except Exception as e:
+            self.logger.warning(f"写入Redis查询向量缓存失败: {e}")
+
     def retrieve(self, query: str, **kwargs) -> List[Dict[str, Any]]:
+        """
+        按检索策略返回 top_k 个结果及其元数据：
+        vector 为向量近邻检索，keyword 为 BM25 关键词检索，
+        hybrid 对两路结果做倒数排名融合（RRF），auto 在关键词索引可用时使用 hybrid。
+        """
         try:
-            results = self.retriever.run_vector_retriever(
-                query=query,
-                contents=list(self.documents.keys()),
-                top_k=kwargs.get('top_k', 5),
-                similarity_threshold=kwargs.get('min_score', 0.35)
+            rag_params = config.HYPER_PARAMS["rag"]
+            top_k = kwargs.get('top_k', rag_params["top_k"])
+            min_score = kwargs.get('min_score', 0.35)
+            strategy = self._resolve_strategy(kwargs.get('strategy', rag_params["retrieval_strategy"]))
+
+            if strategy == "vector":
+                return self._vector_search(query, top_k, min_score)
+            if strategy == "keyword":
+                return self._keyword_search(query, top_k)
+
+            candidates = top_k * rag_params["hybrid_candidates"]
+            return reciprocal_rank_fusion(
+                [self._vector_search(query, candidates, min_score), self._keyword_search(query, candidates)],
+                top_k,
+                rag_params["rrf_k"]
             )
-    
-            formatted_results = []
-            for r in results:
-                if isinstance(r, dict):
-                    content = r.get('content', r.get('text', ''))
-                    formatted_results.append({
-                        "content": content,
-                        "metadata": {
-                            "source": r.get('content_path', 'unknown'),
-                            "similarity": r.get('similarity_score', 0.0)
-                        }
-                    })
-                elif isinstance(r, str):
-                    formatted_results.append({
-                        "content": r,
-                        "metadata": {
-                            "source": "unknown",
-                            "similarity": 0.0
-                        }
-                    })
-                
-            return formatted_results
-        
+
         except Exception as e:
             self.logger.error(f"检索失败: {e}")
             return []
 
-    def advanced_retrieve(self, query: str, strategy: str = "hybrid") -> Dict:
-        """新增高级检索方法（可选）"""
-        return self.retriever.retrieve(
-            query=query,
-            strategy=strategy  # 支持auto/vector/keyword/hybrid
-    )
+    def _resolve_strategy(self, strategy: str) -> str:
+        if strategy == "auto":
+            return "hybrid" if len(self.bm25_index) else "vector"
+        if strategy not in ("vector", "keyword", "hybrid"):
+            self.logger.warning(f"未知检索策略 {strategy}，使用向量检索")
+            return "vector"
+        return strategy
+
+    def _vector_search(self, query: str, top_k: int, min_score: float) -> List[Dict[str, Any]]:
+        """查询只编码一次，再在已构建的向量集合上做一次近邻搜索"""
+        results = self.vector_storage.query(
+            VectorDBQuery(query_vector=self.embed_query(query), top_k=top_k)
+        )
+
+        formatted_results = []
+        for r in results:
+            if r.similarity < min_score:
+                continue
+            payload = r.record.payload or {}
+            metadata = payload.get("metadata", {})
+            formatted_results.append({
+                "id": str(r.record.id),
+                "content": payload.get("text", ""),
+                "metadata": {
+                    **metadata,
+                    "source": metadata.get("source", "unknown"),
+                    "similarity": r.similarity
+                }
+            })
+        return formatted_results
+
+    def _keyword_search(self, query: str, top_k: int) -> List[Dict[str, Any]]:
+        """BM25 关键词检索，直接从倒排索引取回原文，不访问向量库"""
+        formatted_results = []
+        for point_id, score in self.bm25_index.search(query, top_k):
+            doc = self.bm25_index.get(point_id)
+            metadata = doc.get("metadata", {})
+            formatted_results.append({
+                "id": point_id,
+                "content": doc.get("text", ""),
+                "metadata": {
+                    **metadata,
+                    "source": metadata.get("source", "unknown"),
+                    "bm25_score": score
+                }
+            })
+        return formatted_results
+
+    def advanced_retrieve(self, query: str, strategy: str = "hybrid", **kwargs) -> Dict:
+        """高级检索方法，支持 auto/vector/keyword/hybrid 策略"""
+        strategy = self._resolve_strategy(strategy)
+        return {
+            "data": self.retrieve(query, strategy=strategy, **kwargs),
+            "strategy": strategy
+        }
     
     # 保持原有接口方法
     get_document_content = lambda self, doc_id: self.documents.get(doc_id, {}).get("raw_content")
\ No newline at end of file
@@ -13,10 +13,11 @@ from retrying import retry
 from dotenv import load_dotenv
 from config.settings import config
 from config.prompt_utils import prompt_loader
-from typing import Dict, Any, List, Optional, ClassVar, Generator, Union
+from typing import Dict, Any, List, Optional, ClassVar, Generator, Tuple, Union
 from pydantic import ConfigDict, BaseModel, Field
 from modules.info_retrieval import APIManager
 from knowledge_base.loader_RAG import KnowledgeLoader
+from infrastructure.llm_gateway import get_llm_gateway
 import matplotlib.pyplot as plt
 import numpy as np
 import redis
@@ -68,6 +69,17 @@ class GenerationOutput(BaseModel):
     timestamp: datetime = Field(default_factory=datetime.now)
 
 class ResultGenerator:
+    # 有专属生成提示词（prompts/generation/<intent>.jinja2）的意图
+    GENERATION_INTENTS: ClassVar[Tuple[str, ...]] = (
+        "facility_query",   # 1. 设施查询
+        "event_query",      # 2. 活动查询
+        "course_info",      # 3. 课程查询
+        "physical_test",    # 4. 体质测试
+        "feedback",         # 5. 投诉反馈
+        "health_advice",    # 6. 运动建议
+        "extra_exercise",   # 7. 85km课外锻炼
+    )
+
     def __init__(self, config_loader=None, prompt_loader=None, logger=None, redis_client=None):
         self.logger = logger or logging.getLogger('ResultGenerator')
         self.logger.setLevel(logging.INFO)
@@ -87,372 +99,247 @@ class ResultGenerator:
         os.makedirs(self.media_path, exist_ok=True)
         self.prompt_loader = prompt_loader or prompt_loader
         
-        self.agents: Dict[str, ChatAgent] = {}
+        self.llm_gateway = get_llm_gateway()
+        self.system_prompts: Dict[str, str] = {}
         self._init_llm_agents()
 
     def _init_llm_agents(self):
-        """初始化所有LLM代理"""
-        model_config = config.MODEL_CONFIGS["generation"]
-
-        # 1. 设施查询代理
-        facility_model = ModelFactory.create(
-            model_platform=ModelPlatformType.OPENAI_COMPATIBLE_MODEL,
-            model_type=model_config["model_name"],
-            api_key=config.DASHSCOPE_API_KEY,
-            url=config.DASHSCOPE_BASE_URL,
-            model_config_dict=QwenConfig(
-                temperature=model_config.get("temperature", 0.0),
-                max_tokens=model_config.get("max_tokens", 512),
-                top_p=model_config.get("top_p", 1.0),
-                stream=True
-            ).as_dict()
-        )
-        system_message_facility = BaseMessage(
-            role_name="Facility Query Assistant",
-            role_type=RoleType.ASSISTANT,
-            content=self.prompt_loader.get_prompt("generation/facility_query.jinja2"),
-            meta_dict={"module": "result_generator", "sub_agent": "facility_query", "timestamp": datetime.now().isoformat()}
-        )
-        self.agents["facility_query"] = ChatAgent(
-            system_message=system_message_facility,
-            model=facility_model
-        )
-
-        # 2. 活动查询代理
-        event_model_config = config.MODEL_CONFIGS["generation"]
-        event_model = ModelFactory.create(
-            model_type=model_config["model_name"],
-            model_platform=ModelPlatformType.OPENAI_COMPATIBLE_MODEL,
-            api_key=config.DASHSCOPE_API_KEY,
-            url=config.DASHSCOPE_BASE_URL,
-            model_config_dict=QwenConfig(
-                temperature=event_model_config.get("temperature", 0.0),
-                max_tokens=event_model_config.get("max_tokens", 512),
-                top_p=event_model_config.get("top_p", 1.0),
-                stream=True
-            ).as_dict()
-        )
-        system_message_event = BaseMessage(
-            role_name="Event Query Assistant",
-            role_type=RoleType.ASSISTANT,
-            content=self.prompt_loader.get_prompt("generation/event_query.jinja2"),
-            meta_dict={"module": "result_generator", "sub_agent": "event_query", "timestamp": datetime.now().isoformat()}
-        )
-        self.agents["event_query"] = ChatAgent(
-            system_message=system_message_event,
-            model=event_model
-        )
-        
-        # 3. 课程查询代理
-        course_model_config = config.MODEL_CONFIGS["generation"]
-        course_model = ModelFactory.create(
-            model_type=model_config["model_name"],
-            model_platform=ModelPlatformType.OPENAI_COMPATIBLE_MODEL,
-            api_key=config.DASHSCOPE_API_KEY,
-            url=config.DASHSCOPE_BASE_URL,
-            model_config_dict=QwenConfig(
-                temperature=course_model_config.get("temperature", 0.0),
-                max_tokens=course_model_config.get("max_tokens", 512),
-                top_p=course_model_config.get("top_p", 1.0),
-                stream=True
-            ).as_dict()
-        )
-        system_message_course = BaseMessage(
-            role_name="Course Query Assistant",
-            role_type=RoleType.ASSISTANT,
-            content=self.prompt_loader.get_prompt("generation/course_info.jinja2"),
-            meta_dict={"module": "result_generator", "sub_agent": "course_info", "timestamp": datetime.now().isoformat()}
-        )
-        self.agents["course_info"] = ChatAgent(
-            system_message=system_message_course,
-            model=course_model
-        )
-
-        # 4. 体质测试代理
-        physical_test_model_config = config.MODEL_CONFIGS["generation"]
-        physical_test_model = ModelFactory.create(
-            model_type=model_config["model_name"],
-            model_platform=ModelPlatformType.OPENAI_COMPATIBLE_MODEL,
-            api_key=config.DASHSCOPE_API_KEY,
-            url=config.DASHSCOPE_BASE_URL,
-            model_config_dict=QwenConfig(
-                temperature=physical_test_model_config.get("temperature", 0.0),
-                max_tokens=physical_test_model_config.get("max_tokens", 512),
-                top_p=physical_test_model_config.get("top_p", 1.0),
-                stream=True
-            ).as_dict()
-        )
-        system_message_physical_test = BaseMessage(
-            role_name="Physical Test Assistant",
-            role_type=RoleType.ASSISTANT,
-            content=self.prompt_loader.get_prompt("generation/physical_test.jinja2"),
-            meta_dict={"module": "result_generator", "sub_agent": "physical_test", "timestamp": datetime.now().isoformat()}
-        )
-        self.agents["physical_test"] = ChatAgent(
-            system_message=system_message_physical_test,
-            model=physical_test_model
-        )
-
-        # 5. 投诉反馈代理 (用于处理反馈，如果需要单独的生成逻辑)
-        feedback_model_config = config.MODEL_CONFIGS["generation"]
-        feedback_model = ModelFactory.create(
-            model_type=model_config["model_name"],
-            model_platform=ModelPlatformType.OPENAI_COMPATIBLE_MODEL,
-            api_key=config.DASHSCOPE_API_KEY,
-            url=config.DASHSCOPE_BASE_URL,
-            model_config_dict=QwenConfig(
-                temperature=feedback_model_config.get("temperature", 0.0),
-                max_tokens=feedback_model_config.get("max_tokens", 512),
-                top_p=feedback_model_config.get("top_p", 1.0),
-                stream=True
-            ).as_dict()
-        )
-        system_message_feedback = BaseMessage(
-            role_name="Feedback Processor",
-            role_type=RoleType.ASSISTANT,
-            content=self.prompt_loader.get_prompt("generation/feedback.jinja2"),
-            meta_dict={"module": "result_generator", "sub_agent": "feedback", "timestamp": datetime.now().isoformat()}
-        )
-        self.agents["feedback"] = ChatAgent(
-            system_message=system_message_feedback,
-            model=feedback_model
-        )
-
-        # 6. 运动建议代理
-        health_model_config = config.MODEL_CONFIGS["generation"]
-        health_model = ModelFactory.create(
-            model_type=model_config["model_name"],
-            model_platform=ModelPlatformType.OPENAI_COMPATIBLE_MODEL,
-            api_key=config.DASHSCOPE_API_KEY,
-            url=config.DASHSCOPE_BASE_URL,
-            model_config_dict=QwenConfig(
-                temperature=health_model_config.get("temperature", 0.0),
-                max_tokens=health_model_config.get("max_tokens", 512),
-                top_p=health_model_config.get("top_p", 1.0),
-                stream=True
-            ).as_dict()
-        )
-        system_message_health = BaseMessage(
-            role_name="Exercise Recommender",
-            role_type=RoleType.ASSISTANT,
-            content=self.prompt_loader.get_prompt("generation/health_advice.jinja2"),
-            meta_dict={"module": "result_generator", "sub_agent": "health_advice", "timestamp": datetime.now().isoformat()}
-        )
-        self.agents["health_advice"] = ChatAgent(
-            system_message=system_message_health,
-            model=health_model
-        )
-
-        # 7. 85km课外锻炼代理
-        exercise_model_config = config.MODEL_CONFIGS["generation"]
-        exercise_model = ModelFactory.create(
-            model_type=model_config["model_name"],
-            model_platform=ModelPlatformType.OPENAI_COMPATIBLE_MODEL,
-            api_key=config.DASHSCOPE_API_KEY,
-            url=config.DASHSCOPE_BASE_URL,
-            model_config_dict=QwenConfig(
-                temperature=exercise_model_config.get("temperature", 0.0),
-                max_tokens=exercise_model_config.get("max_tokens", 512),
-                top_p=exercise_model_config.get("top_p", 1.0),
-                stream=True
-            ).as_dict()
-        )
-        system_message_exercise = BaseMessage(
-            role_name="Exercise Recommender",
-            role_type=RoleType.ASSISTANT,
-            content=self.prompt_loader.get_prompt("generation/extra_exercise.jinja2"),
-            meta_dict={"module": "result_generator", "sub_agent": "extra_exercise", "timestamp": datetime.now().isoformat()}
-        )
-        self.agents["extra_exercise"] = ChatAgent(
-            system_message=system_message_exercise,
-            model=exercise_model
-        )
-
+        """加载各意图的系统提示词；模型调用统一经由网关以无状态方式进行"""
+        for intent in self.GENERATION_INTENTS:
+            self.system_prompts[intent] = self.prompt_loader.get_prompt(f"generation/{intent}.jinja2")
+
+    def _build_messages(self, agent_name: str, user_message_content: str) -> List[Dict[str, str]]:
+        """每次调用只包含系统提示词和本次用户消息，不共享对话记忆，提示词长度保持不变"""
+        system_prompt = self.system_prompts.get(agent_name)
+        if system_prompt is None:
+            self.logger.error(f"未找到代理: {agent_name}")
+            raise ValueError(f"未找到代理: {agent_name}")
+        return [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": user_message_content}
+        ]
 
     @retry(wait_fixed=2000, stop_max_attempt_number=3)
     def _call_llm(self, agent_name: str, messages: List[Dict[str, Any]]) -> str:
-        """调用指定代理的LLM"""
-        agent = self.agents.get(agent_name)
-        if not agent:
-            self.logger.error(f"未找到代理: {agent_name}")
-            raise ValueError(f"未找到代理: {agent_name}")
-        
+        """调用指定意图的LLM（无状态，可在多个工作线程中并发调用）"""
         try:
-            user_message_content = messages[0]["content"]
-            response = agent.step(
-                BaseMessage(
-                    role_name="user",
-                    role_type=RoleType.USER,
-                    content=user_message_content,
-                    meta_dict={
-                        "module": "result_generator_call_llm", 
-                        "agent": agent_name,
-                        "timestamp": datetime.now().isoformat()
-                    }
-                )
+            return self.llm_gateway.complete(
+                "generation",
+                self._build_messages(agent_name, messages[0]["content"])
             )
-            return response.msg.content
         except Exception as e:
             self.logger.error(f"调用LLM失败 (Agent: {agent_name}): {e}")
             raise
 
-    def generate_answer(self, input_data: GenerationInput) -> GenerationOutput:
-        start_time = perf_counter()
-        self.logger.info(f"Session {input_data.session_id}: 开始生成答案，意图: {input_data.intent}")
-
-        answer_text = "抱歉，无法生成答案。"
-        media_items: List[MediaItem] = []
-        sources: List[str] = []
-        related_queries: List[str] = []
+    def _stream_llm(self, agent_name: str, user_message_content: str) -> Generator[str, None, None]:
+        """以流式方式调用指定意图的模型，逐个产出文本片段"""
+        yield from self.llm_gateway.stream(
+            "generation",
+            self._build_messages(agent_name, user_message_content)
+        )
 
-        try:
-            # 处理无法识别意图的情况
-            if input_data.intent == "unrecognized_intent":
-                self.logger.info(f"Session {input_data.session_id}: 意图为 'unrecognized_intent'，加载专用模板。")
-                prompt_template_path = "generation/unrecognized_intent.jinja2"
-                
-                if not self.prompt_loader.template_exists(prompt_template_path):
-                    self.logger.error(f"Session {input_data.session_id}: 模板 '{prompt_template_path}' 不存在。")
-                    answer_text = "抱歉，系统无法理解您的问题，且相关提示信息缺失。"
-                else:
-                    answer_text = self.prompt_loader.get_prompt(prompt_template_path)
-                
-                feedback_token = self._create_feedback_record(input_data, {
-                    "output": {
-                        "session_id": input_data.session_id,
-                        "answer": answer_text,
-                        "intent": input_data.intent,
-                        "entities": input_data.entities,
-                        "media": [],
-                        "feedback_token": "",
-                        "sources": [],
-                        "related_queries": []
-                    }
-                })
-                
-                return GenerationOutput(
-                    session_id=input_data.session_id,
-                    answer=answer_text,
-                    intent=input_data.intent,
-                    entities=input_data.entities,
-                    media=[],
-                    feedback_token=feedback_token,
-                    sources=[],
-                    related_queries=[]
-                )
-
-            # 正常意图处理
-            agent_name = input_data.intent
-            if agent_name not in self.agents:
-                self.logger.error(f"Session {input_data.session_id}: 未找到意图 '{agent_name}' 对应的LLM Agent。")
-                feedback_token = self._create_feedback_record(input_data, {"error": f"未找到意图 {agent_name} 的Agent"})
-                return GenerationOutput(
-                    session_id=input_data.session_id,
-                    answer="系统内部错误：无法处理此意图。",
-                    intent=input_data.intent,
-                    entities=input_data.entities,
-                    media=[],
-                    feedback_token=feedback_token,
-                    sources=[],
-                    related_queries=[]
-                )
-
-            prompt_template_path = f"generation/{agent_name}.jinja2"
+    def _check_early_output(self, input_data: GenerationInput) -> Optional[GenerationOutput]:
+        """处理无需调用LLM即可返回的情况（无法识别的意图、缺少代理或模板）"""
+        # 处理无法识别意图的情况
+        if input_data.intent == "unrecognized_intent":
+            self.logger.info(f"Session {input_data.session_id}: 意图为 'unrecognized_intent'，加载专用模板。")
+            prompt_template_path = "generation/unrecognized_intent.jinja2"
+            
             if not self.prompt_loader.template_exists(prompt_template_path):
-                self.logger.error(f"Session {input_data.session_id}: 意图 '{agent_name}' 对应的提示词模板 '{prompt_template_path}' 不存在。")
-                feedback_token = self._create_feedback_record(input_data, {"error": f"模板 {prompt_template_path} 不存在"})
-                return GenerationOutput(
-                    session_id=input_data.session_id,
-                    answer="抱歉，系统配置不完整，无法为您提供此意图的答案。",
-                    intent=input_data.intent,
-                    entities=input_data.entities,
-                    media=[],
-                    feedback_token=feedback_token,
-                    sources=[],
-                    related_queries=[]
-                )
-
-            # 准备Prompt数据
-            prompt_data = {
-                "user_query": input_data.user_query,
-                "retrieved_data": input_data.retrieved_data,
-                "api_result": input_data.api_result,
-                "entities": input_data.entities,
-                "media_assets": input_data.media_assets,
-                "height": input_data.height,
-                "weight": input_data.weight,
-                "goal": input_data.goal
-            }
-            prompt = self.prompt_loader.get_prompt(prompt_template_path, **prompt_data)
+                self.logger.error(f"Session {input_data.session_id}: 模板 '{prompt_template_path}' 不存在。")
+                answer_text = "抱歉，系统无法理解您的问题，且相关提示信息缺失。"
+            else:
+                answer_text = self.prompt_loader.get_prompt(prompt_template_path)
             
-            # 调用LLM
-            llm_response_content = self._call_llm(agent_name, [{"role": "user", "content": prompt}])
-            self.logger.info(f"Session {input_data.session_id}: LLM响应内容已获取。")
-
-            # 解析LLM响应
-            try:
-                parsed_llm_response = json.loads(llm_response_content)
-                answer_text = parsed_llm_response.get("answer", llm_response_content)
-                media_items = [MediaItem(**item) for item in parsed_llm_response.get("media", [])]
-                sources = parsed_llm_response.get("sources", [])
-                related_queries = parsed_llm_response.get("related_queries", [])
-
-                # 处理检索结果中的媒体s
-                if isinstance(input_data.retrieved_data, dict):
-                    # 从检索数据中提取媒体（兼容RetrievalResult结构）
-                    retrieved_media = input_data.retrieved_data.get("data", {}).get("media_assets", [])
-                    for asset in retrieved_media:
-                        if asset.get("type") == "image" and asset.get("content"):
-                            media_items.append(MediaItem(
-                                type="image",
-                                content=asset["content"],
-                                description=asset.get("description", "相关图片"),
-                                source=asset.get("metadata", {}).get("source", "知识库")
-                            ))
-
-            except json.JSONDecodeError:
-                self.logger.warning(f"Session {input_data.session_id}: LLM响应不是有效的JSON，将内容作为纯文本处理。")
-                answer_text = llm_response_content
-            except Exception as e:
-                self.logger.error(f"Session {input_data.session_id}: 解析LLM响应中的媒体资产失败: {e}")
-                answer_text = llm_response_content
-
             feedback_token = self._create_feedback_record(input_data, {
                 "output": {
                     "session_id": input_data.session_id,
                     "answer": answer_text,
                     "intent": input_data.intent,
                     "entities": input_data.entities,
-                    "media": [item.model_dump() for item in media_items],
+                    "media": [],
                     "feedback_token": "",
-                    "sources": sources,
-                    "related_queries": related_queries
+                    "sources": [],
+                    "related_queries": []
                 }
             })
-
+            
             return GenerationOutput(
                 session_id=input_data.session_id,
                 answer=answer_text,
                 intent=input_data.intent,
                 entities=input_data.entities,
-                media=media_items,
+                media=[],
                 feedback_token=feedback_token,
-                sources=sources,
-                related_queries=related_queries
+                sources=[],
+                related_queries=[]
             )
 
-        except Exception as e:
-            self.logger.error(f"Session {input_data.session_id}: 生成答案时发生意外错误: {e}")
-            feedback_token = self._create_feedback_record(input_data, {"error": str(e)})
+        # 正常意图处理
+        agent_name = input_data.intent
+        if agent_name not in self.system_prompts:
+            self.logger.error(f"Session {input_data.session_id}: 未找到意图 '{agent_name}' 对应的LLM Agent。")
+            feedback_token = self._create_feedback_record(input_data, {"error": f"未找到意图 {agent_name} 的Agent"})
             return GenerationOutput(
                 session_id=input_data.session_id,
-                answer="非常抱歉，系统内部出现错误，请稍后再试。",
+                answer="系统内部错误：无法处理此意图。",
                 intent=input_data.intent,
                 entities=input_data.entities,
+                media=[],
                 feedback_token=feedback_token,
-                sources=[]
+                sources=[],
+                related_queries=[]
             )
 
+        prompt_template_path = f"generation/{agent_name}.jinja2"
+        if not self.prompt_loader.template_exists(prompt_template_path):
+            self.logger.error(f"Session {input_data.session_id}: 意图 '{agent_name}' 对应的提示词模板 '{prompt_template_path}' 不存在。")
+            feedback_token = self._create_feedback_record(input_data, {"error": f"模板 {prompt_template_path} 不存在"})
+            return GenerationOutput(
+                session_id=input_data.session_id,
+                answer="抱歉，系统配置不完整，无法为您提供此意图的答案。",
+                intent=input_data.intent,
+                entities=input_data.entities,
+                media=[],
+                feedback_token=feedback_token,
+                sources=[],
+                related_queries=[]
+            )
+
+        return None
+
+    def _build_generation_prompt(self, input_data: GenerationInput) -> str:
+        """根据意图对应的模板渲染生成提示词"""
+        prompt_data = {
+            "user_query": input_data.user_query,
+            "retrieved_data": input_data.retrieved_data,
+            "api_result": input_data.api_result,
+            "entities": input_data.entities,
+            "media_assets": input_data.media_assets,
+            "height": input_data.height,
+            "weight": input_data.weight,
+            "goal": input_data.goal
+        }
+        return self.prompt_loader.get_prompt(f"generation/{input_data.intent}.jinja2", **prompt_data)
+
+    def _build_output(self, input_data: GenerationInput, llm_response_content: str) -> GenerationOutput:
+        """解析LLM响应，创建反馈记录并构造最终输出"""
+        answer_text = llm_response_content
+        media_items: List[MediaItem] = []
+        sources: List[str] = []
+        related_queries: List[str] = []
+
+        # 解析LLM响应
+        try:
+            parsed_llm_response = json.loads(llm_response_content)
+            answer_text = parsed_llm_response.get("answer", llm_response_content)
+            media_items = [MediaItem(**item) for item in parsed_llm_response.get("media", [])]
+            sources = parsed_llm_response.get("sources", [])
+            related_queries = parsed_llm_response.get("related_queries", [])
+
+            # 处理检索结果中的媒体s
+            if isinstance(input_data.retrieved_data, dict):
+                # 从检索数据中提取媒体（兼容RetrievalResult结构）
+                retrieved_media = input_data.retrieved_data.get("data", {}).get("media_assets", [])
+                for asset in retrieved_media:
+                    if asset.get("type") == "image" and asset.get("content"):
+                        media_items.append(MediaItem(
+                            type="image",
+                            content=asset["content"],
+                            description=asset.get("description", "相关图片"),
+                            source=asset.get("metadata", {}).get("source", "知识库")
+                        ))
+
+        except json.JSONDecodeError:
+            self.logger.warning(f"Session {input_data.session_id}: LLM响应不是有效的JSON，将内容作为纯文本处理。")
+            answer_text = llm_response_content
+        except Exception as e:
+            self.logger.error(f"Session {input_data.session_id}: 解析LLM响应中的媒体资产失败: {e}")
+            answer_text = llm_response_content
+
+        feedback_token = self._create_feedback_record(input_data, {
+            "output": {
+                "session_id": input_data.session_id,
+                "answer": answer_text,
+                "intent": input_data.intent,
+                "entities": input_data.entities,
+                "media": [item.model_dump() for item in media_items],
+                "feedback_token": "",
+                "sources": sources,
+                "related_queries": related_queries
+            }
+        })
+
+        return GenerationOutput(
+            session_id=input_data.session_id,
+            answer=answer_text,
+            intent=input_data.intent,
+            entities=input_data.entities,
+            media=media_items,
+            feedback_token=feedback_token,
+            sources=sources,
+            related_queries=related_queries
+        )
+
+    def _build_error_output(self, input_data: GenerationInput, error: Exception) -> GenerationOutput:
+        feedback_token = self._create_feedback_record(input_data, {"error": str(error)})
+        return GenerationOutput(
+            session_id=input_data.session_id,
+            answer="非常抱歉，系统内部出现错误，请稍后再试。",
+            intent=input_data.intent,
+            entities=input_data.entities,
+            feedback_token=feedback_token,
+            sources=[]
+        )
+
+    def generate_answer(self, input_data: GenerationInput) -> GenerationOutput:
+        start_time = perf_counter()
+        self.logger.info(f"Session {input_data.session_id}: 开始生成答案，意图: {input_data.intent}")
+
+        try:
+            if early_output := self._check_early_output(input_data):
+                return early_output
+
+            # 准备Prompt数据
+            prompt = self._build_generation_prompt(input_data)
+            
+            # 调用LLM
+            llm_response_content = self._call_llm(input_data.intent, [{"role": "user", "content": prompt}])
+            self.logger.info(f"Session {input_data.session_id}: LLM响应内容已获取。")
+
+            return self._build_output(input_data, llm_response_content)
+
+        except Exception as e:
+            self.logger.error(f"Session {input_data.session_id}: 生成答案时发生意外错误: {e}")
+            return self._build_error_output(input_data, e)
+
+    def stream_answer(self, input_data: GenerationInput) -> Generator[Tuple[str, Any], None, None]:
+        """
+        流式生成答案。
+        依次产出 ("token", 文本片段)，最后产出 ("done", GenerationOutput)。
+        """
+        self.logger.info(f"Session {input_data.session_id}: 开始流式生成答案，意图: {input_data.intent}")
+
+        try:
+            if early_output := self._check_early_output(input_data):
+                yield "token", early_output.answer
+                yield "done", early_output
+                return
+
+            prompt = self._build_generation_prompt(input_data)
+
+            chunks: List[str] = []
+            for delta in self._stream_llm(input_data.intent, prompt):
+                chunks.append(delta)
+                yield "token", delta
+            self.logger.info(f"Session {input_data.session_id}: 流式LLM响应已结束。")
+
+            yield "done", self._build_output(input_data, "".join(chunks))
+
+        except Exception as e:
+            self.logger.error(f"Session {input_data.session_id}: 流式生成答案时发生意外错误: {e}")
+            yield "done", self._build_error_output(input_data, e)
+
     def _create_feedback_record(self, input_data: GenerationInput, output_data: Union[Dict, GenerationOutput]) -> str:
         """创建反馈记录"""
         feedback_token = str(uuid.uuid4())
@@ -620,9 +507,9 @@ class ResultGenerator:
 
     def _generate_with_feedback(self, original_data: dict, suggestions: str) -> GenerationOutput:
         """基于反馈重新生成结果"""
-        agent = self.agents.get(original_data["input"]["intent"])
-        if not agent:
-            agent = self.agents["general_query"] # 兜底到通用代理
+        agent_name = original_data["input"]["intent"]
+        if agent_name not in self.system_prompts:
+            agent_name = "feedback" # 兜底到反馈处理代理
         
         # 构造重新生成提示，包含原始输入和用户建议
         prompt = self.prompt_loader.get_prompt(
@@ -634,7 +521,7 @@ class ResultGenerator:
             entities=original_data["input"]["entities"]
         )
         
-        llm_response_content = self._call_llm(agent.role_name.name, [{"role": "user", "content": prompt}]) # 代理名可能是 role_name.name
+        llm_response_content = self._call_llm(agent_name, [{"role": "user", "content": prompt}])
         
         try:
             response_json = json.loads(llm_response_content)
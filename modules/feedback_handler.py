@@ -20,7 +20,8 @@ class FeedbackData(BaseModel):
     context: Dict[str, Any] = Field(default_factory=dict, description="附加上下文")
 
 class FeedbackHandler:
-    def __init__(self, broker: MessageBroker, config_loader, prompt_loader, logger, redis_client): 
+    def __init__(self, broker: MessageBroker, config_loader, prompt_loader, logger, redis_client,
+                 generator: Optional[ResultGenerator] = None): 
         # 将传入的参数存储为实例属性
         self.redis = redis_client      # <--- 确保 redis_client 被存储
         self.broker = broker
@@ -28,8 +29,8 @@ class FeedbackHandler:
         self.prompt_loader = prompt_loader
         self.logger = logger 
 
-        # 复用生成器实例，并传递所有必需的参数
-        self.generator = ResultGenerator(
+        # 优先复用调用方传入的生成器实例，未传入时才单独创建
+        self.generator = generator or ResultGenerator(
             config_loader=self.config_loader,
             prompt_loader=self.prompt_loader,
             logger=self.logger, 
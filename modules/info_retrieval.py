@@ -1,14 +1,19 @@
 import json
 import re
 import os
+import time
+import socket
+import uuid
 import requests
 import redis
 import random
 import threading
+import numpy as np
 from datetime import datetime
+from collections import OrderedDict
 from config.settings import config
 from config.prompt_utils import prompt_loader
-from typing import Dict, List, Any, Optional, Union, Generator
+from typing import Dict, List, Any, Optional, Tuple, Union, Generator
 from dotenv import load_dotenv
 import hashlib
 from firecrawl import FirecrawlApp
@@ -20,10 +25,14 @@ from camel.retrievers import AutoRetriever
 from camel.types import StorageType, EmbeddingModelType, ModelPlatformType, RoleType
 from enum import Enum
 from infrastructure.shared_schemas import RetrievalRequest, RetrievalResult
+from infrastructure.message_broker import MessageBroker
+from infrastructure.http_client import get_http_client
+from infrastructure.llm_gateway import get_llm_gateway
+from infrastructure.resilience import CircuitBreaker, CircuitOpenError, LatencyTracker
 import logging
 from openai import OpenAI
 from retrying import retry
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 from knowledge_base.loader_RAG import KnowledgeLoader
 
 load_dotenv(dotenv_path='.env.development')
@@ -49,9 +58,17 @@ class SportsRetrievalAgent:
         self.prompt_loader = prompt_loader
         self.api_manager = APIManager()
 
-        self.retrieved_docs_cache = {}
+        # 检索结果缓存：精确键存于Redis；语义索引按意图保存查询向量，用于近似查询复用结果
+        self.cache_redis = redis.Redis(
+            connection_pool=config.redis_pool,
+            db=config.REDIS_DB_MAPPING["retrieval"]
+        )
+        self.cache_expiry = config.HYPER_PARAMS["cache"]["retrieval_expiry"]
+        self.retrieved_docs_cache: Dict[str, List[Dict[str, Any]]] = {}
+        self._cache_lock = threading.Lock()
         
-        # 初始化LLM用于生成查询和整合结果
+        # 初始化LLM用于生成查询和整合结果（模型后端由网关统一管理）
+        self.llm_gateway = get_llm_gateway()
         self.llm_retrieval_agent = self._init_llm_retrieval_agent()
         self.executor = ThreadPoolExecutor(max_workers=config.RETRIEVAL_WORKERS)
 
@@ -65,59 +82,21 @@ class SportsRetrievalAgent:
 
 
     def _init_llm_retrieval_agent(self):
-        model_config = config.MODEL_CONFIGS["retrieval"]
-        
-        # 按照您提供的正确格式创建模型
-        qwen_model = ModelFactory.create(
-            model_type=model_config["model_name"],
-            model_platform=ModelPlatformType.OPENAI_COMPATIBLE_MODEL,
-            api_key=config.DASHSCOPE_API_KEY,
-            url=config.DASHSCOPE_BASE_URL,
-            model_config_dict=QwenConfig(
-                temperature=model_config.get("temperature", 0.0),
-                max_tokens=model_config.get("max_tokens", 2048), # 检索模型通常需要更多token
-                top_p=model_config.get("top_p", 1.0)
-            ).as_dict()
+        return self.llm_gateway.create_agent(
+            "retrieval",
+            system_content=self.prompt_loader.get_prompt("retrieval/system.jinja2"),
+            role_name="Retrieval Assistant",
+            meta_dict={"module": "info_retrieval"}
         )
-        
-        # 创建系统消息
-        system_message = BaseMessage(
-            role_name="Retrieval Assistant", # 代理角色名称
-            role_type=RoleType.ASSISTANT,    # 代理角色类型
-            content=self.prompt_loader.get_prompt("retrieval/system.jinja2"), # 从模板加载内容
-            meta_dict={
-                "module": "info_retrieval",
-                "timestamp": datetime.now().isoformat()
-            }
-        )
-
-        # 创建 ChatAgent
-        agent = ChatAgent(
-            system_message=system_message,
-            model=qwen_model
-        )
-        return agent
     
     @retry(wait_fixed=2000, stop_max_attempt_number=3)
     def _call_llm(self, messages: List[Dict[str, Any]]) -> str:
+        """无状态调用：每次只发送系统提示词和本次用户消息，不累积对话记忆，可并发调用"""
         try:
-            # 这里的 messages 列表通常只有一个元素，例如 [{"role": "user", "content": "..."}]
-            # 需要从这个字典中提取 'content'，并补充 'role_type' 和 'meta_dict'
-            user_message_content = messages[0]["content"]
-
-            # 确保提供 role_type 和 meta_dict
-            response = self.llm_retrieval_agent.step(
-                BaseMessage(
-                    role_name="user",           # 已有
-                    role_type=RoleType.USER,    # <--- 新增此行：明确指定为 USER 角色类型
-                    content=user_message_content, # 已有
-                    meta_dict={
-                        "module": "info_retrieval_agent",
-                        "timestamp": datetime.now().isoformat()
-                    } # <--- 新增此行：提供一个空的或简单的 meta_dict
-                )
-            )
-            return response.msg.content
+            return self.llm_gateway.complete("retrieval", [
+                {"role": "system", "content": self.llm_retrieval_agent.system_message.content},
+                {"role": "user", "content": messages[0]["content"]}
+            ])
         except Exception as e:
             self.logger.error(f"LLM调用失败: {e}")
             raise
@@ -127,6 +106,10 @@ class SportsRetrievalAgent:
         response = self._call_llm([{"role": "user", "content": prompt}])
         return response.strip()
 
+    def _generate_and_search_web(self, query: str, intent: str = None) -> Dict[str, Any]:
+        """网络检索分支：先生成搜索词再检索，两步串行，但整个分支与知识库、API检索并发"""
+        return self._search_web(self._generate_search_query(query), intent)
+
     def _search_web(self, query: str, intent: str = None) -> Dict[str, Any]:
         """通用网络检索方法（兼容Firecrawl最新API）"""
         if not self.web_search_enabled or not self.firecrawl_app:
@@ -278,7 +261,109 @@ class SportsRetrievalAgent:
             self.logger.warning("LLM did not return valid JSON for integration. Returning raw content.")
             return {"content": integrated_content}
 
-    def retrieve(self, request: RetrievalRequest) -> RetrievalResult:
+    def _passthrough_results(self, kb_data: str, kb_chunks: List[Dict[str, Any]],
+                             web_data: str, api_data: Dict[str, Any]) -> Dict[str, Any]:
+        """单一来源时不经过LLM整合，按检索排序原样交给生成模块"""
+        if kb_data:
+            return {
+                "content": kb_data,
+                "chunks": [
+                    {"content": doc.get("content", ""), "metadata": doc.get("metadata", {})}
+                    for doc in kb_chunks
+                ],
+                "source": "knowledge_base"
+            }
+        if web_data:
+            return {"content": web_data, "source": "web"}
+        if api_data:
+            return {"content": json.dumps(api_data, ensure_ascii=False), "api_data": api_data, "source": "external_api"}
+        return {"status": "empty", "message": "未找到相关结果"}
+
+    # ---------- 检索结果缓存 ----------
+    def _build_cache_key(self, request: RetrievalRequest) -> str:
+        """由意图、标准化查询和实体生成精确缓存键"""
+        key_source = json.dumps({
+            "intent": request.intent,
+            "query": KnowledgeLoader._normalize_query(request.original_query),
+            "entities": request.entities
+        }, sort_keys=True, ensure_ascii=False, default=str)
+        return hashlib.sha256(key_source.encode('utf-8')).hexdigest()
+
+    def _entities_signature(self, request: RetrievalRequest) -> str:
+        return json.dumps(request.entities, sort_keys=True, ensure_ascii=False, default=str)
+
+    def _get_cached_result(self, request: RetrievalRequest, cache_key: str) -> Optional[RetrievalResult]:
+        try:
+            data = self.cache_redis.get(f"retrieval_cache:{cache_key}")
+            hit_type = "精确"
+
+            # 精确键未命中时，在同意图、同实体的语义索引中查找足够相近的查询
+            if not data and config.HYPER_PARAMS["cache"]["semantic_enabled"]:
+                similar_key = self._find_similar_cache_key(request)
+                if similar_key:
+                    data = self.cache_redis.get(f"retrieval_cache:{similar_key}")
+                    hit_type = "语义"
+            if not data:
+                return None
+
+            cached = RetrievalResult.model_validate_json(data)
+            self.logger.info(f"Session {request.session_id}: 命中{hit_type}检索缓存。")
+            return cached.model_copy(update={
+                "session_id": request.session_id,
+                "context": {**cached.context, "user_query": request.original_query, "cache_hit": hit_type}
+            })
+        except Exception as e:
+            self.logger.warning(f"Session {request.session_id}: 读取检索缓存失败: {e}")
+            return None
+
+    def _find_similar_cache_key(self, request: RetrievalRequest) -> Optional[str]:
+        with self._cache_lock:
+            entries = list(self.retrieved_docs_cache.get(request.intent, []))
+        if not entries:
+            return None
+
+        query_vector = np.asarray(self.knowledge_loader.embed_query(request.original_query), dtype=np.float32)
+        entities = self._entities_signature(request)
+        now = datetime.now().timestamp()
+        candidates = [e for e in entries if e["entities"] == entities and e["expires_at"] > now]
+        if not candidates:
+            return None
+
+        # 向量已归一化，点积即余弦相似度
+        similarities = np.stack([e["vector"] for e in candidates]) @ query_vector
+        best = int(np.argmax(similarities))
+        if similarities[best] >= config.HYPER_PARAMS["cache"]["semantic_threshold"]:
+            return candidates[best]["cache_key"]
+        return None
+
+    def _cache_result(self, request: RetrievalRequest, cache_key: str, result: RetrievalResult):
+        try:
+            self.cache_redis.setex(f"retrieval_cache:{cache_key}", self.cache_expiry, result.model_dump_json())
+
+            if not config.HYPER_PARAMS["cache"]["semantic_enabled"]:
+                return
+            entry = {
+                "cache_key": cache_key,
+                "vector": np.asarray(self.knowledge_loader.embed_query(request.original_query), dtype=np.float32),
+                "entities": self._entities_signature(request),
+                "expires_at": datetime.now().timestamp() + self.cache_expiry
+            }
+            with self._cache_lock:
+                entries = self.retrieved_docs_cache.setdefault(request.intent, [])
+                entries[:] = [e for e in entries if e["cache_key"] != cache_key]
+                entries.append(entry)
+                del entries[:-config.HYPER_PARAMS["cache"]["semantic_max_entries"]]
+        except Exception as e:
+            self.logger.warning(f"Session {request.session_id}: 写入检索缓存失败: {e}")
+
+    def retrieve(self, request: RetrievalRequest, deadline: Optional[float] = None) -> RetrievalResult:
+        """
+        并行检索各来源并整合结果。
+        deadline 为 time.monotonic() 时间点，表示等待方的剩余预算：各分支的截止时间不会晚于它，
+        预算耗尽后不再调用整合LLM，直接返回已有结果。
+        """
+        cache_key = self._build_cache_key(request)
+
         # 1. 保持原有无法识别意图的快速返回
         if request.intent == "unrecognized_intent":
             self.logger.info(f"Session {request.session_id}: 意图为 'unrecognized_intent'，跳过所有检索。")
@@ -287,62 +372,93 @@ class SportsRetrievalAgent:
                 data={"status": "empty", "message": "未找到相关结果"},
                 media_assets=[],
                 sources=self._get_sources(request.intent),
-                cache_key=hashlib.md5(request.original_query.encode()).hexdigest(),
+                cache_key=cache_key,
                 context={"user_query": request.original_query, "retrieved_kb_data": "", "retrieved_web_data": "", "retrieved_api_data": {}},
                 use_web=False
             )
 
-        # 2. 并行执行所有检索任务（保持原有并发逻辑）
-        futures = []
-        future_map = {}
-    
-        # 知识库检索（必须执行）
-        kb_future = self.executor.submit(self._retrieve_from_knowledge_base, request.original_query)
-        futures.append(kb_future)
-        future_map[kb_future] = "kb"
-    
-        # 外部API调用（必须执行）
-        api_future = self.executor.submit(self._call_external_api, request.intent, request.entities)
-        futures.append(api_future)
-        future_map[api_future] = "api"
-    
-        # 网络检索（条件执行）
-        use_web_search = False
-        if self.web_search_enabled and self.firecrawl_app:
-            use_web_search = True
-            search_query_future = self.executor.submit(self._generate_search_query, request.original_query)
-            try:
-                search_query = search_query_future.result(timeout=config.EXTERNAL_API_TIMEOUT)
-                web_search_future = self.executor.submit(
-                    self._search_web, 
-                    search_query,
-                    request.intent
-                )
-                futures.append(web_search_future)
-                future_map[web_search_future] = "web"
-            except Exception as e:
-                self.logger.error(f"生成搜索查询失败: {e}")
-                use_web_search = False
-    
-        # 3. 收集结果（保持原有错误处理）
+        cached = self._get_cached_result(request, cache_key)
+        if cached is not None:
+            return cached
+
+        # 2. 并行执行所有检索分支：知识库、外部API、网络检索（搜索词生成→检索）同时开始，
+        #    总耗时取决于最慢的分支而不是各分支之和
+        #    各分支的截止时间从其实际开始执行时计算，线程池繁忙时排队的时间不占用分支自身的预算
+        start_time = time.monotonic()
+        branch_started: Dict[str, float] = {}
+
+        def run_branch(task_type: str, func, *args):
+            branch_started[task_type] = time.monotonic()
+            return func(*args)
+
+        future_map = {
+            self.executor.submit(run_branch, "kb", self._retrieve_from_knowledge_base, request.original_query): "kb",
+            self.executor.submit(run_branch, "api", self._call_external_api, request.intent, request.entities): "api",
+        }
+        use_web_search = bool(self.web_search_enabled and self.firecrawl_app)
+        if use_web_search:
+            future_map[self.executor.submit(run_branch, "web", self._generate_and_search_web, request.original_query, request.intent)] = "web"
+
+        overall_deadline = start_time + config.RETRIEVAL_TIMEOUT
+        if deadline is not None:
+            overall_deadline = min(overall_deadline, deadline)
+
+        def branch_deadline(future) -> float:
+            task_type = future_map[future]
+            started = branch_started.get(task_type)
+            if started is None:
+                return overall_deadline
+            return min(started + config.RETRIEVAL_SOURCE_DEADLINES.get(task_type, config.RETRIEVAL_TIMEOUT), overall_deadline)
+
+        source_status = {task_type: "pending" for task_type in future_map.values()}
+
+        # 3. 按完成顺序逐个处理结果；超过截止时间的分支被放弃，返回已有的部分结果
         kb_data = ""
+        kb_chunks = []
         web_data = ""
         api_data = {}
         media_assets = {}
         web_sources = []
     
-        for future in as_completed(futures, timeout=config.RETRIEVAL_TIMEOUT):
-            try:
-                result = future.result()
+        pending = set(future_map)
+        while pending:
+            now = time.monotonic()
+            deadlines = {future: branch_deadline(future) for future in pending}
+            expired = {future for future in pending if deadlines[future] <= now}
+            for future in expired:
+                future.cancel()
+                source_status[future_map[future]] = "timeout"
+                self.logger.warning(f"Session {request.session_id}: {future_map[future]} 检索超过截止时间，放弃该分支")
+            pending -= expired
+            if not pending:
+                break
+
+            wait_timeout = min(deadlines[future] for future in pending) - now
+            if any(future_map[future] not in branch_started for future in pending):
+                # 尚在排队的分支开始后会得到更早的截止时间，需要定期重新计算
+                wait_timeout = min(wait_timeout, 0.1)
+            done, _ = wait(pending, timeout=wait_timeout, return_when=FIRST_COMPLETED)
+            for future in done:
+                pending.discard(future)
                 task_type = future_map[future]
-            
+                try:
+                    result = future.result()
+                except Exception as e:
+                    source_status[task_type] = "error"
+                    self.logger.error(f"处理 {task_type} 任务失败: {e}", exc_info=True)
+                    continue
+                source_status[task_type] = "ok"
+                self.logger.info(f"Session {request.session_id}: {task_type} 检索完成，耗时 {time.monotonic() - start_time:.2f}s")
+
                 if task_type == "kb":
                     if isinstance(result, dict):
-                        kb_data = "\n".join([doc.get("content", "") for doc in result.get("data", [])])
-                        media_assets = result.get("media_assets", {})
+                        kb_chunks = result.get("data", [])
+                        kb_data = "\n".join([doc.get("content", "") for doc in kb_chunks])
+                        # 分支完成顺序不固定，合并而不是覆盖已有的媒体资源
+                        media_assets.update(result.get("media_assets", {}))
                     else:
                         kb_data = str(result)
-                    
+
                 elif task_type == "api":
                     api_data = result if isinstance(result, dict) else {}
                     if api_data and "image_url" in api_data:
@@ -351,45 +467,52 @@ class SportsRetrievalAgent:
                             "content": api_data["image_url"],
                             "description": "API返回图片"
                         }
-                        
+
                 elif task_type == "web":
                     if isinstance(result, dict):
                         web_data = "\n".join([doc.get("content", "") for doc in result.get("data", [])])
                         web_sources = result.get("sources", [])
                     else:
                         web_data = str(result)
-                    
-            except Exception as e:
-                self.logger.error(f"处理 {task_type} 任务失败: {e}", exc_info=True)
 
-        # 4. 智能结果整合（保持原有格式）
-        integrated_data = self._integrate_results(
-            user_query=request.original_query,
-            kb_data=kb_data,
-            web_data=web_data,
-            api_data=json.dumps(api_data)
-        )
+        # 4. 结果整合：只有多个来源需要合并时才调用整合LLM，单一来源直接透传
+        available = [name for name, value in (("kb", kb_data), ("web", web_data), ("api", api_data)) if value]
+        if len(available) > 1 and time.monotonic() < overall_deadline:
+            integrated_data = self._integrate_results(
+                user_query=request.original_query,
+                kb_data=kb_data,
+                web_data=web_data,
+                api_data=json.dumps(api_data, ensure_ascii=False)
+            )
+        else:
+            integrated_data = self._passthrough_results(kb_data, kb_chunks, web_data, api_data)
     
         # 5. 决定最终数据源优先级
         final_sources = self._get_sources(request.intent)
         if not kb_data and web_sources:  # 只有本地无结果且网络有结果时
             final_sources = ["网络检索"] + web_sources
         
-        return RetrievalResult(
+        result = RetrievalResult(
             session_id=request.session_id,
             data=integrated_data,
             media_assets=list(media_assets.values()),
             sources=final_sources,
-            cache_key=hashlib.md5(request.original_query.encode()).hexdigest(),
+            cache_key=cache_key,
             context={
                 "user_query": request.original_query,
                 "retrieved_kb_data": kb_data,
                 "retrieved_web_data": web_data,
                 "retrieved_api_data": api_data,
-                "is_web_fallback": bool(not kb_data and web_data)  # 新增标记
+                "is_web_fallback": bool(not kb_data and web_data),  # 新增标记
+                "source_status": source_status
             },
             use_web=use_web_search
         )
+
+        # 没有检索到任何内容或有分支超时/失败时不缓存，避免把临时故障固化为缓存结果
+        if (kb_data or web_data or api_data) and all(status == "ok" for status in source_status.values()):
+            self._cache_result(request, cache_key, result)
+        return result
     
     def _get_sources(self, intent: str) -> List[str]:
         # 示例来源映射
@@ -413,6 +536,21 @@ class SportsRetrievalAgent:
         self.executor.shutdown(wait=True)
 
 class APIManager:
+    """
+    外部API调用：
+    - 每个端点一个熔断器，连续失败后直接跳过，半开状态下单个请求探测恢复
+    - 请求耗时超过该端点历史 p95 时发出对冲请求，取先返回的结果
+    - 响应缓存：新鲜期内直接返回，过期但仍在陈旧期内时先返回旧值并在后台刷新
+    - 列表形式的端点并发请求，按 first_success（取最先成功的）或 merge（合并全部成功结果）返回
+    """
+
+    INTENT_API_KEYS = {
+        "facility_query": "facility_api_url",
+        "event_query": "event_api_url",
+        "course_info": "course_api_url",
+        "physical_test": "physical_test_api_url",
+    }
+
     def __init__(self):
         self.logger = logging.getLogger('APIManager')
         self.logger.setLevel(logging.INFO)
@@ -423,60 +561,463 @@ class APIManager:
             ))
             self.logger.addHandler(handler)
         self.api_configs = config.EXTERNAL_APIS
+        self.http = get_http_client()
+
+        self.resilience = config.EXTERNAL_API_RESILIENCE
+        self.executor = ThreadPoolExecutor(
+            max_workers=self.resilience["workers"],
+            thread_name_prefix="external-api"
+        )
+        # 列表端点的并发请求单独使用线程池，避免与对冲请求、后台刷新争用而互相等待
+        self.fanout_executor = ThreadPoolExecutor(
+            max_workers=self.resilience["workers"],
+            thread_name_prefix="external-api-fanout"
+        )
+        self._breakers: Dict[str, CircuitBreaker] = {}
+        self._latency: Dict[str, LatencyTracker] = {}
+        self._call_counts: Dict[str, Dict[str, int]] = {}
+        self._endpoint_lock = threading.Lock()
+
+        self._response_cache: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+        self._refreshing = set()
+        self._cache_lock = threading.Lock()
 
     def call_api(self, intent: str, entities: Dict[str, Any]) -> Dict[str, Any]:
-        api_url = None
-        if intent == "facility_query" and self.api_configs.get("facility_api_url"):
-            api_url = self.api_configs["facility_api_url"]
-        elif intent == "event_query" and self.api_configs.get("event_api_url"):
-            api_url = self.api_configs["event_api_url"]
-        elif intent == "course_info" and self.api_configs.get("course_api_url"):
-            api_url = self.api_configs["course_api_url"]
-        elif intent == "physical_test" and self.api_configs.get("physical_test_api_url"):
-            api_url = self.api_configs["physical_test_api_url"]
+        api_key = self.INTENT_API_KEYS.get(intent)
+        api_url = self.api_configs.get(api_key) if api_key else None
 
         if not api_url:
             self.logger.info(f"No external API configured for intent: {intent}")
             return {}
 
+        if not isinstance(api_url, list):
+            return self._safe_call_endpoint(api_url, entities) or {}
+
+        urls = list(dict.fromkeys(api_url))
+        if len(urls) == 1:
+            return self._safe_call_endpoint(urls[0], entities) or {}
+        mode = config.EXTERNAL_API_FANOUT.get(api_key, "first_success")
+        return self._fan_out(urls, entities, mode)
+
+    def _fan_out(self, urls: List[str], entities: Dict[str, Any], mode: str) -> Dict[str, Any]:
+        """并发请求多个端点，墙钟耗时约等于一次往返而不是 N 次"""
+        future_map = {
+            self.fanout_executor.submit(self._safe_call_endpoint, url, entities): url
+            for url in urls
+        }
+        results: Dict[str, Dict[str, Any]] = {}
+        pending = set(future_map)
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                data = future.result()
+                if not data:
+                    continue
+                if mode == "first_success":
+                    # 其余请求继续在后台完成并写入缓存，这里不再等待
+                    return {**data, "source": future_map[future]}
+                results[future_map[future]] = data
+
+        if not results:
+            return {}
+        # 按配置顺序合并，保证结果稳定
+        return {
+            "sources": [url for url in urls if url in results],
+            "results": [{**results[url], "source": url} for url in urls if url in results]
+        }
+
+    def _safe_call_endpoint(self, url: str, params: Dict[str, Any]) -> Optional[Dict[str, Any]]:
         try:
-            self.logger.info(f"Calling external API: {api_url} with entities: {entities}")
-            response = requests.get(api_url, params=entities, timeout=config.EXTERNAL_API_TIMEOUT)
-            response.raise_for_status()
-            return response.json()
+            self.logger.info(f"Calling external API: {url} with entities: {params}")
+            return self._call_endpoint(url, params)
+        except CircuitOpenError:
+            self.logger.warning(f"External API circuit open, skipped: {url}")
         except requests.exceptions.Timeout:
-            self.logger.error(f"External API call timed out: {api_url}")
-        except requests.exceptions.RequestException as e:
-            self.logger.error(f"Error calling external API {api_url}: {e}")
-        return {}
+            self.logger.error(f"External API call timed out: {url}")
+        except (requests.exceptions.RequestException, ValueError) as e:
+            self.logger.error(f"Error calling external API {url}: {e}")
+        return None
+
+    def _call_endpoint(self, url: str, params: Dict[str, Any]) -> Dict[str, Any]:
+        cache_key = f"{url}?{json.dumps(params, sort_keys=True, ensure_ascii=False, default=str)}"
+        cached = self._get_cached(cache_key)
+        if cached is not None:
+            age, data = cached
+            if age < self.resilience["cache_ttl"]:
+                return data
+            # 陈旧但仍可用：立即返回旧值，后台刷新
+            self._schedule_revalidate(url, params, cache_key)
+            return data
+
+        breaker = self._get_breaker(url)
+        if not breaker.allow_request():
+            raise CircuitOpenError(url)
+        try:
+            data = self._fetch(url, params)
+        except Exception:
+            breaker.record_failure()
+            self._count(url, "failures")
+            raise
+        breaker.record_success()
+        self._count(url, "successes")
+        self._store_cached(cache_key, data)
+        return data
+
+    def _fetch(self, url: str, params: Dict[str, Any]) -> Dict[str, Any]:
+        """请求耗时超过对冲延迟时再发一个相同请求，返回先成功的结果"""
+        hedge_delay = self._hedge_delay(url)
+        if hedge_delay is None:
+            return self._timed_get(url, params)
+
+        first = self.executor.submit(self._timed_get, url, params)
+        done, _ = wait([first], timeout=hedge_delay)
+        if done:
+            return first.result()
+
+        self.logger.info(f"External API {url} 超过 {hedge_delay:.2f}s 未返回，发出对冲请求")
+        pending = {first, self.executor.submit(self._timed_get, url, params)}
+        last_error: Exception = requests.exceptions.Timeout(f"Hedged calls timed out: {url}")
+        while pending:
+            done, pending = wait(pending, timeout=config.EXTERNAL_API_TIMEOUT, return_when=FIRST_COMPLETED)
+            if not done:
+                break
+            for future in done:
+                try:
+                    return future.result()
+                except Exception as e:
+                    last_error = e
+        raise last_error
+
+    def _timed_get(self, url: str, params: Dict[str, Any]) -> Dict[str, Any]:
+        start = time.monotonic()
+        response = self.http.get(url, params=params, timeout=config.EXTERNAL_API_TIMEOUT)
+        response.raise_for_status()
+        data = self._normalize_response(response)
+        self._get_latency(url).record(time.monotonic() - start)
+        return data
+
+    @staticmethod
+    def _normalize_response(response) -> Dict[str, Any]:
+        """
+        统一各端点的响应格式，始终返回字典：
+        JSON 对象原样返回，JSON 数组放入 items，其他 JSON 值放入 value，
+        非 JSON（如课程查询的 HTML 页面）去掉标签后放入 content。
+        """
+        try:
+            data = response.json()
+        except ValueError:
+            text = re.sub(r'<(script|style)[^>]*>.*?</\1>', ' ', response.text, flags=re.S | re.I)
+            text = re.sub(r'<[^>]+>', ' ', text)
+            text = re.sub(r'\s+', ' ', text).strip()
+            return {"content": text[:config.EXTERNAL_API_MAX_CONTENT_CHARS]} if text else {}
+        if isinstance(data, dict):
+            return data
+        if isinstance(data, list):
+            return {"items": data}
+        return {"value": data}
+
+    def _count(self, url: str, field: str):
+        with self._endpoint_lock:
+            counts = self._call_counts.setdefault(url, {"successes": 0, "failures": 0})
+            counts[field] += 1
+
+    def endpoint_stats(self) -> Dict[str, Dict[str, Any]]:
+        """各端点的调用次数、耗时分位和熔断状态"""
+        with self._endpoint_lock:
+            urls = set(self._breakers) | set(self._latency)
+            counts = {url: dict(self._call_counts.get(url, {"successes": 0, "failures": 0})) for url in urls}
+        return {
+            url: {
+                **counts[url],
+                "latency": self._get_latency(url).snapshot(),
+                "circuit": self._get_breaker(url).snapshot()
+            }
+            for url in sorted(urls)
+        }
+
+    def _hedge_delay(self, url: str) -> Optional[float]:
+        if not self.resilience["hedge_enabled"]:
+            return None
+        tracker = self._get_latency(url)
+        if len(tracker) < self.resilience["hedge_min_samples"]:
+            return None
+        return tracker.percentile(self.resilience["hedge_percentile"])
+
+    def _get_breaker(self, url: str) -> CircuitBreaker:
+        with self._endpoint_lock:
+            if url not in self._breakers:
+                self._breakers[url] = CircuitBreaker(
+                    url,
+                    failure_threshold=self.resilience["failure_threshold"],
+                    recovery_timeout=self.resilience["recovery_timeout"]
+                )
+            return self._breakers[url]
+
+    def _get_latency(self, url: str) -> LatencyTracker:
+        with self._endpoint_lock:
+            if url not in self._latency:
+                self._latency[url] = LatencyTracker(self.resilience["latency_window"])
+            return self._latency[url]
+
+    # ---------- 响应缓存（stale-while-revalidate） ----------
+    def _get_cached(self, cache_key: str) -> Optional[Tuple[float, Any]]:
+        with self._cache_lock:
+            entry = self._response_cache.get(cache_key)
+            if entry is None:
+                return None
+            age = time.monotonic() - entry[0]
+            if age >= self.resilience["stale_ttl"]:
+                del self._response_cache[cache_key]
+                return None
+            self._response_cache.move_to_end(cache_key)
+            return age, entry[1]
+
+    def _store_cached(self, cache_key: str, data: Any):
+        with self._cache_lock:
+            self._response_cache[cache_key] = (time.monotonic(), data)
+            self._response_cache.move_to_end(cache_key)
+            while len(self._response_cache) > self.resilience["cache_max_entries"]:
+                self._response_cache.popitem(last=False)
+
+    def _schedule_revalidate(self, url: str, params: Dict[str, Any], cache_key: str):
+        with self._cache_lock:
+            if cache_key in self._refreshing:
+                return
+            self._refreshing.add(cache_key)
+        self.executor.submit(self._revalidate, url, params, cache_key)
+
+    def _revalidate(self, url: str, params: Dict[str, Any], cache_key: str):
+        breaker = self._get_breaker(url)
+        try:
+            if not breaker.allow_request():
+                return
+            try:
+                data = self._timed_get(url, params)
+            except Exception as e:
+                breaker.record_failure()
+                self.logger.warning(f"后台刷新外部API缓存失败 {url}: {e}")
+                return
+            breaker.record_success()
+            self._store_cached(cache_key, data)
+        finally:
+            with self._cache_lock:
+                self._refreshing.discard(cache_key)
 
 
 class RetrievalBroker:
+    """
+    检索进程：以消费组方式从 Redis Stream 读取检索请求。
+    多个实例（多核或多机）共享同一消费组，请求在实例间负载均衡；
+    处理完成后才 XACK，进程崩溃时未确认的请求会被其他实例通过 XAUTOCLAIM 接管；
+    处理中的请求会定期续期（XCLAIM 自身），因此耗时较长的请求不会被误接管。
+    进程内请求分发到有界线程池并发处理，读取量受 RETRIEVAL_MAX_IN_FLIGHT 限制。
+    """
     def __init__(self, knowledge_loader):
         self.redis = redis.Redis(
             connection_pool=config.redis_pool,
             db=config.REDIS_DB_MAPPING["broker"]
         )
         self.retriever = SportsRetrievalAgent(knowledge_loader)
-        self.input_channel = config.RETRIEVAL_REQUEST_CHANNEL
-        self.output_result_prefix = config.RETRIEVAL_RESULT_PREFIX
+        self.broker = MessageBroker()
+        self.stream = config.RETRIEVAL_REQUEST_STREAM
+        self.group = config.RETRIEVAL_CONSUMER_GROUP
+        self.consumer_name = f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+        self.claim_idle_ms = config.RETRIEVAL_CLAIM_IDLE_MS
+
+        self.max_in_flight = max(1, config.RETRIEVAL_MAX_IN_FLIGHT)
+        self.request_deadline = config.RETRIEVAL_REQUEST_DEADLINE
+        self.executor = ThreadPoolExecutor(
+            max_workers=config.RETRIEVAL_WORKERS,
+            thread_name_prefix="retrieval-broker"
+        )
+        self._in_flight = 0
+        self._in_flight_ids = set()
+        self._capacity = threading.Condition()
+        self._server_clock_offset = 0.0
+
+    def _ensure_group(self):
+        try:
+            # 从头开始消费：消费组创建前已发布的请求（如 Web 服务先于检索进程启动）同样会被处理，
+            # 已超过截止时间的条目在 _handle_entry 中按条目ID的时间戳直接丢弃
+            self.redis.xgroup_create(self.stream, self.group, id="0", mkstream=True)
+            logger.info(f"已创建消费组 {self.group} (Stream: {self.stream})")
+        except redis.exceptions.ResponseError as e:
+            if "BUSYGROUP" not in str(e):
+                raise
 
     def start_listening(self):
-        pubsub = self.redis.pubsub()
-        pubsub.subscribe(self.input_channel)
-        
-        logger.info(f"RetrievalBroker 正在监听频道: {self.input_channel}")
-        for message in pubsub.listen():
-            if message['type'] == 'message':
-                try:
-                    request = RetrievalRequest(**json.loads(message['data']))
-                    logger.info(f"RetrievalBroker 收到请求: Session {request.session_id}")
-                    result = self.retriever.retrieve(request)
-                    
-                    self.redis.publish(
-                        f"{self.output_result_prefix}{request.session_id}",
-                        result.model_dump_json()
-                    )
-                    logger.info(f"RetrievalBroker 已发布结果: Session {request.session_id}")
-                except Exception as e:
-                    logger.error(f"RetrievalBroker 处理消息失败: {e}", exc_info=True)
\ No newline at end of file
+        self._ensure_group()
+        logger.info(f"RetrievalBroker {self.consumer_name} 正在消费: {self.stream} (消费组: {self.group})")
+
+        # 续期和接管的间隔取空闲阈值的一半，保证处理中的请求在被判定为空闲之前已续期
+        claim_interval = self.claim_idle_ms / 2000
+        last_claim = 0.0
+        while True:
+            try:
+                free_slots = self._wait_for_capacity()
+
+                if time.time() - last_claim >= claim_interval:
+                    self._sync_server_clock()
+                    self._publish_stats()
+                    self._renew_in_flight()
+                    self._reclaim_pending(free_slots)
+                    last_claim = time.time()
+                    free_slots = self._wait_for_capacity()
+
+                entries = self.redis.xreadgroup(
+                    self.group,
+                    self.consumer_name,
+                    {self.stream: ">"},
+                    count=free_slots,
+                    block=max(1, int(claim_interval * 1000))
+                )
+                for _, messages in entries or []:
+                    for message_id, fields in messages:
+                        self._dispatch(message_id, fields)
+            except redis.exceptions.ResponseError as e:
+                # Stream 或消费组被删除时重新创建
+                if "NOGROUP" in str(e):
+                    self._ensure_group()
+                else:
+                    logger.error(f"RetrievalBroker 读取请求失败: {e}", exc_info=True)
+                    time.sleep(1)
+            except Exception as e:
+                logger.error(f"RetrievalBroker 读取请求失败: {e}", exc_info=True)
+                time.sleep(1)
+
+    def _wait_for_capacity(self) -> int:
+        """阻塞直到有空闲处理槽位，返回当前空闲槽位数；等待期间仍按间隔续期处理中的请求"""
+        with self._capacity:
+            while self._in_flight >= self.max_in_flight:
+                if not self._capacity.wait(timeout=self.claim_idle_ms / 2000):
+                    self._capacity.release()
+                    try:
+                        self._renew_in_flight()
+                        self._publish_stats()
+                    finally:
+                        self._capacity.acquire()
+            return self.max_in_flight - self._in_flight
+
+    def _dispatch(self, message_id, fields: Dict[Any, Any]):
+        with self._capacity:
+            self._in_flight += 1
+            self._in_flight_ids.add(message_id)
+        try:
+            self.executor.submit(self._run_entry, message_id, fields)
+        except Exception:
+            self._release_slot(message_id)
+            raise
+
+    def _run_entry(self, message_id, fields: Dict[Any, Any]):
+        try:
+            self._handle_entry(message_id, fields)
+        finally:
+            self._release_slot(message_id)
+
+    def _release_slot(self, message_id):
+        with self._capacity:
+            self._in_flight -= 1
+            self._in_flight_ids.discard(message_id)
+            self._capacity.notify()
+
+    def _renew_in_flight(self):
+        """对本实例处理中的请求执行 XCLAIM，重置其空闲时间，避免被其他实例当作崩溃遗留的请求接管"""
+        with self._capacity:
+            message_ids = list(self._in_flight_ids)
+        if not message_ids:
+            return
+        try:
+            self.redis.xclaim(
+                self.stream,
+                self.group,
+                self.consumer_name,
+                min_idle_time=0,
+                message_ids=message_ids,
+                justid=True
+            )
+        except redis.exceptions.ResponseError as e:
+            logger.warning(f"RetrievalBroker 续期处理中的请求失败: {e}")
+
+    def _reclaim_pending(self, count: int):
+        try:
+            claimed = self.redis.xautoclaim(
+                self.stream,
+                self.group,
+                self.consumer_name,
+                min_idle_time=self.claim_idle_ms,
+                start_id="0-0",
+                count=count
+            )
+        except redis.exceptions.ResponseError as e:
+            logger.warning(f"RetrievalBroker 接管未确认请求失败: {e}")
+            return
+
+        messages = claimed[1] if claimed and len(claimed) > 1 else []
+        if messages:
+            logger.info(f"RetrievalBroker 接管了 {len(messages)} 个未确认的请求")
+        for message_id, fields in messages:
+            if fields:  # 已被裁剪的条目只返回ID
+                self._dispatch(message_id, fields)
+
+    def _publish_stats(self):
+        """
+        上报本实例的外部API端点统计：实际处理请求的是检索进程内的 APIManager，
+        Web 服务的 /metrics 从 Redis 读取各实例上报的数据。键会过期，已退出的实例自动消失。
+        """
+        try:
+            self.redis.setex(
+                f"{config.RETRIEVAL_BROKER_STATS_PREFIX}{self.consumer_name}",
+                max(30, int(self.claim_idle_ms / 1000 * 4)),
+                json.dumps(self.retriever.api_manager.endpoint_stats(), ensure_ascii=False, default=str)
+            )
+        except Exception as e:
+            logger.warning(f"RetrievalBroker 上报端点统计失败: {e}")
+
+    def _sync_server_clock(self):
+        """记录 Redis 服务端时钟与本机时钟的差值，用于换算条目ID中的时间戳"""
+        try:
+            seconds, microseconds = self.redis.time()
+            self._server_clock_offset = seconds + microseconds / 1e6 - time.time()
+        except Exception as e:
+            logger.warning(f"RetrievalBroker 读取 Redis 服务端时间失败: {e}")
+
+    def _entry_age(self, message_id) -> float:
+        """条目ID形如 <毫秒时间戳>-<序号>，时间戳由 Redis 服务端在 XADD 时分配"""
+        if isinstance(message_id, bytes):
+            message_id = message_id.decode()
+        created = int(str(message_id).split("-", 1)[0]) / 1000
+        return time.time() + self._server_clock_offset - created
+
+    def _handle_entry(self, message_id, fields: Dict[Any, Any]):
+        try:
+            payload = fields.get("payload") or fields.get(b"payload")
+            request = RetrievalRequest(**json.loads(payload))
+            logger.info(f"RetrievalBroker 收到请求: Session {request.session_id}")
+
+            # 等待方已超时放弃的请求不再处理，避免积压时继续浪费检索资源。
+            # 请求年龄按条目ID中由 Redis 服务端分配的毫秒时间戳计算，不受各进程之间时钟偏差影响
+            age = self._entry_age(message_id)
+            remaining = self.request_deadline - age
+            if remaining <= 0:
+                logger.warning(f"RetrievalBroker 丢弃过期请求: Session {request.session_id} (已等待 {age:.1f} 秒)")
+                return
+
+            deadline = time.monotonic() + remaining
+            result = self.retriever.retrieve(request, deadline=deadline)
+            if time.monotonic() > deadline:
+                logger.warning(f"RetrievalBroker 检索完成时等待方已超时，不再发布结果: Session {request.session_id}")
+                return
+
+            self.broker.publish_retrieval_result(result)
+            logger.info(f"RetrievalBroker 已发布结果: Session {request.session_id}")
+        except Exception as e:
+            logger.error(f"RetrievalBroker 处理消息失败: {e}", exc_info=True)
+        finally:
+            # 处理失败的请求同样确认，避免毒消息被反复接管；等待方会按超时降级
+            self.redis.xack(self.stream, self.group, message_id)
+
+
+if __name__ == "__main__":
+    # 独立运行检索进程：python -m modules.info_retrieval
+    # 配合 RETRIEVAL_EMBEDDED_BROKER=false，可在多核或多台机器上启动多个实例
+    RetrievalBroker(KnowledgeLoader()).start_listening()
@@ -8,9 +8,14 @@ import re
 import redis
 import requests
 import unicodedata
+import base64
+import numpy as np
 import time 
+import threading
 from typing import Optional, Any, Dict, List, Tuple
+from collections import deque
 from time import perf_counter
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 from datetime import datetime
 from functools import wraps
 from dotenv import load_dotenv
@@ -24,6 +29,9 @@ from camel.types import ModelPlatformType, RoleType # 重新添加 ModelPlatform
 from camel.agents import ChatAgent
 from camel.messages import BaseMessage
 from infrastructure.shared_schemas import IntentExtractionResult, RetrievalRequest
+from infrastructure.http_client import get_http_client
+from infrastructure.keyword_automaton import KeywordAutomaton, score_matches
+from infrastructure.llm_gateway import get_llm_gateway
 
 load_dotenv(dotenv_path='.env.development')
 
@@ -39,20 +47,197 @@ if not logger.handlers:
 
 # ---------- SecurityFilter 类定义 ----------
 class SecurityFilter:
+    """
+    敏感词过滤：合并配置中的 banned_keywords 和 keyword_blocklist_path 指向的屏蔽词文件，
+    预编译为多模式匹配自动机，对输入只做一次扫描；屏蔽词文件修改后自动重新加载。
+    屏蔽词文件可以是 JSON 数组，也可以是 {"banned_keywords": [...]}。
+    """
     def __init__(self):
-        self.banned_keywords = config.HYPER_PARAMS["security"].get("banned_keywords", [])
-        self.max_length = config.HYPER_PARAMS["security"].get("max_input_length", 200)
+        security_params = config.HYPER_PARAMS["security"]
+        self.inline_keywords = security_params.get("banned_keywords", [])
+        self.max_length = security_params.get("max_query_length", security_params.get("max_input_length", 200))
+        self.blocklist_path = security_params.get("keyword_blocklist_path")
+        self.reload_interval = security_params.get("blocklist_reload_interval", 5)
+
+        self._reload_lock = threading.Lock()
+        self._blocklist_mtime: Optional[float] = None
+        self._last_check = 0.0
+        self.banned_keywords: List[str] = []
+        self._automaton = KeywordAutomaton()
+        self._reload()
+
+    def _load_blocklist_file(self) -> List[str]:
+        if not self.blocklist_path or not os.path.exists(self.blocklist_path):
+            return []
+        try:
+            with open(self.blocklist_path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            if isinstance(data, dict):
+                data = data.get("banned_keywords", [])
+            return [str(keyword) for keyword in data if str(keyword).strip()]
+        except Exception as e:
+            logger.error(f"读取屏蔽词文件失败 {self.blocklist_path}: {e}")
+            return []
+
+    def _reload(self):
+        self._blocklist_mtime = self._get_blocklist_mtime()
+        keywords = list(dict.fromkeys(self.inline_keywords + self._load_blocklist_file()))
+        # 整体替换引用，正在进行的匹配继续使用旧自动机
+        self._automaton = KeywordAutomaton((keyword, keyword) for keyword in keywords)
+        self.banned_keywords = keywords
+        logger.info(f"已加载 {len(keywords)} 个屏蔽词。")
+
+    def _get_blocklist_mtime(self) -> Optional[float]:
+        try:
+            return os.path.getmtime(self.blocklist_path) if self.blocklist_path else None
+        except OSError:
+            return None
+
+    def _maybe_reload(self):
+        now = time.monotonic()
+        if now - self._last_check < self.reload_interval:
+            return
+        # 只允许一个线程检查和重建，其他线程继续使用当前自动机
+        if not self._reload_lock.acquire(blocking=False):
+            return
+        try:
+            self._last_check = now
+            if self._get_blocklist_mtime() != self._blocklist_mtime:
+                logger.info(f"屏蔽词文件已变化，重新加载: {self.blocklist_path}")
+                self._reload()
+        finally:
+            self._reload_lock.release()
 
     def is_safe(self, text: str) -> bool:
         if len(text) > self.max_length:
             logger.warning(f"用户输入超出最大长度限制: {self.max_length} 字符。")
             return False
-        for keyword in self.banned_keywords:
-            if keyword.lower() in text.lower():
-                logger.warning(f"检测到禁用关键词: '{keyword}'。")
-                return False
+        self._maybe_reload()
+        keyword = self._automaton.find_first(text)
+        if keyword is not None:
+            logger.warning(f"检测到禁用关键词: '{keyword}'。")
+            return False
         return True
     
+# ---------- EmbeddingIntentClassifier 类定义 ----------
+class EmbeddingIntentClassifier:
+    """
+    本地向量意图分类：用已加载的嵌入模型编码查询，与各意图质心做余弦相似度比较。
+    质心由 INTENT_TYPES 中的 examples 和 Redis 中累积的已标注查询向量共同计算；
+    内存中的标注向量与 Redis 一样只保留最近 history_size 条，淘汰的向量从质心中减去。
+    只有最近质心足够相似、且与次近质心拉开差距时才给出结果，否则交给LLM。
+    """
+    HISTORY_KEY = "intent_history:{intent}"
+
+    def __init__(self, embed_fn, redis_client: redis.Redis):
+        intent_params = config.HYPER_PARAMS["intent"]
+        self.embed_fn = embed_fn
+        self.redis = redis_client
+        self.min_similarity = intent_params["embedding_min_similarity"]
+        self.min_margin = intent_params["embedding_min_margin"]
+        self.history_size = intent_params["embedding_history_size"]
+
+        self._lock = threading.Lock()
+        # 每个意图的向量和与样本数，质心 = 归一化(向量和)
+        self._sums: Dict[str, np.ndarray] = {}
+        self._counts: Dict[str, int] = {}
+        # 每个意图最近的标注向量（旧的在左），与 Redis 中的历史列表保持同一窗口
+        self._history: Dict[str, deque] = {}
+        self._intents: List[str] = []
+        self._centroids: Optional[np.ndarray] = None
+        self._load()
+
+    def _embed(self, text: str) -> np.ndarray:
+        vector = np.asarray(self.embed_fn(text), dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def _load(self):
+        for intent_name, intent_data in config.INTENT_TYPES.items():
+            if intent_name == "unrecognized_intent":
+                continue
+            for example in intent_data.get("examples", []):
+                self._accumulate(intent_name, self._embed(example))
+            # Redis 列表最新的在前，按从旧到新的顺序放入窗口
+            for data in reversed(self._load_history(intent_name)):
+                self._remember(intent_name, np.frombuffer(base64.b64decode(data), dtype=np.float32))
+        self._rebuild_centroids()
+        logger.info(f"向量意图分类器已加载 {len(self._intents)} 个意图质心，共 {sum(self._counts.values())} 个样本。")
+
+    def _load_history(self, intent_name: str) -> List[bytes]:
+        try:
+            return self.redis.lrange(self.HISTORY_KEY.format(intent=intent_name), 0, self.history_size - 1)
+        except Exception as e:
+            logger.warning(f"读取意图标注历史失败 ({intent_name}): {e}")
+            return []
+
+    def _accumulate(self, intent_name: str, vector: np.ndarray):
+        if intent_name in self._sums:
+            self._sums[intent_name] = self._sums[intent_name] + vector
+        else:
+            self._sums[intent_name] = vector.copy()
+        self._counts[intent_name] = self._counts.get(intent_name, 0) + 1
+
+    def _remember(self, intent_name: str, vector: np.ndarray):
+        """把标注向量加入窗口；窗口已满时先从向量和中减去最旧的一条"""
+        history = self._history.setdefault(intent_name, deque(maxlen=self.history_size))
+        if self.history_size <= 0:
+            return
+        if len(history) == history.maxlen:
+            evicted = history.popleft()
+            self._sums[intent_name] = self._sums[intent_name] - evicted
+            self._counts[intent_name] -= 1
+        history.append(vector)
+        self._accumulate(intent_name, vector)
+
+    def _rebuild_centroids(self):
+        intents = list(self._sums)
+        if not intents:
+            self._intents, self._centroids = [], None
+            return
+        centroids = np.stack([self._sums[name] for name in intents])
+        norms = np.linalg.norm(centroids, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        self._intents, self._centroids = intents, centroids / norms
+
+    def classify(self, text: str) -> Optional[Dict[str, Any]]:
+        """返回 {"intent", "confidence", "similarity", "margin"}；置信不足时返回 None"""
+        with self._lock:
+            intents, centroids = self._intents, self._centroids
+        if centroids is None:
+            return None
+
+        similarities = centroids @ self._embed(text)
+        order = np.argsort(similarities)[::-1]
+        best = float(similarities[order[0]])
+        margin = best - float(similarities[order[1]]) if len(order) > 1 else best
+        logger.debug(f"向量意图分类: {intents[order[0]]} (相似度 {best:.3f}, 差距 {margin:.3f})")
+        if best < self.min_similarity or margin < self.min_margin:
+            return None
+        return {
+            "intent": intents[order[0]],
+            "confidence": max(0.0, min(1.0, best)),
+            "similarity": best,
+            "margin": margin
+        }
+
+    def learn(self, text: str, intent_name: str):
+        """把高置信度的识别结果加入标注历史，并更新对应质心"""
+        if intent_name not in config.INTENT_TYPES or intent_name == "unrecognized_intent":
+            return
+        vector = self._embed(text)
+        try:
+            key = self.HISTORY_KEY.format(intent=intent_name)
+            pipe = self.redis.pipeline()
+            pipe.lpush(key, base64.b64encode(vector.tobytes()).decode('ascii'))
+            pipe.ltrim(key, 0, self.history_size - 1)
+            pipe.execute()
+        except Exception as e:
+            logger.warning(f"保存意图标注历史失败 ({intent_name}): {e}")
+        with self._lock:
+            self._remember(intent_name, vector)
+            self._rebuild_centroids()
+
 # ---------- 装饰器定义 ----------
 def log_execution_time(func):
     """记录函数执行时间的装饰器。"""
@@ -67,10 +252,12 @@ def log_execution_time(func):
 
 # ---------- IntentExtractor 类定义 ----------
 class IntentExtractor:
-    def __init__(self, agent: ChatAgent): # 明确指定 agent 类型
-        self.agent = agent  # 这是 CamelAgent 实例
+    def __init__(self, agent: Optional[ChatAgent] = None, embedder=None):
+        self.agent = agent  # 兼容旧的调用方式，意图识别不再使用代理的对话记忆
+        self.llm_gateway = get_llm_gateway()
         self.logger = logging.getLogger('intent_extractor')
         self.security_filter = SecurityFilter()
+        self.keyword_automaton = self._build_keyword_automaton()
         self.redis = redis.Redis(connection_pool=config.redis_pool, db=config.REDIS_DB_MAPPING["intent"])
         self.cache_expiry = config.HYPER_PARAMS["cache"]["intent_expiry"]
         # 用于缓存LLM意图识别结果，避免重复调用
@@ -79,6 +266,18 @@ class IntentExtractor:
             db=config.REDIS_DB_MAPPING["intent"], # 使用意图识别专用DB
             decode_responses=True
         )
+        # LLM 与外部API两个远程识别分支并发执行
+        self.tier_executor = ThreadPoolExecutor(
+            max_workers=config.HYPER_PARAMS["intent"]["tier_workers"],
+            thread_name_prefix="intent-tier"
+        )
+        # 本地向量意图分类（embedder 为已加载嵌入模型的 KnowledgeLoader，复用其查询向量缓存）
+        self.intent_classifier: Optional[EmbeddingIntentClassifier] = None
+        if embedder is not None and config.HYPER_PARAMS["intent"]["embedding_enabled"]:
+            try:
+                self.intent_classifier = EmbeddingIntentClassifier(embedder.embed_query, self.redis)
+            except Exception as e:
+                self.logger.error(f"向量意图分类器初始化失败，将直接使用LLM识别: {e}")
 
     def _build_prompt(self, text: str, context: Dict[str, Any]) -> str:
         """
@@ -92,65 +291,28 @@ class IntentExtractor:
         )
         return system_prompt
 
-    def _check_local_rules(self, text: str) -> Optional[Dict[str, Any]]:
-        """根据预设关键词规则进行意图识别（优先级高于LLM）"""
-        for intent_name, intent_data in config.INTENT_TYPES.items():
-            keywords = intent_data.get("keywords", [])
-            if any(kw.lower() in text.lower() for kw in keywords):
-                return {
-                    "intent": intent_name,
-                    "confidence": 0.9,  # 本地规则高置信度
-                    "entities": {},
-                    "source": "local_rules"
-            }
-        return None
-
-    def _call_llm(self, session_id: str, system_prompt: str, user_query: str) -> str:
+    def _call_llm(self, session_id: str, system_prompt: str, user_query: str) -> Optional[str]:
         """
         调用大型语言模型进行意图识别。
+        系统提示词和用户消息在同一次请求中发送，不使用共享代理的对话记忆，可在多个工作线程中并发调用；
+        启用 JSON 模式时要求模型直接输出 JSON 对象。调用失败或没有返回内容时返回 None。
         """
         self.logger.info(f"Session {session_id}: 调用LLM进行意图识别...")
-        
-        # CamelAgent需要BaseMessage
-        sys_msg = BaseMessage(
-            role_name="System", 
-            role_type=RoleType.ASSISTANT, 
-            content=system_prompt,
-            meta_dict={  # 添加必要的meta_dict参数
-                "module": "intent_extractor",
-                "session_id": session_id,
-                "timestamp": datetime.now().isoformat()
-            }
-        )
-
-        usr_msg = BaseMessage(
-            role_name="User", 
-            role_type=RoleType.USER, 
-            content=user_query,
-            meta_dict={  # 添加必要的meta_dict参数
-                "module": "intent_extractor",
-                "session_id": session_id,
-                "timestamp": datetime.now().isoformat()
-            }
-        )
+        overrides = {"response_format": {"type": "json_object"}} if config.HYPER_PARAMS["intent"]["json_mode"] else {}
+        try:
+            llm_response_content = self.llm_gateway.complete("intent", [
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": user_query}
+            ], **overrides)
+        except Exception as e:
+            self.logger.error(f"Session {session_id}: LLM意图识别调用失败: {e}")
+            return None
 
-        # 重置agent，确保每次新的对话从干净状态开始
-        self.agent.reset()
-        
-        # 发送系统消息
-        self.agent.step(sys_msg) 
-        
-        # 发送用户消息并获取响应
-        response = self.agent.step(usr_msg)
-        
-        # 处理响应 - 适应新的ChatAgentResponse对象
-        if response and hasattr(response, 'msg'):
-            llm_response_content = response.msg.content
-            self.logger.info(f"Session {session_id}: LLM原始响应: {llm_response_content[:200]}...")
-            return llm_response_content
-        else:
+        if not llm_response_content:
             self.logger.error(f"Session {session_id}: LLM没有返回有效响应。")
-            return ""
+            return None
+        self.logger.info(f"Session {session_id}: LLM原始响应: {llm_response_content[:200]}...")
+        return llm_response_content
 
     def safe_parse_json(self, session_id: str, text: str) -> Optional[Dict[str, Any]]:
         """安全地解析JSON字符串，如果失败则返回None并记录错误。"""
@@ -245,24 +407,51 @@ class IntentExtractor:
             self.logger.warning(f"Session {session_id}: 获取缓存LLM意图结果失败或缓存无效: {e}")
             return None
 
+    @staticmethod
+    def _build_keyword_automaton() -> KeywordAutomaton:
+        """由 INTENT_TYPES 的关键词构建一次匹配自动机，附加数据为所属意图"""
+        return KeywordAutomaton(
+            (keyword, intent_name)
+            for intent_name, intent_data in config.INTENT_TYPES.items()
+            # 排除不需要本地规则匹配的意图，例如 unrecognized_intent, retrieval
+            if intent_name not in ("unrecognized_intent", "retrieval")
+            for keyword in intent_data.get("keywords", [])
+        )
+
     def _check_local_rules(self, text: str) -> Optional[Dict[str, Any]]:
         """
-        根据预设的关键词规则进行意图识别。
-        优先级高于LLM识别，如果命中则直接返回。
+        根据预设的关键词规则进行意图识别，一次线性扫描得到所有命中的关键词及位置。
+        每个意图的得分为其命中的不同关键词长度之和（越长的关键词越具体），
+        置信度由最高分在总分中的占比决定，只有明显占多数的意图才能达到阈值；
+        最高分并列或多个意图得分接近时返回 None，交给后续策略判断。
         """
-        for intent_name, intent_data in config.INTENT_TYPES.items():
-            # 排除不需要本地规则匹配的意图，例如 unrecognized_intent, retrieval
-            if intent_name in ["unrecognized_intent", "retrieval"]:
-                continue
+        matches = self.keyword_automaton.find_all(text)
+        if not matches:
+            self.logger.debug("本地匹配：未找到匹配的意图。")
+            return None
 
-            keywords = intent_data.get("keywords", [])
-            for keyword in keywords:
-                # 假设关键词匹配不区分大小写
-                if keyword.lower() in text.lower():
-                    self.logger.debug(f"本地匹配：通过关键词 '{keyword}' 匹配到意图: {intent_name}")
-                    return {"intent": intent_name, "confidence": 0.85, "entities": {}, "source": "local_rules"}
-        self.logger.debug("本地匹配：未找到匹配的意图。")
-        return None
+        scored = score_matches(matches)
+        if scored is None:
+            self.logger.debug("本地匹配：多个意图得分并列，交给后续策略判断。")
+            return None
+        best_intent, share, scores = scored
+        # 单一意图命中时为 0.9，占比约一半时低于 local_match_threshold(0.7)
+        confidence = round(0.45 + 0.45 * share, 2)
+        self.logger.debug(f"本地匹配：意图得分 {scores}，选择 {best_intent} (Confidence: {confidence:.2f})")
+
+        if confidence < config.HYPER_PARAMS["intent"]["local_match_threshold"]:
+            return None
+        return {
+            "intent": best_intent,
+            "confidence": confidence,
+            "entities": {},
+            "source": "local_rules",
+            "scores": scores,
+            "matches": [
+                {"keyword": m["keyword"], "intent": m["payload"], "start": m["start"], "end": m["end"]}
+                for m in matches
+            ]
+        }
 
     def _query_online_api(self, text: str) -> Optional[Dict[str, Any]]:
         """
@@ -274,7 +463,7 @@ class IntentExtractor:
             
         try:
             self.logger.info(f"尝试调用外部意图API: {config.INTENT_API_URL}")
-            resp = requests.post(
+            resp = get_http_client().post(
                 config.INTENT_API_URL,
                 json={"text": text},
                 timeout=config.INTENT_TIMEOUT
@@ -297,10 +486,96 @@ class IntentExtractor:
             self.logger.error(f"调用外部意图API时发生未知错误: {e}")
         return None
 
+    def _llm_tier(self, session_id: str, cleaned_text: str) -> Optional[IntentExtractionResult]:
+        """LLM调用失败时返回 None，与超时一样视为没有结果，不会被当作模型给出的判断缓存"""
+        system_prompt = self._build_prompt(text=cleaned_text, context={})
+        llm_response_content = self._call_llm(session_id, system_prompt, cleaned_text)
+        if llm_response_content is None:
+            return None
+        # 处理LLM响应，即使是无效JSON也会返回一个IntentExtractionResult
+        return self._process_llm_response(session_id, llm_response_content)
+
+    def _is_confident_api_result(self, api_result: Optional[Dict[str, Any]]) -> bool:
+        return bool(api_result and api_result.get("intent")
+                    and api_result.get("confidence", 0.0) >= config.HYPER_PARAMS["intent"]["api_confidence_threshold"])
+
+    def _is_confident_llm_result(self, llm_result: Optional[IntentExtractionResult]) -> bool:
+        return bool(llm_result and llm_result.confidence >= config.HYPER_PARAMS["intent"]["llm_confidence_threshold"])
+
+    def _run_remote_tiers(self, session_id: str, cleaned_text: str) -> Tuple[Optional[IntentExtractionResult], Optional[Dict[str, Any]], bool]:
+        """
+        并发执行LLM识别和外部API识别，返回 (LLM结果, API结果, 是否全部完成)，未完成的一方为 None；
+        有分支超时或被放弃时“是否全部完成”为 False。
+        - 外部API优先级更高：它先返回可信结果时立即放弃LLM
+        - LLM先返回可信结果时，最多再等待 api_grace_period 秒
+        - 两者都不可信时等到各自完成或到达总截止时间
+        """
+        intent_params = config.HYPER_PARAMS["intent"]
+        start = time.monotonic()
+        deadline = start + intent_params["tier_deadline"]
+
+        llm_future = self.tier_executor.submit(self._llm_tier, session_id, cleaned_text)
+        api_future = None
+        if config.WEB_SEARCH_ENABLED and config.INTENT_API_URL:
+            api_future = self.tier_executor.submit(self._query_online_api, cleaned_text)
+
+        llm_result, api_result = None, None
+        llm_done_at = start
+        pending = {future for future in (llm_future, api_future) if future is not None}
+        while pending:
+            now = time.monotonic()
+            if now >= deadline:
+                break
+            wait_until = deadline
+            if llm_future not in pending and self._is_confident_llm_result(llm_result):
+                wait_until = min(deadline, llm_done_at + intent_params["api_grace_period"])
+                if now >= wait_until:
+                    break
+
+            done, pending = wait(pending, timeout=wait_until - now, return_when=FIRST_COMPLETED)
+            for future in done:
+                try:
+                    result = future.result()
+                except Exception as e:
+                    self.logger.error(f"Session {session_id}: 意图识别分支执行失败: {e}")
+                    continue
+                if future is api_future:
+                    api_result = result
+                else:
+                    llm_result = result
+                    llm_done_at = time.monotonic()
+
+            if api_future is not None and api_future not in pending and self._is_confident_api_result(api_result):
+                if llm_future in pending:
+                    # 外部API已给出可信结果，放弃等待LLM（已发出的请求在后台完成后被丢弃）
+                    llm_future.cancel()
+                    self.logger.info(f"Session {session_id}: 外部API已返回可信意图，放弃LLM识别。")
+                break
+
+        for future in pending:
+            future.cancel()
+        if llm_future in pending and api_result is None:
+            self.logger.warning(f"Session {session_id}: 意图识别超过截止时间 {intent_params['tier_deadline']}s。")
+        self.logger.info(f"Session {session_id}: 远程意图识别耗时 {time.monotonic() - start:.2f}s")
+        return llm_result, api_result, not pending
+
+    def _is_cacheable_result(self,
+                             llm_result: Optional[IntentExtractionResult],
+                             api_result: Optional[Dict[str, Any]],
+                             tiers_complete: bool) -> bool:
+        """
+        只缓存由实际完成的识别分支得出的结论：
+        采用了可信的外部API或LLM结果时可以缓存；回退为 unrecognized_intent 时，
+        只有全部分支都已完成且LLM确实给出了结果才缓存，超时、放弃或调用失败造成的结论不缓存。
+        """
+        if self._is_confident_api_result(api_result) or self._is_confident_llm_result(llm_result):
+            return True
+        return tiers_complete and llm_result is not None
+
     def _apply_fallback_strategies(self, 
                                    session_id: str, 
                                    user_input: str, 
-                                   camel_result: IntentExtractionResult, # 确保这是 IntentExtractionResult 对象
+                                   camel_result: Optional[IntentExtractionResult], # LLM超时或被放弃时为 None
                                    local_result: Optional[Dict[str, Any]],
                                    api_result: Optional[Dict[str, Any]]) -> IntentExtractionResult:
         """
@@ -318,7 +593,7 @@ class IntentExtractor:
             )
 
         # 2. 其次考虑外部API结果（如果启用且置信度满足要求）
-        if api_result and api_result.get("intent") and api_result.get("confidence", 0.0) >= config.HYPER_PARAMS["intent"]["api_min_confidence"]:
+        if self._is_confident_api_result(api_result):
             self.logger.info(f"Session {session_id}: 采用外部API意图: {api_result['intent']} (Confidence: {api_result['confidence']:.2f})")
             return IntentExtractionResult(
                 session_id=session_id,
@@ -377,29 +652,29 @@ class IntentExtractor:
         if cached_llm_result:
             return cached_llm_result
 
-        # 3. 本地规则匹配 (高优先级)
-        local_intent_result = self._check_local_rules(cleaned_text)
-        if local_intent_result:
-            final_result = IntentExtractionResult(
-                session_id=session_id,
-                intent=local_intent_result['intent'],
-                entities=local_intent_result.get('entities', {}),
-                confidence=local_intent_result['confidence']
-            )
-            self._cache_llm_result(session_id, user_input_hash, final_result) # 缓存本地匹配结果
-            return final_result
+        # 3. 本地向量意图分类，置信度足够时不再调用LLM
+        if self.intent_classifier:
+            try:
+                classified = self.intent_classifier.classify(cleaned_text)
+            except Exception as e:
+                self.logger.warning(f"Session {session_id}: 向量意图分类失败: {e}")
+                classified = None
+            if classified:
+                self.logger.info(f"Session {session_id}: 向量意图分类结果: {classified['intent']} (相似度 {classified['similarity']:.3f})")
+                final_result = IntentExtractionResult(
+                    session_id=session_id,
+                    intent=classified["intent"],
+                    entities={},
+                    confidence=classified["confidence"],
+                    context={"source": "embedding_classifier", "margin": classified["margin"]}
+                )
+                self._cache_llm_result(session_id, user_input_hash, final_result)
+                return final_result
 
-        # 4. LLM 意图识别
-        system_prompt = self._build_prompt(text=cleaned_text, context={})
-        llm_response_content = self._call_llm(session_id, system_prompt, cleaned_text)
-        
-        # 处理LLM响应，即使是无效JSON也会返回一个IntentExtractionResult
-        camel_llm_result = self._process_llm_response(session_id, llm_response_content)
-
-        # 5. 外部API意图识别 (中优先级)
-        api_intent_result = self._query_online_api(cleaned_text)
+        # 4. LLM 与外部API意图识别并发进行，外部API给出可信结果时不再等待LLM
+        camel_llm_result, api_intent_result, tiers_complete = self._run_remote_tiers(session_id, cleaned_text)
 
-        # 6. 应用回退策略
+        # 5. 应用回退策略
         final_result = self._apply_fallback_strategies(
             session_id, 
             user_input, # 传递原始用户输入，如果_apply_fallback_strategies需要
@@ -414,6 +689,19 @@ class IntentExtractor:
         # 如果是LLM识别，`source` 默认为空，所以这里需要修改判断逻辑
         # 或者在 IntentExtractionResult 中明确定义 source
         # 为避免引入新的复杂性，且LLM识别是默认或回退方案，我们直接缓存最终结果。
-        self._cache_llm_result(session_id, user_input_hash, final_result)
+        # 分支超时、被放弃或LLM调用失败时不缓存，避免一次短暂故障在缓存有效期内持续影响该查询
+        if self._is_cacheable_result(camel_llm_result, api_intent_result, tiers_complete):
+            self._cache_llm_result(session_id, user_input_hash, final_result)
+        else:
+            self.logger.warning(f"Session {session_id}: 意图识别分支未全部完成，本次意图不写入缓存。")
+
+        # LLM/API 高置信度识别出的意图作为标注样本，下次相似查询可由向量分类直接命中；
+        # 阈值高于 llm_confidence_threshold，避免把勉强可用的结果固化进质心
+        if self.intent_classifier and final_result.intent != "unrecognized_intent" \
+                and final_result.confidence >= config.HYPER_PARAMS["intent"]["embedding_learn_threshold"]:
+            try:
+                self.intent_classifier.learn(cleaned_text, final_result.intent)
+            except Exception as e:
+                self.logger.warning(f"Session {session_id}: 更新向量意图分类样本失败: {e}")
 
         return final_result
\ No newline at end of file
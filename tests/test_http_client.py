@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+
+import pytest
+import requests
+
+from infrastructure import http_client
+from infrastructure.http_client import HttpClient
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+        self.sleeps = []
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+class FakeResponse:
+    def __init__(self, status_code, headers=None):
+        self.status_code = status_code
+        self.headers = headers or {}
+
+    def close(self):
+        pass
+
+
+class FakeSession:
+    """每次请求耗时 cost 秒，按顺序返回 outcomes 中的响应或抛出其中的异常"""
+
+    def __init__(self, clock, outcomes, cost=1.0):
+        self.clock = clock
+        self.outcomes = list(outcomes)
+        self.cost = cost
+        self.timeouts = []
+
+    def request(self, method, url, timeout=None, **kwargs):
+        self.timeouts.append(timeout)
+        self.clock.now += self.cost
+        outcome = self.outcomes.pop(0) if len(self.outcomes) > 1 else self.outcomes[0]
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+
+def make_client(monkeypatch, outcomes, max_retries=10, backoff_factor=0.5, cost=1.0):
+    clock = FakeClock()
+    monkeypatch.setattr(http_client.time, "monotonic", clock)
+    monkeypatch.setattr(http_client.time, "sleep", clock.sleep)
+    client = HttpClient(
+        pool_connections=1, pool_maxsize=1, pool_block=False,
+        max_retries=max_retries, backoff_factor=backoff_factor, backoff_jitter=0.0,
+        connect_timeout=3.05, default_timeout=10.0
+    )
+    client.session = FakeSession(clock, outcomes, cost=cost)
+    return client, clock
+
+
+def test_connect_retries_stop_when_budget_is_used_up(monkeypatch):
+    client, clock = make_client(monkeypatch, [requests.exceptions.ConnectTimeout("down")])
+
+    with pytest.raises(requests.exceptions.Timeout) as excinfo:
+        client.post("http://api.test/x", timeout=4.0)
+
+    # t=1 失败退避 0.5s，t=2.5 失败退避 1s，t=4.5 失败后 2s 退避已超出预算
+    assert excinfo.type is requests.exceptions.Timeout
+    assert len(client.session.timeouts) == 3
+    assert clock.sleeps == [0.5, 1.0]
+    assert [t[1] for t in client.session.timeouts] == [4.0, 2.5, 0.5]
+
+
+def test_retryable_status_returns_last_response_when_budget_is_used_up(monkeypatch):
+    client, clock = make_client(monkeypatch, [FakeResponse(503)])
+
+    response = client.get("http://api.test/x", timeout=3.0)
+
+    assert response.status_code == 503
+    assert len(client.session.timeouts) == 2
+    assert clock.sleeps == [0.5]
+    assert clock.now - 1000.0 <= 3.0
+
+
+def test_retry_after_beyond_budget_is_not_waited(monkeypatch):
+    client, clock = make_client(monkeypatch, [FakeResponse(429, {"Retry-After": "30"})])
+
+    response = client.get("http://api.test/x", timeout=5.0)
+
+    assert response.status_code == 429
+    assert len(client.session.timeouts) == 1
+    assert clock.sleeps == []
+
+
+def test_retry_succeeds_within_budget(monkeypatch):
+    client, clock = make_client(monkeypatch, [FakeResponse(502), FakeResponse(200)])
+
+    assert client.get("http://api.test/x", timeout=5.0).status_code == 200
+    assert len(client.session.timeouts) == 2
+
+
+def test_read_timeout_is_not_retried(monkeypatch):
+    client, clock = make_client(monkeypatch, [requests.exceptions.ReadTimeout("slow")])
+
+    with pytest.raises(requests.exceptions.ReadTimeout):
+        client.get("http://api.test/x", timeout=10.0)
+    assert len(client.session.timeouts) == 1
+    assert clock.sleeps == []
@@ -0,0 +1,51 @@
+# -*- coding: utf-8 -*-
+
+from infrastructure.keyword_automaton import KeywordAutomaton, normalize_text, score_matches
+
+
+def test_find_all_reports_overlapping_matches():
+    automaton = KeywordAutomaton([("he", 1), ("she", 2), ("his", 3), ("hers", 4)])
+    found = {(m["keyword"], m["start"], m["end"]) for m in automaton.find_all("ushers")}
+    assert found == {("she", 1, 4), ("he", 2, 4), ("hers", 2, 6)}
+
+
+def test_matching_ignores_case_and_width():
+    automaton = KeywordAutomaton([("ABC", "x"), ("体测", "y")])
+    assert normalize_text("ＡＢＣ") == "abc"
+    assert [m["payload"] for m in automaton.find_all("ａｂｃ和体测")] == ["x", "y"]
+
+
+def test_find_first_returns_earliest_ending_keyword():
+    automaton = KeywordAutomaton([("违禁词", None), ("禁", None)])
+    assert automaton.find_first("这是违禁词") == "禁"
+    assert automaton.find_first("正常内容") is None
+
+
+def test_blank_keywords_are_ignored():
+    automaton = KeywordAutomaton([("", 1), ("  ", 2), ("ok", 3)])
+    assert len(automaton) == 1
+
+
+def test_score_matches_picks_dominant_payload():
+    automaton = KeywordAutomaton([("建议", "feedback"), ("反馈", "feedback"), ("建议", "health_advice")])
+    best, share, scores = score_matches(automaton.find_all("我有一个建议和反馈"))
+    assert best == "feedback"
+    assert scores == {"feedback": 4, "health_advice": 2}
+    assert share == 4 / 6
+
+
+def test_score_matches_counts_repeated_keyword_once():
+    automaton = KeywordAutomaton([("预约", "facility_query")])
+    _, share, scores = score_matches(automaton.find_all("预约预约预约"))
+    assert scores == {"facility_query": 2}
+    assert share == 1.0
+
+
+def test_score_matches_rejects_tied_top_score():
+    automaton = KeywordAutomaton([("建议", "feedback"), ("建议", "health_advice"), ("健身", "health_advice")])
+    assert score_matches(automaton.find_all("我有一个建议")) is None
+    assert score_matches(automaton.find_all("健身建议"))[0] == "health_advice"
+
+
+def test_score_matches_without_matches():
+    assert score_matches([]) is None
@@ -0,0 +1,40 @@
+# -*- coding: utf-8 -*-
+
+import pytest
+
+from infrastructure.rank_fusion import reciprocal_rank_fusion
+
+
+def doc(doc_id, **metadata):
+    return {"id": doc_id, "content": f"内容{doc_id}", "metadata": metadata}
+
+
+def test_documents_in_both_lists_rank_first():
+    vector = [doc("a", similarity=0.9), doc("b", similarity=0.8)]
+    keyword = [doc("b", bm25_score=3.2), doc("c", bm25_score=1.0)]
+    fused = reciprocal_rank_fusion([vector, keyword], top_k=3, rrf_k=60)
+
+    assert [d["id"] for d in fused] == ["b", "a", "c"]
+    assert fused[0]["metadata"]["rrf_score"] == pytest.approx(1 / 62 + 1 / 61)
+    assert fused[1]["metadata"]["rrf_score"] == pytest.approx(1 / 61)
+
+
+def test_metadata_is_merged_across_lists():
+    fused = reciprocal_rank_fusion(
+        [[doc("a", source="x.pdf", similarity=0.7)], [doc("a", source="x.pdf", bm25_score=2.0)]],
+        top_k=5, rrf_k=60
+    )
+    assert len(fused) == 1
+    assert fused[0]["metadata"]["similarity"] == 0.7
+    assert fused[0]["metadata"]["bm25_score"] == 2.0
+    assert "rrf_score" not in fused[0]
+
+
+def test_top_k_limits_results():
+    ranked = [doc(str(i)) for i in range(10)]
+    fused = reciprocal_rank_fusion([ranked], top_k=3, rrf_k=60)
+    assert [d["id"] for d in fused] == ["0", "1", "2"]
+
+
+def test_empty_input():
+    assert reciprocal_rank_fusion([[], []], top_k=3) == []
@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from infrastructure.request_coalescer import RequestCoalescer
+
+
+def run_concurrently(coalescer, key, func, callers=5):
+    """owner 在 func 内阻塞，直到其余调用方都已挂到同一个请求上才放行"""
+    release = threading.Event()
+    upstream_calls = []
+
+    def upstream():
+        upstream_calls.append(1)
+        release.wait(timeout=5)
+        return func()
+
+    def call():
+        try:
+            return coalescer.run(key, upstream)
+        except Exception as e:
+            return e
+
+    with ThreadPoolExecutor(max_workers=callers) as pool:
+        futures = [pool.submit(call) for _ in range(callers)]
+        deadline = time.monotonic() + 5
+        while coalescer.metrics()["coalesced"] < callers - 1 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        release.set()
+        results = [f.result(timeout=5) for f in futures]
+    return results, len(upstream_calls)
+
+
+def test_concurrent_identical_requests_call_upstream_once():
+    coalescer = RequestCoalescer()
+    results, upstream_calls = run_concurrently(coalescer, "same", lambda: "回复")
+
+    assert upstream_calls == 1
+    assert results == ["回复"] * 5
+    assert coalescer.metrics() == {"calls": 5, "executed": 1, "coalesced": 4, "in_flight": 0}
+
+
+def test_error_reaches_every_waiter():
+    coalescer = RequestCoalescer()
+    error = RuntimeError("上游失败")
+
+    def fail():
+        raise error
+
+    results, upstream_calls = run_concurrently(coalescer, "same", fail)
+
+    assert upstream_calls == 1
+    assert all(result is error for result in results)
+    assert coalescer.metrics()["in_flight"] == 0
+
+
+def test_key_is_released_after_completion():
+    coalescer = RequestCoalescer()
+
+    def fail():
+        raise ValueError("boom")
+
+    with pytest.raises(ValueError):
+        coalescer.run("k", fail)
+    assert coalescer.run("k", lambda: "ok") == "ok"
+    assert coalescer.metrics()["executed"] == 2
+
+
+def test_different_keys_are_not_coalesced():
+    coalescer = RequestCoalescer()
+    assert coalescer.run("a", lambda: 1) == 1
+    assert coalescer.run("b", lambda: 2) == 2
+    assert coalescer.metrics()["coalesced"] == 0
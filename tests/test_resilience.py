@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+
+from infrastructure import resilience
+from infrastructure.resilience import CircuitBreaker, LatencyTracker
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def make_breaker(monkeypatch, threshold=3, recovery=10.0):
+    clock = FakeClock()
+    monkeypatch.setattr(resilience.time, "monotonic", clock)
+    return CircuitBreaker("test", failure_threshold=threshold, recovery_timeout=recovery), clock
+
+
+def test_breaker_opens_after_consecutive_failures(monkeypatch):
+    breaker, _ = make_breaker(monkeypatch)
+    for _ in range(2):
+        breaker.record_failure()
+    assert breaker.state == CircuitBreaker.CLOSED
+    assert breaker.allow_request()
+
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    assert not breaker.allow_request()
+
+
+def test_success_resets_failure_count(monkeypatch):
+    breaker, _ = make_breaker(monkeypatch)
+    breaker.record_failure()
+    breaker.record_failure()
+    breaker.record_success()
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+def test_half_open_allows_single_probe(monkeypatch):
+    breaker, clock = make_breaker(monkeypatch, threshold=1)
+    breaker.record_failure()
+    clock.now += 10.0
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    assert breaker.allow_request()
+    assert not breaker.allow_request()
+
+    breaker.record_success()
+    assert breaker.state == CircuitBreaker.CLOSED
+    assert breaker.allow_request()
+
+
+def test_failed_probe_reopens(monkeypatch):
+    breaker, clock = make_breaker(monkeypatch, threshold=1)
+    breaker.record_failure()
+    clock.now += 10.0
+    assert breaker.allow_request()
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    assert not breaker.allow_request()
+
+
+def test_latency_percentiles():
+    tracker = LatencyTracker(window=200)
+    assert tracker.percentile(95) is None
+    for i in range(1, 101):
+        tracker.record(i / 100)
+    assert len(tracker) == 100
+    assert tracker.percentile(50) == 0.5
+    assert tracker.percentile(95) == 0.95
+    assert tracker.snapshot() == {"samples": 100, "p50": 0.5, "p95": 0.95}
+
+
+def test_latency_window_drops_old_samples():
+    tracker = LatencyTracker(window=3)
+    for seconds in (10.0, 1.0, 2.0, 3.0):
+        tracker.record(seconds)
+    assert len(tracker) == 3
+    assert tracker.percentile(100) == 3.0
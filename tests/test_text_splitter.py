@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+
+from infrastructure.text_splitter import split_sentences, split_text
+
+
+def test_split_sentences_keeps_punctuation():
+    assert split_sentences("第一句。第二句！Third?") == ["第一句。", "第二句！", "Third?"]
+
+
+def test_empty_text_yields_nothing():
+    assert list(split_text("", 10, 2)) == []
+    assert list(split_text("   \n  ", 10, 2)) == []
+
+
+def test_short_text_is_single_chunk():
+    assert list(split_text("  你好。世界。  ", 50, 5)) == [(2, 8, "你好。世界。")]
+
+
+def test_offsets_match_stripped_chunks():
+    text = "  第一句话。" + "长" * 30 + "。 短句。\n结尾  "
+    chunks = list(split_text(text, 12, 4))
+    assert len(chunks) > 1
+    for start, end, chunk in chunks:
+        assert text[start:end] == chunk
+        assert chunk == chunk.strip()
+        assert len(chunk) <= 12
+
+
+def test_chunks_cover_the_text():
+    text = "".join(f"第{i}句内容比较长一些。" for i in range(20))
+    chunks = list(split_text(text, 30, 5))
+    assert chunks[0][0] == 0
+    assert chunks[-1][1] == len(text)
+    for (_, prev_end, _), (start, _, _) in zip(chunks, chunks[1:]):
+        assert start <= prev_end
+
+
+def test_hard_cut_pieces_keep_overlap():
+    text = "x" * 25
+    chunks = list(split_text(text, 10, 3))
+    assert all(len(chunk) <= 10 for _, _, chunk in chunks)
+    for (_, prev_end, _), (start, _, _) in zip(chunks, chunks[1:]):
+        assert prev_end - start == 3
+    assert chunks[-1][1] == len(text)
+
+
+def test_overlap_is_capped_at_half_chunk():
+    chunks = list(split_text("a" * 40, 10, 50))
+    for (_, prev_end, _), (start, _, _) in zip(chunks, chunks[1:]):
+        assert prev_end - start <= 5
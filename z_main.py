@@ -8,6 +8,8 @@ from modules.ans_generator import GenerationInput, ResultGenerator
 from modules.feedback_handler import FeedbackData, FeedbackHandler
 from config.prompt_utils import prompt_loader
 from infrastructure.message_broker import MessageBroker
+from infrastructure.pipeline_executor import PipelineExecutor, PipelineQueueFull
+from infrastructure.llm_gateway import get_llm_gateway
 from infrastructure.shared_schemas import RetrievalRequest, IntentExtractionResult, RetrievalResult
 from knowledge_base.loader_RAG import KnowledgeLoader
 import os
@@ -16,11 +18,11 @@ import time
 import uuid
 import json
 import nltk
+import queue
 import threading
 from threading import Lock
 import logging
 from datetime import datetime
-from queue import Queue
 import redis
 from config.settings import config, Env
 from typing import Dict, Any, Union, Optional
@@ -34,11 +36,13 @@ app = Flask(__name__)
 
 
 # 创建连接池时指定正确的主机和端口
-config.redis_pool = redis.ConnectionPool(
+# 连接池由流水线、流式连接、检索进程等共享，连接用尽时排队等待而不是直接报错
+config.redis_pool = redis.BlockingConnectionPool(
     host='localhost',  # Redis 服务器地址
     port=6379,         # Redis 服务器端口
     db=0,              # 使用的数据库编号
-    max_connections=10 # 最大连接数
+    max_connections=config.REDIS_MAX_CONNECTIONS, # 最大连接数
+    timeout=config.REDIS_POOL_TIMEOUT             # 等待空闲连接的最长时间(秒)
 )
 
 logging.basicConfig(
@@ -73,8 +77,6 @@ def check_redis():
 def check_kb():
     return os.path.exists(config.KNOWLEDGE_BASE_PATH)
 
-# 为处理异步任务创建线程和队列
-task_queue = Queue()
 # 存储每个会话的未来结果的字典
 session_results: Dict[str, Any] = {}
 # 用于保护对 session_results 的访问
@@ -109,8 +111,8 @@ def init_nltk():
 def init_system():
     knowledge_loader = KnowledgeLoader()
     
-    # 显式加载知识库（如果 __init__ 没有自动加载）
-    if not hasattr(knowledge_loader, 'documents') or len(knowledge_loader.documents) == 0:
+    # 显式加载知识库（如果 __init__ 没有自动加载）；增量加载时 documents 只包含本次变化的文件，以入库清单为准
+    if not knowledge_loader.manifest:
         knowledge_loader._load_all_knowledge_files()
     
     return knowledge_loader
@@ -123,56 +125,18 @@ def init_components():
 
     broker = MessageBroker()
 
-    # 【修改】直接在这里初始化 ChatAgent，替代 create_sports_agent 函数的调用
-    logger.info("初始化意图识别的 LLM 代理...")
-    model_config = config.MODEL_CONFIGS["intent"]
-    try:
-        # 使用 ModelFactory.create，严格按照您提供的样例参数
-        qwen_model = ModelFactory.create(
-            model_type=model_config["model_name"], # 从 model_config 获取
-            model_platform=ModelPlatformType.OPENAI_COMPATIBLE_MODEL, # 按照样例使用 OPENAI_COMPATIBLE_MODEL
-            api_key=config.DASHSCOPE_API_KEY, # 从 config 获取
-            url=config.DASHSCOPE_BASE_URL,    # 从 config 获取
-            model_config_dict=QwenConfig(
-                temperature=model_config.get("temperature", 0.7),
-                max_tokens=model_config.get("max_tokens", 512),
-                top_p=model_config.get("top_p", 0.3),
-                stream=True
-            ).as_dict() # 转换为字典
-        )
-        logger.info(f"Camel ChatAgent (意图识别) 初始化成功，模型: {model_config['model_name']}")
-
-        # 创建系统消息，严格按照样例格式
-        system_message_content = "你是一个专业的意图识别系统。" # 您样例中的 system_message_content
-        system_message = BaseMessage(
-            role_name="Intent Assistant", # 可以自定义一个合适的角色名
-            role_type=RoleType.ASSISTANT,
-            content=system_message_content, 
-            meta_dict={ # 按照样例添加 meta_dict
-                "module": "main_init_intent_agent",
-                "intent": "intent_detection", # 表示此agent用于意图检测
-                "timestamp": datetime.now().isoformat()
-            }
-        )
-
-        # 创建 ChatAgent，严格按照样例格式
-        sports_agent = ChatAgent(
-            system_message=system_message,
-            model=qwen_model
-        )
-
-    except Exception as e:
-        logger.error(f"初始化 Camel ChatAgent 失败: {e}")
-        raise
-
-    extractor = IntentExtractor(sports_agent) # 将初始化好的 sports_agent 传递给 IntentExtractor
+    # 先加载知识库，意图识别复用其中已加载的嵌入模型做本地向量分类
     knowledge_loader = init_system()
+    extractor = IntentExtractor(embedder=knowledge_loader) # 意图识别的LLM调用经由共享网关，无需单独创建代理
     retriever_agent = SportsRetrievalAgent(knowledge_loader)
     
-    retrieval_broker = RetrievalBroker(knowledge_loader)
-    retrieval_thread = threading.Thread(target=retrieval_broker.start_listening, daemon=True)
-    retrieval_thread.start()
-    logger.info("检索代理监听线程已启动。")
+    if config.RETRIEVAL_EMBEDDED_BROKER:
+        retrieval_broker = RetrievalBroker(knowledge_loader)
+        retrieval_thread = threading.Thread(target=retrieval_broker.start_listening, daemon=True)
+        retrieval_thread.start()
+        logger.info("检索代理监听线程已启动。")
+    else:
+        logger.info("未启动内置检索代理，检索请求由独立的 RetrievalBroker 进程处理。")
 
     generator = ResultGenerator(
         config_loader=config,
@@ -186,7 +150,8 @@ def init_components():
         config_loader=config,          
         prompt_loader=prompt_loader,    
         logger=logging.getLogger('FeedbackHandler'), 
-        redis_client=redis_conn         
+        redis_client=redis_conn,
+        generator=generator             # 共用同一个生成器，不再重复创建模型代理
     )
 
     return broker, extractor, retriever_agent, generator, feedback_handler
@@ -199,94 +164,123 @@ except Exception as e:
     logger.critical(f"组件初始化失败: {e}", exc_info=True)
     # sys.exit(1) # 退出应用如果初始化失败
 
-# 工作线程函数
-def worker():
-    while True:
-        try:
-            session_id, user_input = task_queue.get()
-            logger.info(f"Session {session_id}: 工作线程开始处理用户请求。")
-            
-            # 1. 意图识别
-            logger.info(f"会话 {session_id}: 进行意图识别...")
-            intent_result: IntentExtractionResult = intent_extractor.extract_intent(session_id, user_input)
-            logger.info(f"会话 {session_id}: 意图识别完成，结果: {intent_result.intent}")
-            
-            retrieval_request = RetrievalRequest(
-                    session_id=session_id,
-                    user_query=user_input,
-                    intent=intent_result.intent,
-                    entities=intent_result.entities,
-                    original_query=user_input,
-                    context={"user_query": user_input}, # 传递用户原始查询作为上下文
-                    use_web=config.WEB_SEARCH_ENABLED # 是否启用网络搜索
-                )
-            broker.publish_retrieval_request(retrieval_request)
+def retrieve_via_broker(session_id: str, user_input: str, intent_result: IntentExtractionResult) -> RetrievalResult:
+    """经由 Redis Stream 把检索请求交给 RetrievalBroker 并等待结果，发布失败或超时时返回错误结果"""
+    retrieval_request = RetrievalRequest(
+            session_id=session_id,
+            user_query=user_input,
+            intent=intent_result.intent,
+            entities=intent_result.entities,
+            original_query=user_input,
+            context={"user_query": user_input}, # 传递用户原始查询作为上下文
+            use_web=config.WEB_SEARCH_ENABLED # 是否启用网络搜索
+        )
+
+    retrieved_data: Optional[RetrievalResult] = None
+    error_message = "检索超时，未能获取到相关信息。"
+    with pipeline.stage("retrieval"):
+        # 发布失败时没有检索进程会处理该请求，直接降级而不是空等到超时
+        if broker.publish_retrieval_request(retrieval_request):
             logger.info(f"会话 {session_id}: 已发布检索请求。等待结果...")
 
-                # 等待检索结果，使用新的超时配置
-            retrieved_data: Optional[RetrievalResult] = broker.listen_for_retrieval_result(
+            # 等待检索结果，使用新的超时配置
+            retrieved_data = broker.listen_for_retrieval_result(
                     session_id, 
                     timeout=config.HYPER_PARAMS["retrieval"]["timeout"]
                 )
-
             if not retrieved_data:
                 logger.warning(f"会话 {session_id}: 等待检索结果超时。将使用默认错误消息。")
-                retrieved_data = RetrievalResult(
-                    session_id=session_id,
-                    user_query=user_input,
-                    intent=intent_result.intent,
-                    entities=intent_result.entities,
-                    original_query=user_input,
-                    data={
-                        "status": "error",
-                        "message": "检索超时，未能获取到相关信息。",
-                        "fallback": "请稍后重试或联系管理员"
-                    },
-                    media_assets={},
-                    sources=[],
-                    context={}
-                )
-                    # 缓存一个超时结果，避免前端一直等待
-                broker.cache_result(session_id, retrieved_data) 
-                    
-            logger.info(f"会话 {session_id}: 检索完成，数据摘要: {str(retrieved_data.data)[:100]}...")
+        else:
+            logger.error(f"会话 {session_id}: 发布检索请求失败。将使用默认错误消息。")
+            error_message = "检索服务暂不可用，未能获取到相关信息。"
+
+    if not retrieved_data:
+        retrieved_data = RetrievalResult(
+            session_id=session_id,
+            user_query=user_input,
+            intent=intent_result.intent,
+            entities=intent_result.entities,
+            original_query=user_input,
+            data={
+                "status": "error",
+                "message": error_message,
+                "fallback": "请稍后重试或联系管理员"
+            },
+            media_assets=[],
+            sources=[],
+            context={}
+        )
+    return retrieved_data
 
+# 流水线任务：意图识别 -> 检索 -> 生成，由 PipelineExecutor 的工作线程执行
+def run_pipeline(session_id: str, user_input: str):
+    try:
+        logger.info(f"Session {session_id}: 工作线程开始处理用户请求。")
+        broker.update_session_status(session_id, "processing", stage="intent")
 
-            # 3. 答案生成
-            logger.info(f"会话 {session_id}: 开始生成答案...")
-            # 确保 create_generation_input 传递了所有必要参数
-            generation_input = create_generation_input(
-                session_id, 
-                intent_result.model_dump(),
-                retrieved_data.model_dump()
-            )
-                
-            # 【重要修复】直接调用生成器，而不是通过消息队列
+        # 1. 意图识别
+        logger.info(f"会话 {session_id}: 进行意图识别...")
+        with pipeline.stage("intent"):
+            intent_result: IntentExtractionResult = intent_extractor.extract_intent(session_id, user_input)
+        logger.info(f"会话 {session_id}: 意图识别完成，结果: {intent_result.intent}")
+        broker.update_session_status(
+            session_id, "partial",
+            stage="retrieval",
+            intent=intent_result.intent,
+            entities=intent_result.entities
+        )
+
+        # 2. 信息检索
+        retrieved_data = retrieve_via_broker(session_id, user_input, intent_result)
+        logger.info(f"会话 {session_id}: 检索完成，数据摘要: {str(retrieved_data.data)[:100]}...")
+        broker.update_session_status(
+            session_id, "partial",
+            stage="generation",
+            sources=retrieved_data.sources,
+            retrieval_status=retrieved_data.data.get("status", "success")
+        )
+
+
+        # 3. 答案生成
+        logger.info(f"会话 {session_id}: 开始生成答案...")
+        # 确保 create_generation_input 传递了所有必要参数
+        generation_input = create_generation_input(
+            session_id, 
+            intent_result.model_dump(),
+            retrieved_data.model_dump()
+        )
+            
+        # 【重要修复】直接调用生成器，而不是通过消息队列
+        with pipeline.stage("generation"):
             final_output = generator.generate_answer(generation_input)
-                
-            logger.info(f"会话 {session_id}: 答案生成完成。")
+            
+        logger.info(f"会话 {session_id}: 答案生成完成。")
 
-            # 4. 缓存最终结果
-            broker.cache_result(session_id, final_output)
-            logger.info(f"会话 {session_id}: 最终结果已缓存。")
+        # 4. 缓存最终结果
+        broker.cache_result(session_id, final_output)
+        broker.update_session_status(session_id, "done", stage="done")
+        logger.info(f"会话 {session_id}: 最终结果已缓存。")
+        return final_output
 
-        except Exception as e:
-            logger.error(f"会话 {session_id}: 处理请求时发生错误: {e}", exc_info=True)
-            # 确保即使出错也有一个结果返回给前端
-            error_result = {
-                "session_id": session_id,
-                "answer": f"抱歉，处理您的请求时发生了内部错误: {e}",
-                "intent": "error",
-                "entities": {},
-                "media": [],
-                "feedback_token": str(uuid.uuid4()),
-                "sources": [],
-                "related_queries": []
-            }
-            broker.cache_result(session_id, error_result)
-        finally:
-            task_queue.task_done()
-            logger.info(f"会话 {session_id}: 任务处理完成。")
+    except Exception as e:
+        logger.error(f"会话 {session_id}: 处理请求时发生错误: {e}", exc_info=True)
+        # 确保即使出错也有一个结果返回给前端
+        error_result = {
+            "session_id": session_id,
+            "answer": f"抱歉，处理您的请求时发生了内部错误: {e}",
+            "intent": "error",
+            "entities": {},
+            "media": [],
+            "feedback_token": str(uuid.uuid4()),
+            "sources": [],
+            "related_queries": [],
+            "status": "error"
+        }
+        broker.cache_result(session_id, error_result)
+        broker.update_session_status(session_id, "error", stage="done", error=str(e))
+        return error_result
+    finally:
+        logger.info(f"会话 {session_id}: 任务处理完成。")
 
 # 核心映射，从用户的query生成LLM回答
 def process_user_query(user_query: str, session_id: str = None) -> dict:
@@ -336,10 +330,15 @@ def process_user_query(user_query: str, session_id: str = None) -> dict:
     
     return result
 
-# 启动工作线程
-worker_thread = threading.Thread(target=worker, daemon=True)
-worker_thread.start()
-logger.info("后台工作线程已启动。")
+# 启动流水线工作线程池
+pipeline = PipelineExecutor(
+    handler=run_pipeline,
+    workers=config.PIPELINE_WORKERS,
+    queue_size=config.PIPELINE_QUEUE_SIZE,
+    stage_limits=config.PIPELINE_STAGE_LIMITS
+)
+pipeline.start()
+logger.info("后台流水线工作线程池已启动。")
 
 @app.route('/query', methods=['POST'])
 def handle_query():
@@ -348,17 +347,25 @@ def handle_query():
         if not user_input:
             return jsonify({"error": "Empty query"}), 400
         
-        # 调用主处理函数
-        result = process_user_query(user_input)
-        
-        # 缓存结果（原逻辑保持不变）
-        broker.cache_result(result["session_id"], result)
-        
+        session_id = str(uuid.uuid4())
+        # 先写入排队状态，避免与工作线程的进度更新产生覆盖
+        broker.update_session_status(session_id, "queued", stage="queued")
+        try:
+            pipeline.submit(session_id, user_input)
+        except PipelineQueueFull:
+            logger.warning(f"会话 {session_id}: 处理队列已满，拒绝请求。")
+            broker.update_session_status(session_id, "rejected", stage="done")
+            return jsonify({
+                "error": "服务繁忙，请稍后重试",
+                "intent": "error"
+            }), 429
+
+        # 立即返回，结果由 run_pipeline 异步写入缓存，前端轮询 result_url
         return jsonify({
-            "status": "success",
-            "session_id": result["session_id"],
-            "result_url": f"/results/{result['session_id']}"
-        })
+            "status": "accepted",
+            "session_id": session_id,
+            "result_url": f"/results/{session_id}"
+        }), 202
     except Exception as e:
         logger.error(f"处理失败: {e}", exc_info=True)
         return jsonify({
@@ -367,10 +374,143 @@ def handle_query():
         }), 500
 
 
+def _format_sse(event: str, data: Any) -> str:
+    """格式化一条 server-sent event"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False, default=str)}\n\n"
+
+
+# /query/stream 的连接数上限：流式连接不经过 PipelineExecutor 的队列，单独限流
+stream_slots = threading.BoundedSemaphore(config.STREAM_MAX_CONCURRENT)
+
+
+def _produce_answer_events(generation_input: GenerationInput, events: "queue.Queue"):
+    """
+    在后台线程中占用生成阶段的并发名额，把流式生成的事件放入队列。
+    LLM 输出结束即释放名额，不受客户端读取速度影响；客户端中途断开时结果仍会写入缓存。队列以 None 结束。
+    """
+    session_id = generation_input.session_id
+    try:
+        with pipeline.stage("generation"):
+            for event, payload in generator.stream_answer(generation_input):
+                if event == "done":
+                    broker.cache_result(session_id, payload)
+                    broker.update_session_status(session_id, "done", stage="done")
+                events.put((event, payload))
+    except Exception as e:
+        broker.update_session_status(session_id, "error", stage="done", error=str(e))
+        events.put(("error", e))
+    finally:
+        events.put(None)
+
+
+@app.route('/query/stream', methods=['GET', 'POST'])
+def handle_query_stream():
+    """
+    SSE 流式接口：依次推送 session、intent、retrieval、token（逐段答案）、done 事件。
+    GET 方式通过 ?query= 传参，便于浏览器 EventSource 直接使用。
+    同时保持的连接数受 STREAM_MAX_CONCURRENT 限制，超出时返回 429；检索与 /query 一样经由 RetrievalBroker。
+    """
+    if request.method == 'POST':
+        user_input = (request.json or {}).get("query", "").strip()
+    else:
+        user_input = request.args.get("query", "").strip()
+    if not user_input:
+        return jsonify({"error": "Empty query"}), 400
+
+    session_id = str(uuid.uuid4())
+    if not stream_slots.acquire(blocking=False):
+        logger.warning(f"会话 {session_id}: 流式连接数已达上限，拒绝请求。")
+        return jsonify({
+            "error": "服务繁忙，请稍后重试",
+            "intent": "error"
+        }), 429
+
+    def event_stream():
+        yield _format_sse("session", {"session_id": session_id, "result_url": f"/results/{session_id}"})
+        try:
+            broker.update_session_status(session_id, "processing", stage="intent")
+            with pipeline.stage("intent"):
+                intent_result = intent_extractor.extract_intent(session_id, user_input)
+            yield _format_sse("intent", {
+                "intent": intent_result.intent,
+                "entities": intent_result.entities,
+                "confidence": intent_result.confidence
+            })
+
+            retrieved_data = retrieve_via_broker(session_id, user_input, intent_result)
+            yield _format_sse("retrieval", {
+                "sources": retrieved_data.sources,
+                "media_count": len(retrieved_data.media_assets)
+            })
+
+            generation_input = create_generation_input(
+                session_id,
+                intent_result.model_dump(),
+                retrieved_data.model_dump()
+            )
+            events: "queue.Queue" = queue.Queue()
+            threading.Thread(
+                target=_produce_answer_events,
+                args=(generation_input, events),
+                name=f"stream-generation-{session_id[:8]}",
+                daemon=True
+            ).start()
+            while (item := events.get()) is not None:
+                event, payload = item
+                if event == "token":
+                    yield _format_sse("token", {"delta": payload})
+                elif event == "error":
+                    raise payload
+                else:
+                    yield _format_sse("done", payload.model_dump())
+
+        except Exception as e:
+            logger.error(f"会话 {session_id}: 流式处理失败: {e}", exc_info=True)
+            broker.update_session_status(session_id, "error", stage="done", error=str(e))
+            yield _format_sse("error", {"session_id": session_id, "error": str(e)})
+
+    try:
+        response = Response(
+            stream_with_context(event_stream()),
+            mimetype='text/event-stream',
+            headers={
+                "Cache-Control": "no-cache",
+                "X-Accel-Buffering": "no"  # 关闭反向代理缓冲，保证逐段推送
+            }
+        )
+    except Exception:
+        stream_slots.release()
+        raise
+    # 响应结束或客户端断开时释放连接名额（生成器未开始迭代时同样会调用）
+    response.call_on_close(stream_slots.release)
+    return response
+
+
+@app.route('/metrics', methods=['GET'])
+def get_metrics():
+    """运行指标：流水线队列深度、处理中任务数及各阶段并发，查询向量缓存命中情况，外部API各端点耗时"""
+    return jsonify({
+        "pipeline": pipeline.metrics(),
+        "query_embedding_cache": retriever_agent.knowledge_loader.query_cache_info(),
+        "external_apis": broker.get_retrieval_broker_stats(), # 由各检索进程上报，按实例分组
+        "llm_gateway": get_llm_gateway().metrics()
+    })
+
+
 @app.route('/results/<session_id>')
 def get_results(session_id: str):
+    """
+    查询异步处理结果：
+    - done/error: 返回最终结果 (200)
+    - queued/processing/partial: 返回当前阶段及已得到的中间结果 (202)
+    """
     if result := broker.get_cached_result(session_id):
+        result.setdefault("status", "done")
         return jsonify(result)
+    if status := broker.get_session_status(session_id):
+        if status.get("status") in ("queued", "processing", "partial"):
+            return jsonify(status), 202
+        return jsonify(status)
     return jsonify({"status": "pending"}), 202
 
 def create_generation_input(session_id: str, intent_data: Dict[str, Any], retrieved_data: Dict[str, Any]) -> GenerationInput:
@@ -379,6 +519,10 @@ def create_generation_input(session_id: str, intent_data: Dict[str, Any], retrie
     data = retrieved_data.get("data", {})
     context = retrieved_data.get("context", {})
     user_query = context.get("user_query", "未知用户查询")
+    media_assets = retrieved_data.get("media_assets", {})
+    if isinstance(media_assets, list):
+        # RetrievalResult 中媒体为列表，生成模块需要字典
+        media_assets = {f"asset_{i}": asset for i, asset in enumerate(media_assets)}
 
     # 根据意图类型注入上下文
     if intent == "facility_query" and data.get("facility_info"):
@@ -414,8 +558,8 @@ def create_generation_input(session_id: str, intent_data: Dict[str, Any], retrie
         user_query=user_query,
         intent=intent,
         entities=entities,
-        data=data,
-        media_assets=retrieved_data.get("media_assets", {}),
+        retrieved_data=data,
+        media_assets=media_assets,
         sources=retrieved_data.get("sources", []),
         context=context,
         height=entities.get("height"),